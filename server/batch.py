@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional, TYPE_CHECKING
+
+from .models import LessonRequest, BatchLessonResult, BatchStats
+
+if TYPE_CHECKING:
+    from .services import LessonGenerationService
+
+logger = logging.getLogger(__name__)
+
+
+class LessonBatch:
+    """A running batch of lesson generations, consumed as an async iterator.
+    
+    Lessons run with at most `concurrency` in flight and each finished lesson is yielded
+    as soon as it completes, in completion order. A failed lesson is yielded with its
+    error and does not abort the rest of the batch.
+    """
+    
+    def __init__(self, service: "LessonGenerationService", requests: List[LessonRequest], concurrency: int = 4, session_ids: Optional[List[int]] = None):
+        """Prepare the batch. Session ids default to fresh ids allocated by the service."""
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if session_ids is not None and len(session_ids) != len(requests):
+            raise ValueError("session_ids must match the number of requests")
+        self.service = service
+        self.requests = list(requests)
+        self.concurrency = concurrency
+        self.session_ids = list(session_ids) if session_ids is not None else service.allocate_session_ids(len(self.requests))
+        self._stats = BatchStats(total=len(self.requests))
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+    
+    async def _run_one(self, index: int, semaphore: asyncio.Semaphore, results: asyncio.Queue):
+        """Generate a single lesson under the concurrency limit and queue its result."""
+        request = self.requests[index]
+        session_id = self.session_ids[index]
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                lesson = await self.service.generate_lesson(request, session_id)
+                result = BatchLessonResult(index=index, session_id=session_id, request=request, lesson=lesson)
+            except Exception as e:
+                logger.error(f"Batch lesson {index} ({request.topic}) failed: {str(e)}")
+                result = BatchLessonResult(index=index, session_id=session_id, request=request, error=str(e))
+            except BaseException as e:
+                # Cancellations and interrupts still count as a finished lesson, so the
+                # iterator never waits for a result that will not come.
+                logger.error(f"Batch lesson {index} ({request.topic}) was interrupted: {type(e).__name__}")
+                result = BatchLessonResult(index=index, session_id=session_id, request=request, error=str(e) or type(e).__name__)
+                result.elapsed_seconds = time.monotonic() - started
+                results.put_nowait(result)
+                raise
+            result.elapsed_seconds = time.monotonic() - started
+        await results.put(result)
+    
+    async def __aiter__(self):
+        """Run the batch and yield each BatchLessonResult as soon as it is finished."""
+        if self._started_at is not None:
+            raise RuntimeError("A LessonBatch can only be iterated once")
+        self._started_at = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: asyncio.Queue = asyncio.Queue()
+        tasks = [asyncio.ensure_future(self._run_one(index, semaphore, results)) for index in range(len(self.requests))]
+        try:
+            for _ in range(len(tasks)):
+                result = await results.get()
+                if result.error is None:
+                    self._stats.completed += 1
+                else:
+                    self._stats.failed += 1
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._finished_at = time.monotonic()
+    
+    def stats(self) -> BatchStats:
+        """Return aggregate progress and throughput (completed lessons per minute) so far."""
+        elapsed = 0.0
+        if self._started_at is not None:
+            end = self._finished_at if self._finished_at is not None else time.monotonic()
+            elapsed = end - self._started_at
+        return BatchStats(
+            total=self._stats.total,
+            completed=self._stats.completed,
+            failed=self._stats.failed,
+            elapsed_seconds=elapsed,
+            lessons_per_minute=self._stats.completed * 60.0 / elapsed if elapsed > 0 else 0.0
+        )
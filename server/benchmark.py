@@ -0,0 +1,191 @@
+"""Offline benchmark of the lesson generation pipeline against the fake LLM backend.
+
+Usage:
+    python -m server.benchmark --lessons 50 --concurrency 10 --output bench_results.json
+    python -m server.benchmark --baseline bench_results.json --max-regression 0.1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from .config import LessonServiceConfig
+from .fake_llm import FakeOpenAIClient, LatencyModel
+from .models import LessonRequest
+from .rate_limit import RateLimiter
+from .resilience import RetryPolicy
+from .services import LessonGenerationService
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("curriculum", "objectives", "content", "assessment", "compile", "review")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linear-interpolated q-quantile (0-1) of the values, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = q * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    """Return count, mean and p50/p95/p99 of a list of latencies in seconds."""
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+    }
+
+
+async def run_benchmark(
+    lessons: int = 20,
+    concurrency: int = 5,
+    latency_scale: float = 1.0,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    seed: int = 0,
+    review_mode: str = "inline"
+) -> Dict[str, Any]:
+    """Generate `lessons` lessons through the fake backend and return the benchmark report."""
+    latencies = {
+        "CurriculumExpert": LatencyModel(0.8 * latency_scale, 1.6 * latency_scale),
+        "ContentCreator": LatencyModel(2.0 * latency_scale, 4.0 * latency_scale),
+        "AssessmentAgent": LatencyModel(1.5 * latency_scale, 3.0 * latency_scale),
+        "QualityReviewAgent": LatencyModel(1.2 * latency_scale, 2.4 * latency_scale),
+    }
+    client = FakeOpenAIClient(latencies=latencies, error_rate=error_rate, rate_limit_rate=rate_limit_rate, seed=seed)
+    policy = RetryPolicy(base_delay=0.05 * latency_scale, max_delay=1.0)
+    service = LessonGenerationService(
+        "offline-benchmark",
+        rate_limiter=RateLimiter(requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9),
+        client=client,
+        retry_policies={name: policy for name in ("CurriculumExpert", "ContentCreator", "AssessmentAgent", "QualityReviewAgent")},
+        config=LessonServiceConfig(review_mode=review_mode)
+    )
+
+    requests = [
+        LessonRequest(subject="Mathematics", grade_level="Class 10", topic=f"Quadratic Equations {index}", subtopics=["Roots", "Discriminant"])
+        for index in range(lessons)
+    ]
+    end_to_end: List[float] = []
+    stage_timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    queue_waits: List[float] = []
+    overheads: List[float] = []
+    errors: List[str] = []
+    batch = service.generate_batch(requests, concurrency=concurrency)
+    async for result in batch:
+        if result.error is not None:
+            errors.append(result.error)
+            continue
+        end_to_end.append(result.elapsed_seconds)
+        trace = result.lesson.trace
+        stages = {stage.name: stage.wall_seconds for stage in trace.stages}
+        for name, seconds in stages.items():
+            stage_timings.setdefault(name, []).append(seconds)
+        queue_waits.extend(call.queue_wait_seconds for call in trace.calls)
+        # Time not spent on the critical path of agent calls: content and assessment start
+        # once the objectives have streamed, so curriculum overlaps them, then review (unless it runs in the background)
+        if all(stage in stages for stage in ("curriculum", "objectives", "content", "assessment")):
+            critical_path = max(stages["curriculum"], stages["objectives"] + max(stages["content"], stages["assessment"])) + stages.get("review", 0.0)
+            overheads.append(result.elapsed_seconds - critical_path)
+    stats = batch.stats()
+    await service.aclose()
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "config": {
+            "lessons": lessons,
+            "concurrency": concurrency,
+            "latency_scale": latency_scale,
+            "error_rate": error_rate,
+            "rate_limit_rate": rate_limit_rate,
+            "seed": seed,
+            "review_mode": review_mode,
+        },
+        "end_to_end": summarize(end_to_end),
+        "stages": {stage: summarize(timings) for stage, timings in stage_timings.items()},
+        "queue_wait": summarize(queue_waits),
+        "orchestration_overhead": summarize(overheads),
+        "throughput_lessons_per_minute": stats.lessons_per_minute,
+        "completed": stats.completed,
+        "failed": stats.failed,
+        "errors": errors[:10],
+        "llm_calls": dict(client.calls),
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Return descriptions of end-to-end percentiles or throughput that regressed beyond max_regression."""
+    regressions = []
+    for key in ("p50", "p95", "p99"):
+        current, previous = report["end_to_end"].get(key), baseline.get("end_to_end", {}).get(key)
+        if current is not None and previous and current > previous * (1 + max_regression):
+            regressions.append(f"end_to_end.{key}: {previous:.3f}s -> {current:.3f}s")
+    current, previous = report["throughput_lessons_per_minute"], baseline.get("throughput_lessons_per_minute")
+    if previous and current < previous * (1 - max_regression):
+        regressions.append(f"throughput: {previous:.1f} -> {current:.1f} lessons/min")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point; returns a non-zero exit code when a regression is detected."""
+    parser = argparse.ArgumentParser(description="Benchmark lesson generation against a fake LLM backend")
+    parser.add_argument("--lessons", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--latency-scale", type=float, default=0.1, help="multiplier on the default per-agent latencies")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--review-mode", choices=("inline", "background"), default="inline")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="previous results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    report = asyncio.run(run_benchmark(
+        lessons=args.lessons,
+        concurrency=args.concurrency,
+        latency_scale=args.latency_scale,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+        review_mode=args.review_mode
+    ))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    e2e = report["end_to_end"]
+    print(f"{report['completed']} lessons ({report['failed']} failed), {report['throughput_lessons_per_minute']:.1f} lessons/min")
+    if e2e["count"]:
+        print(f"end-to-end p50 {e2e['p50']:.3f}s  p95 {e2e['p95']:.3f}s  p99 {e2e['p99']:.3f}s")
+    print(f"results written to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import logging
+import math
+from collections import deque
+from typing import Dict, List, Optional
+
+from .rate_limit import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # fall back to the ~4 characters per token estimate
+    tiktoken = None
+
+# Context window sizes in tokens; unknown models are assumed to have the smallest
+CONTEXT_WINDOWS = {
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+
+def context_window(model: str) -> int:
+    """Context window of the model, matching dated variants (e.g. gpt-4o-2024-08-06) by prefix."""
+    for name in sorted(CONTEXT_WINDOWS, key=len, reverse=True):
+        if model == name or model.startswith(name + "-"):
+            return CONTEXT_WINDOWS[name]
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Count tokens locally with tiktoken when installed, otherwise estimate them."""
+    if tiktoken is not None:
+        try:
+            return len(tiktoken.encoding_for_model(model).encode(text))
+        except KeyError:
+            pass
+    return estimate_tokens(text)
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str) -> int:
+    """Tokens a list of chat messages occupies in the context window."""
+    return sum(count_tokens(message.get("content", ""), model) + MESSAGE_OVERHEAD_TOKENS for message in messages) + REPLY_PRIMING_TOKENS
+
+
+class PromptBudgetError(Exception):
+    """A prompt leaves no room in the model's context window for a completion."""
+
+
+class PromptBudget:
+    """Token plan for one call: prompt size, completion allowance and whether it risks overflowing."""
+
+    def __init__(self, prompt_tokens: int, max_tokens: int, context_window: int, overflow_risk: bool):
+        self.prompt_tokens = prompt_tokens
+        self.max_tokens = max_tokens
+        self.context_window = context_window
+        self.overflow_risk = overflow_risk
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.max_tokens
+
+
+class PromptBudgeter:
+    """Sets max_tokens per call from the completion sizes an agent has produced so far.
+
+    Until min_samples completions have been seen, calls get default_max_tokens. After
+    that they get the `quantile` of recent completion sizes times `headroom`, rounded up
+    to 64 tokens and never below min_max_tokens. A completion that used its whole
+    allowance was probably cut off, so it is recorded as twice its size to raise the next
+    allowance. Every allowance is clipped to what is left of the context window; prompts
+    that leave less than min_max_tokens for the completion are flagged as overflow risks
+    and prompts that leave nothing are rejected with PromptBudgetError.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        default_max_tokens: int = 4000,
+        min_max_tokens: int = 256,
+        headroom: float = 1.25,
+        quantile: float = 0.95,
+        window: int = 100,
+        min_samples: int = 5,
+        safety_margin: int = 64
+    ):
+        self.model = model
+        self.context_window = context_window(model)
+        self.default_max_tokens = default_max_tokens
+        self.min_max_tokens = min_max_tokens
+        self.headroom = headroom
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.safety_margin = safety_margin
+        self._completions: deque = deque(maxlen=window)
+
+    def learned_max_tokens(self) -> int:
+        """Completion allowance learned from history, ignoring the context window."""
+        if len(self._completions) < self.min_samples:
+            return self.default_max_tokens
+        ordered = sorted(self._completions)
+        typical = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+        return max(self.min_max_tokens, int(math.ceil(typical * self.headroom / 64.0)) * 64)
+
+    def plan(self, messages: List[Dict[str, str]]) -> PromptBudget:
+        """Count the prompt and choose max_tokens for a call with these messages."""
+        prompt_tokens = count_message_tokens(messages, self.model)
+        available = self.context_window - prompt_tokens - self.safety_margin
+        if available <= 0:
+            raise PromptBudgetError(f"Prompt of {prompt_tokens} tokens leaves no room for a completion in the {self.context_window}-token context window of {self.model}")
+        overflow_risk = available < self.min_max_tokens
+        max_tokens = min(self.learned_max_tokens(), available)
+        return PromptBudget(prompt_tokens, max_tokens, self.context_window, overflow_risk)
+
+    def shortfall(self, messages: List[Dict[str, str]]) -> int:
+        """Tokens the prompt has to lose for a completion of min_max_tokens to fit, or 0."""
+        prompt_tokens = count_message_tokens(messages, self.model)
+        return max(0, prompt_tokens + self.safety_margin + self.min_max_tokens - self.context_window)
+
+    def record_completion(self, completion_tokens: int, max_tokens: Optional[int] = None):
+        """Learn from a finished completion that was allowed max_tokens."""
+        truncated = max_tokens is not None and completion_tokens >= max_tokens - 1
+        self._completions.append(completion_tokens * 2 if truncated else completion_tokens)
+        if truncated:
+            logger.warning(f"Completion of {completion_tokens} tokens hit max_tokens={max_tokens} and was probably truncated")
+
+    def stats(self) -> Dict[str, int]:
+        """Return the learned allowance and the number of completions it is based on."""
+        return {"samples": len(self._completions), "max_tokens": self.learned_max_tokens(), "context_window": self.context_window}
@@ -0,0 +1,236 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model: str, temperature: float, max_tokens: int, messages: List[Dict[str, str]]) -> str:
+    """Return a content hash identifying a chat completion request."""
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "max_tokens": max_tokens, "messages": messages},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheTier:
+    """In-memory LRU cache tier with size and TTL eviction."""
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: Optional[float] = 24 * 3600):
+        """Initialize the tier. A ttl_seconds of None keeps entries until they are evicted by size."""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str):
+        """Store a value, evicting the least recently used entries beyond max_entries."""
+        self._entries[key] = (value, time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheTier:
+    """On-disk cache tier backed by SQLite, so a restarted server stays warm.
+
+    Every sweep_interval writes, expired rows are deleted and only the max_entries most
+    recently stored rows are kept. A max_entries of None leaves the size unbounded.
+    """
+
+    def __init__(self, path: str = "cache/responses.sqlite3", ttl_seconds: Optional[float] = 7 * 24 * 3600,
+                 max_entries: Optional[int] = 20000, sweep_interval: int = 256):
+        """Open (or create) the cache database at the given path."""
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value, or None if missing or expired."""
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return value
+
+    def set(self, key: str, value: str):
+        """Store a value, replacing any previous entry for the key."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, value, time.time())
+            )
+            self._writes += 1
+            if self._writes % self.sweep_interval == 0:
+                self._sweep()
+            self._conn.commit()
+
+    def sweep(self):
+        """Delete expired rows and the oldest rows beyond max_entries."""
+        with self._lock:
+            self._sweep()
+            self._conn.commit()
+
+    def _sweep(self):
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl_seconds,))
+        if self.max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """Content-addressed cache for agent completions with a memory tier and an optional disk tier."""
+
+    def __init__(self, memory_tier: Optional[MemoryCacheTier] = None, disk_tier: Optional[SQLiteCacheTier] = None):
+        """Initialize the cache. Without an explicit memory tier a default-sized one is used."""
+        self.memory_tier = memory_tier if memory_tier is not None else MemoryCacheTier()
+        self.disk_tier = disk_tier
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Look the key up in memory, then on disk, promoting disk hits into memory."""
+        value = self.memory_tier.get(key)
+        if value is not None:
+            self.hits += 1
+            self.memory_hits += 1
+            return value
+
+        if self.disk_tier is not None:
+            try:
+                value = self.disk_tier.get(key)
+            except sqlite3.Error as e:
+                logger.error(f"Response cache disk read failed: {str(e)}")
+                value = None
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self.memory_tier.set(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: str):
+        """Store a value in every tier."""
+        self.memory_tier.set(key, value)
+        if self.disk_tier is not None:
+            try:
+                self.disk_tier.set(key, value)
+            except sqlite3.Error as e:
+                logger.error(f"Response cache disk write failed: {str(e)}")
+
+    async def aget(self, key: str) -> Optional[str]:
+        """Like get, but reads the disk tier in a worker thread so the event loop is not blocked."""
+        value = self.memory_tier.get(key)
+        if value is not None:
+            self.hits += 1
+            self.memory_hits += 1
+            return value
+
+        if self.disk_tier is not None:
+            try:
+                value = await asyncio.to_thread(self.disk_tier.get, key)
+            except sqlite3.Error as e:
+                logger.error(f"Response cache disk read failed: {str(e)}")
+                value = None
+            if value is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self.memory_tier.set(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    async def aset(self, key: str, value: str):
+        """Like set, but writes the disk tier in a worker thread so the event loop is not blocked."""
+        self.memory_tier.set(key, value)
+        if self.disk_tier is not None:
+            try:
+                await asyncio.to_thread(self.disk_tier.set, key, value)
+            except sqlite3.Error as e:
+                logger.error(f"Response cache disk write failed: {str(e)}")
+
+    def clear(self):
+        """Remove all entries from every tier."""
+        self.memory_tier.clear()
+        if self.disk_tier is not None:
+            self.disk_tier.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and the current memory tier size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory_tier)
+        }
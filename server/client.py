@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class APIError(Exception):
+    """Error response from the chat completions API."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class ChatCompletion:
+    """Result of a chat completion call."""
+
+    def __init__(self, content: str, usage: Optional[Dict[str, int]] = None, headers: Optional[Dict[str, str]] = None, model: str = ""):
+        self.content = content
+        self.usage = usage or {}
+        self.headers = headers or {}
+        self.model = model
+
+
+class ChatCompletionStream:
+    """Open streaming chat completion; iterate with `async for` to receive content deltas."""
+
+    def __init__(self, response: httpx.Response):
+        self._response = response
+        self.headers = dict(response.headers)
+
+    async def __aiter__(self):
+        """Yield content deltas from the server-sent events until the stream ends."""
+        try:
+            async for line in self._response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+        except httpx.HTTPError as e:
+            raise APIError(f"Stream interrupted: {str(e)}") from e
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        """Release the underlying connection back to the pool."""
+        await self._response.aclose()
+
+
+class OpenAIClient:
+    """Pooled async client for the OpenAI chat completions API.
+
+    One instance is meant to be created per process and shared by the service and all
+    agents, so concurrent generations reuse warm keep-alive connections.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.openai.com/v1",
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 60.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        write_timeout: float = 10.0,
+        pool_timeout: Optional[float] = None
+    ):
+        """Configure the connection pool and timeouts; connections are opened lazily."""
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout)
+        self._http: Optional[httpx.AsyncClient] = None
+        self._lock = asyncio.Lock()
+
+    async def _get_http(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it on first use."""
+        if self._http is None or self._http.is_closed:
+            async with self._lock:
+                if self._http is None or self._http.is_closed:
+                    self._http = httpx.AsyncClient(
+                        base_url=self.base_url,
+                        headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+                        limits=self.limits,
+                        timeout=self.timeout
+                    )
+        return self._http
+
+    async def chat_completion(self, model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int, **extra: Any) -> ChatCompletion:
+        """Create a chat completion and return its content, usage and response headers."""
+        http = await self._get_http()
+        payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens, **extra}
+        try:
+            response = await http.post("/chat/completions", json=payload)
+        except httpx.HTTPError as e:
+            raise APIError(f"Request failed: {str(e)}") from e
+
+        headers = dict(response.headers)
+        if response.status_code >= 400:
+            raise APIError(f"HTTP {response.status_code}: {response.text}", response.status_code, headers)
+
+        data = response.json()
+        return ChatCompletion(
+            content=data["choices"][0]["message"]["content"],
+            usage=data.get("usage", {}),
+            headers=headers,
+            model=data.get("model", model)
+        )
+
+    async def stream_chat_completion(self, model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int, **extra: Any) -> ChatCompletionStream:
+        """Start a streaming chat completion.
+        
+        Errors in the response status are raised here, before any content is consumed.
+        """
+        http = await self._get_http()
+        payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens, "stream": True, **extra}
+        try:
+            response = await http.send(http.build_request("POST", "/chat/completions", json=payload), stream=True)
+        except httpx.HTTPError as e:
+            raise APIError(f"Request failed: {str(e)}") from e
+
+        if response.status_code >= 400:
+            body = await response.aread()
+            await response.aclose()
+            raise APIError(f"HTTP {response.status_code}: {body.decode('utf-8', 'replace')}", response.status_code, dict(response.headers))
+        return ChatCompletionStream(response)
+
+    async def aclose(self):
+        """Close all pooled connections."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def __aenter__(self) -> "OpenAIClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
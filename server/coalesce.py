@@ -0,0 +1,138 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics import PipelineMetrics, get_pipeline_metrics
+from .models import LessonRequest
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_text(value: str) -> str:
+    return " ".join(value.split()).casefold()
+
+
+def canonical_request(request: LessonRequest) -> Dict[str, Any]:
+    """The parts of a request that determine the lesson, with case, whitespace and subtopic order normalized."""
+    return {
+        "subject": _normalize_text(request.subject),
+        "grade_level": _normalize_text(request.grade_level),
+        "topic": _normalize_text(request.topic),
+        "subtopics": sorted({_normalize_text(subtopic) for subtopic in request.subtopics}),
+        "difficulty_level": _normalize_text(request.difficulty_level),
+        "estimated_duration": _normalize_text(request.estimated_duration),
+        "learning_style": _normalize_text(request.learning_style or ""),
+        "curriculum_document_ids": sorted(str(document_id) for document_id in request.curriculum_document_ids)
+    }
+
+
+def content_key(*parts: Any) -> str:
+    """Hash of JSON-serializable parts, independent of dict key order."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def request_key(request: LessonRequest) -> str:
+    """Single-flight key of a whole lesson request."""
+    return content_key(canonical_request(request))
+
+
+PartialCallback = Callable[[str, Any], Awaitable[None]]
+
+
+class _Flight:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.partials: List[Tuple[str, Any]] = []
+        self.subscribers: List[PartialCallback] = []
+
+    async def publish(self, key: str, value: Any):
+        """Record a partial result of the call and pass it to every caller still waiting."""
+        self.partials.append((key, value))
+        for subscriber in list(self.subscribers):
+            try:
+                await subscriber(key, value)
+            except Exception as e:
+                logger.error(f"Partial result subscriber failed: {str(e)}")
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers of a key already in flight share its result.
+
+    The call runs in its own task, so a waiter that is cancelled stops waiting without
+    affecting the others. The call itself is cancelled only when its last waiter leaves.
+    Leaders and joined callers are counted per `scope` in the pipeline metrics. With
+    remember, finished calls are kept and their results returned to later callers too.
+    """
+
+    def __init__(self, scope: str, metrics: Optional[PipelineMetrics] = None, remember: bool = False):
+        self.scope = scope
+        self.metrics = metrics or get_pipeline_metrics()
+        self.remember = remember
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.joined = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the result of call(), or of the call already in flight under this key."""
+        return await self.run_streaming(key, lambda on_partial: call())
+
+    async def run_streaming(self, key: str, call: Callable[[Optional[PartialCallback]], Awaitable[Any]], on_partial: Optional[PartialCallback] = None) -> Any:
+        """Like run, but every caller's on_partial receives the partial results of the shared call.
+
+        The leader's call is passed a callback that fans its partial results out to all
+        callers; a caller that joins late first gets the partials published so far. If the
+        leader has no on_partial the call is made without one, and nobody gets partials.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.ensure_future(call(flight.publish if on_partial is not None else None))
+            self._flights[key] = flight
+            if not self.remember:
+                flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.leaders += 1
+            self.metrics.coalesced_requests.inc(scope=self.scope, role="leader")
+        else:
+            self.joined += 1
+            self.metrics.coalesced_requests.inc(scope=self.scope, role="joined")
+            logger.info(f"Joined in-flight {self.scope} {key[:12]} ({flight.waiters} already waiting)")
+
+        flight.waiters += 1
+        if on_partial is not None:
+            replay = list(flight.partials)
+            flight.subscribers.append(on_partial)
+        try:
+            if on_partial is not None:
+                for partial_key, value in replay:
+                    await on_partial(partial_key, value)
+            return await asyncio.shield(flight.task)
+        finally:
+            if on_partial is not None:
+                flight.subscribers.remove(on_partial)
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Return how many calls were started, how many callers joined one, and how many are in flight."""
+        return {"leaders": self.leaders, "joined": self.joined, "in_flight": sum(1 for flight in self._flights.values() if not flight.task.done())}
+
+
+# Per-agent stage flights of the variant bundle generated in the current task, if any (inherited by stage tasks)
+current_stage_flights: contextvars.ContextVar = contextvars.ContextVar("current_stage_flights", default=None)
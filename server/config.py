@@ -0,0 +1,48 @@
+from typing import Optional
+
+from .retrieval import RetrievalIndex
+from .review import REVIEW_MODES, ReviewCallback, ReviewSampler
+from .routing import ModelRouter
+from .semantic_cache import SemanticCache
+
+
+class LessonServiceConfig:
+    """Optional pipeline subsystems of LessonGenerationService; the defaults match a bare service."""
+
+    def __init__(
+        self,
+        retrieval_index: Optional[RetrievalIndex] = None,
+        reference_top_k: int = 6,
+        reference_char_budget: int = 4000,
+        model_router: Optional[ModelRouter] = None,
+        coalesce: bool = True,
+        review_mode: str = "inline",
+        review_sampler: Optional[ReviewSampler] = None,
+        review_callback: Optional[ReviewCallback] = None,
+        curriculum_cache: Optional[SemanticCache] = None,
+        lesson_cache: Optional[SemanticCache] = None
+    ):
+        """Configure the subsystems.
+
+        Grounding: requests with curriculum_document_ids get the reference_top_k best
+        passages of retrieval_index (default: the shared index), up to reference_char_budget
+        characters. Routing: model_router picks each agent's model tiers (default:
+        ModelRouter()). coalesce shares identical in-flight requests and stage calls.
+        Review: review_mode is "inline" or "background", review_sampler picks the reviewed
+        lessons and review_callback receives background results. Only inline reviews
+        escalate failing stages; background and sampled-out lessons keep the cheap tier.
+        curriculum_cache and lesson_cache reuse results of similar requests; both are off
+        by default.
+        """
+        if review_mode not in REVIEW_MODES:
+            raise ValueError(f"review_mode must be one of {', '.join(REVIEW_MODES)}")
+        self.retrieval_index = retrieval_index
+        self.reference_top_k = reference_top_k
+        self.reference_char_budget = reference_char_budget
+        self.model_router = model_router
+        self.coalesce = coalesce
+        self.review_mode = review_mode
+        self.review_sampler = review_sampler
+        self.review_callback = review_callback
+        self.curriculum_cache = curriculum_cache
+        self.lesson_cache = lesson_cache
@@ -0,0 +1,96 @@
+import json
+import logging
+from typing import Dict, Any, List, Tuple
+
+from .rate_limit import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Fields of the review input that are recompiled from other fields
+DERIVED_FIELDS = {"components": ("lesson_content", "assessments")}
+
+DUPLICATE_MARKER = "(same as above)"
+
+
+def _compact(data: Any) -> str:
+    """Serialize without indentation or padding whitespace."""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def _dedupe(value: Any, seen: set, min_length: int) -> Any:
+    """Replace repeated long strings with a short back-reference, depth first in document order."""
+    if isinstance(value, dict):
+        return {key: _dedupe(item, seen, min_length) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_dedupe(item, seen, min_length) for item in value]
+    if isinstance(value, str):
+        text = " ".join(value.split())
+        if len(text) >= min_length:
+            if text in seen:
+                return DUPLICATE_MARKER
+            seen.add(text)
+        return text
+    return value
+
+
+def _string_slots(value: Any, path: Tuple = ()) -> List[Tuple[Tuple, int]]:
+    """Return (path, length) for every string leaf."""
+    if isinstance(value, dict):
+        return [slot for key, item in value.items() for slot in _string_slots(item, path + (key,))]
+    if isinstance(value, list):
+        return [slot for index, item in enumerate(value) for slot in _string_slots(item, path + (index,))]
+    if isinstance(value, str):
+        return [(path, len(value))]
+    return []
+
+
+def _truncate_at(data: Any, path: Tuple, length: int):
+    """Shorten the string at `path` to `length` characters, keeping its head."""
+    parent = data
+    for key in path[:-1]:
+        parent = parent[key]
+    text = parent[path[-1]]
+    parent[path[-1]] = text[:length].rstrip() + f"... [{len(text) - length} chars truncated]"
+
+
+def build_review_digest(lesson_data: Dict[str, Any], token_budget: int = 3000, min_field_length: int = 200, dedupe_min_length: int = 40) -> Tuple[str, Dict[str, int]]:
+    """Build a compact JSON digest of the lesson for the quality review prompt.
+
+    Derived fields are dropped when their sources are present, repeated text is replaced
+    with a back-reference, whitespace is collapsed, and the longest string fields are
+    truncated (never below min_field_length) until the digest fits the token budget.
+    Returns the digest and its size before and after in characters and estimated tokens.
+    """
+    original = json.dumps(lesson_data, indent=2, ensure_ascii=False)
+
+    data = {
+        key: value for key, value in lesson_data.items()
+        if not (key in DERIVED_FIELDS and all(source in lesson_data for source in DERIVED_FIELDS[key]))
+    }
+    data = _dedupe(data, set(), dedupe_min_length)
+    digest = _compact(data)
+
+    exhausted = set()
+    while estimate_tokens(digest) > token_budget:
+        slots = [slot for slot in _string_slots(data) if slot[1] > min_field_length and slot[0] not in exhausted]
+        if not slots:
+            break
+        path, length = max(slots, key=lambda slot: slot[1])
+        # Allow for the truncation marker that replaces the removed text
+        excess = (estimate_tokens(digest) - token_budget) * 4 + 32
+        target = length - excess
+        if target <= min_field_length:
+            target = min_field_length
+            exhausted.add(path)
+        _truncate_at(data, path, target)
+        digest = _compact(data)
+
+    stats = {
+        "chars_before": len(original),
+        "chars_after": len(digest),
+        "tokens_before": estimate_tokens(original),
+        "tokens_after": estimate_tokens(digest)
+    }
+    if estimate_tokens(digest) > token_budget:
+        logger.warning(f"Review digest still exceeds budget: {stats['tokens_after']} > {token_budget} tokens")
+    return digest, stats
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PageProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+def count_pdf_pages(file_path: str) -> int:
+    """Number of pages in the PDF. Runs in a worker process."""
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def extract_pdf_pages(file_path: str, start: int, end: int, max_chars_per_page: int) -> List[str]:
+    """Extract the text of pages [start, end). Runs in a worker process.
+
+    Each task opens the file itself and reads only its window of pages, so a worker
+    never holds more than one window of a large textbook in memory.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    texts = []
+    for number in range(start, min(end, len(reader.pages))):
+        try:
+            text = reader.pages[number].extract_text() or ""
+        except Exception as e:
+            logger.warning(f"Could not extract page {number + 1} of {file_path}: {str(e)}")
+            text = ""
+        texts.append(text[:max_chars_per_page])
+    return texts
+
+
+def chunk_pages(pages: List[Tuple[int, str]], chunk_chars: int = 1500, overlap_chars: int = 200) -> List[Dict[str, Any]]:
+    """Split page texts into overlapping chunks of about chunk_chars, each tagged with its page number."""
+    chunks = []
+    step = max(1, chunk_chars - overlap_chars)
+    for page_number, text in pages:
+        text = " ".join(text.split())
+        for start in range(0, len(text), step):
+            chunks.append({"page": page_number, "text": text[start:start + chunk_chars]})
+            if start + chunk_chars >= len(text):
+                break
+    return chunks
+
+
+class PDFExtractor:
+    """Page-by-page PDF text extraction in a pool of worker processes.
+
+    A document is split into windows of pages_per_task pages that are extracted in
+    parallel, at most max_in_flight windows at a time, and yielded back in page order.
+    Workers are recycled after max_tasks_per_child windows so parser caches don't grow.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        pages_per_task: int = 16,
+        max_in_flight: Optional[int] = None,
+        max_chars_per_page: int = 20000,
+        max_tasks_per_child: int = 50
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.max_in_flight = max_in_flight or self.max_workers
+        self.max_chars_per_page = max_chars_per_page
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=self.max_tasks_per_child
+            )
+        return self._executor
+
+    async def page_count(self, file_path: str) -> int:
+        """Number of pages in the PDF."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, count_pdf_pages, file_path)
+
+    async def iter_pages(self, file_path: str, on_progress: Optional[PageProgressCallback] = None) -> AsyncIterator[Tuple[int, str]]:
+        """Yield (page_number, text) for each page in order, starting at 1.
+
+        on_progress(pages_done, page_count) is awaited after every page.
+        """
+        loop = asyncio.get_running_loop()
+        page_count = await self.page_count(file_path)
+        windows = [(start, min(start + self.pages_per_task, page_count)) for start in range(0, page_count, self.pages_per_task)]
+        pending: List[asyncio.Future] = []
+        next_window = 0
+        try:
+            while next_window < len(windows) or pending:
+                while next_window < len(windows) and len(pending) < self.max_in_flight:
+                    start, end = windows[next_window]
+                    pending.append(loop.run_in_executor(self.executor, extract_pdf_pages, file_path, start, end, self.max_chars_per_page))
+                    next_window += 1
+                texts = await pending.pop(0)
+                start = windows[next_window - len(pending) - 1][0]
+                for offset, text in enumerate(texts):
+                    page_number = start + offset + 1
+                    yield page_number, text
+                    if on_progress is not None:
+                        await on_progress(page_number, page_count)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        """Shut down the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_shared_extractor: Optional[PDFExtractor] = None
+
+
+def get_shared_pdf_extractor() -> PDFExtractor:
+    """Return the process-wide extractor, sized by the PDF_WORKERS env var (default: all cores)."""
+    global _shared_extractor
+    if _shared_extractor is None:
+        workers = os.getenv("PDF_WORKERS")
+        _shared_extractor = PDFExtractor(max_workers=int(workers) if workers else None)
+    return _shared_extractor
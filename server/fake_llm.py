@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import math
+import random
+from typing import Dict, Any, List, Optional
+
+from .client import APIError, ChatCompletion
+
+logger = logging.getLogger(__name__)
+
+CANNED_RESPONSES: Dict[str, Dict[str, Any]] = {
+    "CurriculumExpert": {
+        "learning_objectives": [
+            "Identify the standard form of a quadratic equation",
+            "Solve quadratic equations by factorisation and by the quadratic formula",
+            "Determine the nature of roots using the discriminant"
+        ],
+        "standards_alignment": ["NCERT Class 10 Mathematics Chapter 4", "CBSE Learning Outcome M1004"],
+        "prerequisites": ["Algebraic identities", "Factorisation of polynomials"],
+        "target_skills": ["Algebraic manipulation", "Problem solving"],
+        "recommended_duration": "45 minutes",
+        "curriculum_analysis": "The topic builds on polynomials and prepares students for board examination word problems."
+    },
+    "ContentCreator": {
+        "introduction": {
+            "content": "Start with the problem of finding the dimensions of a rectangular garden with a given area.",
+            "duration": "8 minutes",
+            "teaching_strategies": ["Real-world hook", "Think-pair-share"]
+        },
+        "main_content": {
+            "content": "Define ax^2 + bx + c = 0, work through factorisation, then derive the quadratic formula.",
+            "duration": "25 minutes",
+            "examples": ["x^2 - 5x + 6 = 0", "2x^2 + x - 6 = 0"],
+            "key_concepts": ["Standard form", "Roots", "Discriminant"]
+        },
+        "activities": {
+            "content": "Groups solve garden and projectile problems and classify roots using the discriminant.",
+            "duration": "10 minutes",
+            "materials_needed": ["Worksheets", "Graph paper"],
+            "instructions": ["Form groups of four", "Solve two problems", "Present one solution"]
+        },
+        "wrap_up": {
+            "content": "Summarise the three solution methods and preview applications in the next lesson.",
+            "duration": "5 minutes",
+            "key_takeaways": ["Quadratics have at most two roots", "The discriminant decides the nature of roots"]
+        }
+    },
+    "AssessmentAgent": {
+        "formative_assessments": [
+            {
+                "type": "Exit ticket",
+                "description": "Quick check on factorisation",
+                "timing": "After main content",
+                "questions": ["Factorise x^2 - 7x + 12", "State the discriminant of x^2 + 4x + 4"]
+            }
+        ],
+        "summative_assessment": {
+            "type": "Short quiz",
+            "description": "Five board-pattern questions",
+            "questions": ["Solve 3x^2 - 5x + 2 = 0", "Find k if kx^2 + 2x + 1 = 0 has equal roots"],
+            "rubric": "One mark per correct method, one per correct answer"
+        },
+        "self_assessment": {
+            "reflection_questions": ["Which method do I find easiest?"],
+            "checklist": ["I can write a quadratic in standard form"]
+        },
+        "evaluation_criteria": ["Correct method", "Accurate computation"]
+    },
+    "QualityReviewAgent": {
+        "quality_scores": {
+            "curriculum_alignment": 9,
+            "content_quality": 8,
+            "engagement_level": 8,
+            "assessment_effectiveness": 8,
+            "pedagogical_soundness": 9
+        },
+        "overall_score": 8.4,
+        "strengths": ["Clear progression", "Relevant examples"],
+        "areas_for_improvement": ["More differentiation for weaker students"],
+        "detailed_feedback": "A well-structured lesson aligned with the NCERT chapter.",
+        "recommendations": ["Add a graphing activity", "Include one HOTS question"]
+    }
+}
+
+# Keys that identify which agent's output format a prompt asks for, checked in order
+AGENT_SIGNATURES = [
+    ("QualityReviewAgent", '"quality_scores"'),
+    ("AssessmentAgent", '"formative_assessments"'),
+    ("ContentCreator", '"introduction"'),
+    ("CurriculumExpert", '"learning_objectives"'),
+]
+
+
+def detect_agent(messages: List[Dict[str, str]]) -> str:
+    """Identify the calling agent from the output format requested in its first user prompt.
+
+    Follow-up turns, such as a re-ask for missing fields, are attributed to the same agent.
+    """
+    prompt = next((message.get("content", "") for message in messages if message.get("role") == "user"), "")
+    for agent_name, signature in AGENT_SIGNATURES:
+        if signature in prompt:
+            return agent_name
+    return "CurriculumExpert"
+
+
+class LatencyModel:
+    """Log-normal latency distribution described by its median and p95 in seconds."""
+
+    def __init__(self, median: float, p95: Optional[float] = None):
+        self.median = median
+        self.p95 = p95 if p95 is not None else median * 2
+        # 1.645 is the z-score of the 95th percentile
+        self.sigma = math.log(self.p95 / self.median) / 1.645 if self.p95 > self.median else 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        """Draw one latency."""
+        return self.median * math.exp(self.sigma * rng.gauss(0, 1)) if self.sigma else self.median
+
+
+DEFAULT_LATENCIES = {
+    "CurriculumExpert": LatencyModel(0.8, 1.6),
+    "ContentCreator": LatencyModel(2.0, 4.0),
+    "AssessmentAgent": LatencyModel(1.5, 3.0),
+    "QualityReviewAgent": LatencyModel(1.2, 2.4),
+}
+
+
+class FakeChatCompletionStream:
+    """Stream of canned content, split into small tokens spread over the sampled latency."""
+
+    def __init__(self, content: str, latency: float, first_token_fraction: float = 0.2, token_size: int = 16):
+        self.headers: Dict[str, str] = {}
+        self._content = content
+        self._latency = latency
+        self._first_token_fraction = first_token_fraction
+        self._token_size = token_size
+
+    async def __aiter__(self):
+        tokens = [self._content[i:i + self._token_size] for i in range(0, len(self._content), self._token_size)]
+        await asyncio.sleep(self._latency * self._first_token_fraction)
+        interval = self._latency * (1 - self._first_token_fraction) / max(1, len(tokens))
+        for token in tokens:
+            yield token
+            await asyncio.sleep(interval)
+
+    async def aclose(self):
+        pass
+
+
+class FakeOpenAIClient:
+    """Offline stand-in for OpenAIClient returning canned, schema-valid JSON for each agent.
+
+    Latency per agent follows a LatencyModel and a fraction of calls fail with a transient
+    HTTP error. A seed makes runs reproducible.
+    """
+
+    def __init__(
+        self,
+        latencies: Optional[Dict[str, LatencyModel]] = None,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        responses: Optional[Dict[str, Dict[str, Any]]] = None,
+        seed: Optional[int] = 0
+    ):
+        """Configure latency per agent name, the fraction of 500 and 429 errors, and canned responses."""
+        self.latencies = {**DEFAULT_LATENCIES, **(latencies or {})}
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.responses = {**CANNED_RESPONSES, **(responses or {})}
+        self.rng = random.Random(seed)
+        self.calls: Dict[str, int] = {}
+
+    def _prepare(self, messages: List[Dict[str, str]]):
+        """Pick the agent's response and latency, or raise a simulated API error."""
+        agent_name = detect_agent(messages)
+        self.calls[agent_name] = self.calls.get(agent_name, 0) + 1
+        latency = self.latencies.get(agent_name, LatencyModel(1.0)).sample(self.rng)
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            return agent_name, latency, APIError("HTTP 429: simulated rate limit", 429, {"retry-after": "0.1"})
+        if roll < self.rate_limit_rate + self.error_rate:
+            return agent_name, latency, APIError("HTTP 500: simulated server error", 500)
+        return agent_name, latency, None
+
+    def _usage(self, messages: List[Dict[str, str]], content: str) -> Dict[str, int]:
+        prompt_tokens = sum(len(message.get("content", "")) for message in messages) // 4
+        completion_tokens = len(content) // 4
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    async def chat_completion(self, model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int, **extra: Any) -> ChatCompletion:
+        """Return the canned completion for the calling agent after its simulated latency."""
+        agent_name, latency, error = self._prepare(messages)
+        if error is not None:
+            await asyncio.sleep(latency * 0.1)
+            raise error
+        await asyncio.sleep(latency)
+        content = json.dumps(self.responses[agent_name])
+        return ChatCompletion(content=content, usage=self._usage(messages, content), model=model)
+
+    async def stream_chat_completion(self, model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int, **extra: Any) -> FakeChatCompletionStream:
+        """Return a stream of the canned completion spread over the simulated latency."""
+        agent_name, latency, error = self._prepare(messages)
+        if error is not None:
+            await asyncio.sleep(latency * 0.1)
+            raise error
+        return FakeChatCompletionStream(json.dumps(self.responses[agent_name]), latency)
+
+    async def aclose(self):
+        pass
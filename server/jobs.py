@@ -0,0 +1,379 @@
+import asyncio
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, TYPE_CHECKING
+
+from .lesson_ir import LessonIR, decode_lesson, encode_lesson
+from .models import GenerationProgress, JobStatus, LessonRequest, LessonResponse
+from .rate_limit import RateLimiter
+
+if TYPE_CHECKING:
+    from .services import LessonGenerationService
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_JOB_STATUSES = ("completed", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    session_id INTEGER,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    progress TEXT,
+    result BLOB,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority DESC, id);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    job_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+"""
+
+
+class Job:
+    """A claimed job: the request to generate and the attempt it is on."""
+
+    def __init__(self, job_id: int, request: LessonRequest, session_id: int, attempts: int, worker: str):
+        self.job_id = job_id
+        self.request = request
+        self.session_id = session_id
+        self.attempts = attempts
+        self.worker = worker
+
+
+class JobQueue:
+    """Durable queue of lesson generation jobs in a SQLite database.
+
+    Jobs are claimed highest priority first, then oldest first. A claim is a lease of
+    lease_seconds that the worker renews while it runs; if the worker dies, the lease
+    runs out and the job is handed to another worker (at-least-once delivery). Failed
+    attempts are retried until max_attempts. Finished stages of a job are checkpointed,
+    so a redelivered job resumes after the last stage that completed.
+    """
+
+    def __init__(self, path: str = "cache/jobs.sqlite3", lease_seconds: float = 120.0, max_attempts: int = 3):
+        """Open (or create) the queue database at the given path."""
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode; claims open their own write transaction
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, parameters)
+
+    def _query(self, sql: str, parameters: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, parameters).fetchall()
+
+    def enqueue(self, request: LessonRequest, priority: int = 0, session_id: Optional[int] = None) -> int:
+        """Add a job and return its id. Progress is reported under session_id (default: the job id)."""
+        now = time.time()
+        cursor = self._execute(
+            "INSERT INTO jobs (request, priority, session_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (request.model_dump_json(), priority, session_id, now, now)
+        )
+        return cursor.lastrowid
+
+    def claim(self, worker: str) -> Optional[Job]:
+        """Lease the next job to the worker, or return None if no job is ready.
+
+        Queued jobs and running jobs whose lease has expired are both ready; a job that
+        has used up its attempts is marked failed instead of being handed out again.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = self._conn.execute(
+                        "SELECT id, request, session_id, attempts FROM jobs "
+                        "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                        "ORDER BY priority DESC, id LIMIT 1",
+                        (now,)
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None
+                    job_id, request, session_id, attempts = row
+                    if attempts >= self.max_attempts:
+                        self._conn.execute(
+                            "UPDATE jobs SET status = 'failed', error = COALESCE(error, ?), lease_until = NULL, updated_at = ? WHERE id = ?",
+                            (f"Worker lost after {attempts} attempts", now, job_id)
+                        )
+                        continue
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+                        (worker, now + self.lease_seconds, now, job_id)
+                    )
+                    self._conn.execute("COMMIT")
+                    break
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if attempts:
+            logger.info(f"Redelivering job {job_id} to {worker} (attempt {attempts + 1})")
+        return Job(job_id, LessonRequest.model_validate_json(request), session_id if session_id is not None else job_id, attempts + 1, worker)
+
+    def renew(self, job: Job) -> bool:
+        """Extend the worker's lease on the job; returns False if the job was handed to another worker."""
+        cursor = self._execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + self.lease_seconds, job.job_id, job.worker)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job: Job, lesson: LessonResponse) -> bool:
+        """Store the finished lesson and drop the job's checkpoints.
+
+        Returns False, storing nothing, if the worker no longer holds the job.
+        """
+        cursor = self._execute(
+            "UPDATE jobs SET status = 'completed', result = ?, error = NULL, lease_until = NULL, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (encode_lesson(LessonIR.from_response(lesson)), time.time(), job.job_id, job.worker)
+        )
+        if cursor.rowcount != 1:
+            logger.warning(f"Discarding the result of job {job.job_id}: {job.worker} no longer holds it")
+            return False
+        self._execute("DELETE FROM checkpoints WHERE job_id = ?", (job.job_id,))
+        return True
+
+    def fail(self, job: Job, error: str) -> bool:
+        """Record a failed attempt; the job is queued again unless it has used up its attempts.
+
+        Returns False, recording nothing, if the worker no longer holds the job.
+        """
+        status = "failed" if job.attempts >= self.max_attempts else "queued"
+        cursor = self._execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (status, error, time.time(), job.job_id, job.worker)
+        )
+        if cursor.rowcount != 1:
+            return False
+        if status == "queued":
+            logger.warning(f"Job {job.job_id} attempt {job.attempts} failed, retrying: {error}")
+        return True
+
+    def save_checkpoint(self, job_id: int, stage: str, value: Any):
+        """Persist the result of a finished stage."""
+        self._execute(
+            "INSERT OR REPLACE INTO checkpoints (job_id, stage, value) VALUES (?, ?, ?)",
+            (job_id, stage, json.dumps(value))
+        )
+
+    def load_checkpoints(self, job_id: int) -> Dict[str, Any]:
+        """Results of the job's stages that finished in earlier attempts, keyed by stage name."""
+        rows = self._query("SELECT stage, value FROM checkpoints WHERE job_id = ?", (job_id,))
+        return {stage: json.loads(value) for stage, value in rows}
+
+    def report_progress(self, job_id: int, progress: GenerationProgress):
+        """Store the job's latest progress update."""
+        self._execute("UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?", (progress.model_dump_json(), time.time(), job_id))
+
+    def status(self, job_id: int) -> Optional[JobStatus]:
+        """Current state of the job, or None if there is no such job."""
+        rows = self._query("SELECT status, priority, attempts, session_id, error, progress FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        status, priority, attempts, session_id, error, progress = rows[0]
+        stages = [stage for (stage,) in self._query("SELECT stage FROM checkpoints WHERE job_id = ?", (job_id,))]
+        return JobStatus(
+            job_id=job_id,
+            status=status,
+            priority=priority,
+            attempts=attempts,
+            session_id=session_id if session_id is not None else job_id,
+            error=error,
+            completed_stages=stages,
+            progress=GenerationProgress.model_validate_json(progress) if progress else None
+        )
+
+    def result(self, job_id: int) -> Optional[LessonResponse]:
+        """The generated lesson, or None until the job has completed."""
+        rows = self._query("SELECT result FROM jobs WHERE id = ? AND status = 'completed'", (job_id,))
+        return decode_lesson(rows[0][0]).to_response() if rows else None
+
+    async def watch(self, job_id: int, poll_interval: float = 0.5) -> AsyncIterator[GenerationProgress]:
+        """Yield each new progress update of the job until it completes or fails."""
+        last = None
+        while True:
+            status = await asyncio.to_thread(self.status, job_id)
+            if status is None:
+                raise ValueError(f"Unknown job {job_id}")
+            if status.progress is not None and status.progress != last:
+                last = status.progress
+                yield last
+            if status.status in TERMINAL_JOB_STATUSES:
+                if status.status == "failed" and (last is None or last.status != "failed"):
+                    yield GenerationProgress(session_id=status.session_id, progress=0, current_agent="Error", status="failed", error=status.error)
+                return
+            await asyncio.sleep(poll_interval)
+
+    def stats(self) -> Dict[str, int]:
+        """Number of jobs in each status."""
+        return dict(self._query("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def close(self):
+        """Close the underlying database connection."""
+        self._conn.close()
+
+
+class JobCheckpoints:
+    """Stage checkpoints of one job, as used by LessonGenerationService.generate_lesson."""
+
+    def __init__(self, queue: JobQueue, job_id: int):
+        self.queue = queue
+        self.job_id = job_id
+
+    def load(self) -> Dict[str, Any]:
+        return self.queue.load_checkpoints(self.job_id)
+
+    def save(self, stage: str, value: Any):
+        self.queue.save_checkpoint(self.job_id, stage, value)
+
+
+def _default_service(workers: int = 1) -> "LessonGenerationService":
+    """Service configured from the environment, limited to its worker's share of the account's rate limits."""
+    from .services import LessonGenerationService
+    return LessonGenerationService(os.getenv("OPENAI_API_KEY", ""), rate_limiter=RateLimiter.from_environment(share=1.0 / workers))
+
+
+async def _run_job(queue: JobQueue, service: "LessonGenerationService", job: Job):
+    """Generate one claimed job, renewing its lease until the lesson is stored or the attempt fails.
+
+    If the lease is lost to another worker, the generation is cancelled.
+    """
+    async def renew_lease():
+        while True:
+            await asyncio.sleep(queue.lease_seconds / 3)
+            if not await asyncio.to_thread(queue.renew, job):
+                logger.warning(f"Lost the lease on job {job.job_id}; cancelling its generation")
+                service.cancel_session(job.session_id, "lost the job lease")
+                return
+
+    async def on_progress(progress: GenerationProgress):
+        await asyncio.to_thread(queue.report_progress, job.job_id, progress)
+
+    renewer = asyncio.ensure_future(renew_lease())
+    try:
+        lesson = await service.generate_lesson(job.request, job.session_id, progress_callback=on_progress, checkpoints=JobCheckpoints(queue, job.job_id))
+        await service.progress_bus.flush()
+        await asyncio.to_thread(queue.complete, job, lesson)
+    except Exception as e:
+        await service.progress_bus.flush()
+        await asyncio.to_thread(queue.fail, job, str(e))
+    finally:
+        renewer.cancel()
+
+
+async def _work(queue_path: str, worker: str, concurrency: int, poll_interval: float, stop: Any, service_factory: Callable[[], "LessonGenerationService"]):
+    queue = JobQueue(queue_path)
+    service = service_factory()
+    running = set()
+    try:
+        while not stop.is_set():
+            running = {task for task in running if not task.done()}
+            job = await asyncio.to_thread(queue.claim, worker) if len(running) < concurrency else None
+            if job is None:
+                if running:
+                    await asyncio.wait(running, timeout=poll_interval, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    await asyncio.sleep(poll_interval)
+                continue
+            running.add(asyncio.ensure_future(_run_job(queue, service, job)))
+        if running:
+            await asyncio.wait(running)
+    finally:
+        await service.aclose()
+        queue.close()
+
+
+def run_worker(queue_path: str, worker: str, concurrency: int, poll_interval: float, stop: Any, service_factory: Optional[Callable[[], "LessonGenerationService"]] = None, workers: int = 1):
+    """Entry point of a worker process (one of `workers`): claim and generate jobs until `stop` is set."""
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_work(queue_path, worker, concurrency, poll_interval, stop, service_factory or functools.partial(_default_service, workers)))
+
+
+class JobWorkerPool:
+    """Worker processes that each host a LessonGenerationService and drain the job queue.
+
+    Every worker runs up to `concurrency` jobs at once on its own event loop, so
+    generation uses `workers` cores without competing with the web server's process.
+    service_factory builds each worker's service and must be a picklable top-level
+    function. By default the service is configured from OPENAI_API_KEY, and each worker
+    gets 1/workers of the OPENAI_REQUESTS_PER_MINUTE and OPENAI_TOKENS_PER_MINUTE quota,
+    since the workers share the account; a custom factory must split the quota itself.
+    """
+
+    def __init__(
+        self,
+        queue_path: str = "cache/jobs.sqlite3",
+        workers: Optional[int] = None,
+        concurrency: int = 4,
+        poll_interval: float = 0.5,
+        service_factory: Optional[Callable[[], "LessonGenerationService"]] = None
+    ):
+        self.queue_path = queue_path
+        self.workers = workers or os.cpu_count() or 1
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.service_factory = service_factory
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+        self._processes: List[multiprocessing.Process] = []
+
+    def start(self):
+        """Start the worker processes."""
+        if self._processes:
+            raise RuntimeError("Worker pool is already running")
+        self._stop.clear()
+        for index in range(self.workers):
+            worker = f"worker-{index}-{uuid.uuid4().hex[:8]}"
+            process = self._context.Process(
+                target=run_worker,
+                args=(self.queue_path, worker, self.concurrency, self.poll_interval, self._stop, self.service_factory, self.workers),
+                name=worker,
+                daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+        logger.info(f"Started {self.workers} generation workers on {self.queue_path}")
+
+    def stop(self, timeout: Optional[float] = None):
+        """Let the workers finish their current jobs and exit; terminate any still running after timeout."""
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Terminating {process.name}; its jobs will be redelivered")
+                process.terminate()
+                process.join()
+        self._processes = []
+
+    @property
+    def alive(self) -> int:
+        return sum(1 for process in self._processes if process.is_alive())
@@ -0,0 +1,213 @@
+"""Compact in-memory and binary representation of generated lessons.
+
+The IR classes use __slots__ and plain attributes, so building thousands of lessons for
+an export costs little memory. Their fields come straight from agent output, so they are
+validated once, when converted to LessonResponse; the conversion is lossless in both
+directions. The binary form is msgpack: each lesson is a positional array, so a
+stream of lessons is simply the packed arrays one after another.
+"""
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+import msgpack
+
+from .models import GenerationTrace, LessonComponent, LessonMetadata, LessonResponse
+
+# Leading element of every encoded lesson; bump when the positional layout changes
+IR_FORMAT_VERSION = 1
+
+
+class ComponentIR:
+    """One lesson component: introduction, main content, an assessment block, and so on."""
+
+    __slots__ = ("component_type", "content", "order", "metadata")
+
+    def __init__(self, component_type: str, content: str, order: int, metadata: Optional[Dict[str, Any]] = None):
+        self.component_type = component_type
+        self.content = content
+        self.order = order
+        self.metadata = metadata if metadata is not None else {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"component_type": self.component_type, "content": self.content, "order": self.order, "metadata": self.metadata}
+
+    def to_model(self) -> LessonComponent:
+        return LessonComponent.model_validate(self.to_dict())
+
+    @classmethod
+    def from_model(cls, component: LessonComponent) -> "ComponentIR":
+        return cls(component.component_type, component.content, component.order, component.metadata)
+
+    def pack(self) -> List[Any]:
+        return [self.component_type, self.content, self.order, self.metadata]
+
+    @classmethod
+    def unpack(cls, values: List[Any]) -> "ComponentIR":
+        return cls(*values)
+
+
+class MetadataIR:
+    """Curriculum metadata of a lesson, mirroring LessonMetadata."""
+
+    __slots__ = (
+        "subject", "grade_level", "topic", "subtopics", "learning_objectives", "standards_alignment",
+        "difficulty_level", "estimated_duration", "prerequisites", "target_skills"
+    )
+
+    def __init__(
+        self,
+        subject: str,
+        grade_level: str,
+        topic: str,
+        subtopics: List[str],
+        learning_objectives: Optional[List[str]] = None,
+        standards_alignment: Optional[List[str]] = None,
+        difficulty_level: str = "intermediate",
+        estimated_duration: str = "45 minutes",
+        prerequisites: Optional[List[str]] = None,
+        target_skills: Optional[List[str]] = None
+    ):
+        self.subject = subject
+        self.grade_level = grade_level
+        self.topic = topic
+        self.subtopics = subtopics
+        self.learning_objectives = learning_objectives or []
+        self.standards_alignment = standards_alignment or []
+        self.difficulty_level = difficulty_level
+        self.estimated_duration = estimated_duration
+        self.prerequisites = prerequisites or []
+        self.target_skills = target_skills or []
+
+    def to_model(self) -> LessonMetadata:
+        return LessonMetadata.model_validate({name: getattr(self, name) for name in self.__slots__})
+
+    @classmethod
+    def from_model(cls, metadata: LessonMetadata) -> "MetadataIR":
+        return cls(**{name: getattr(metadata, name) for name in cls.__slots__})
+
+    def pack(self) -> List[Any]:
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def unpack(cls, values: List[Any]) -> "MetadataIR":
+        return cls(*values)
+
+
+class LessonIR:
+    """A generated lesson, convertible to and from LessonResponse without loss."""
+
+    __slots__ = ("id", "title", "metadata", "components", "quality_score", "feedback", "version", "created_at", "trace")
+
+    def __init__(
+        self,
+        id: int,
+        title: str,
+        metadata: MetadataIR,
+        components: List[ComponentIR],
+        quality_score: Optional[float] = None,
+        feedback: Optional[List[str]] = None,
+        version: str = "1.0",
+        created_at: Optional[datetime] = None,
+        trace: Optional[GenerationTrace] = None
+    ):
+        self.id = id
+        self.title = title
+        self.metadata = metadata
+        self.components = components
+        self.quality_score = quality_score
+        self.feedback = feedback or []
+        self.version = version
+        self.created_at = created_at or datetime.now()
+        self.trace = trace
+
+    def to_response(self) -> LessonResponse:
+        """Build the API model, validating the agent-derived fields (e.g. a non-numeric quality_score raises)."""
+        return LessonResponse(
+            id=self.id,
+            title=self.title,
+            metadata=self.metadata.to_model(),
+            components=[component.to_model() for component in self.components],
+            quality_score=self.quality_score,
+            feedback=self.feedback,
+            version=self.version,
+            created_at=self.created_at,
+            trace=self.trace
+        )
+
+    @classmethod
+    def from_response(cls, lesson: LessonResponse) -> "LessonIR":
+        return cls(
+            id=lesson.id,
+            title=lesson.title,
+            metadata=MetadataIR.from_model(lesson.metadata),
+            components=[ComponentIR.from_model(component) for component in lesson.components],
+            quality_score=lesson.quality_score,
+            feedback=list(lesson.feedback),
+            version=lesson.version,
+            created_at=lesson.created_at,
+            trace=lesson.trace
+        )
+
+    def pack(self) -> List[Any]:
+        """Positional form used by the binary encoding."""
+        return [
+            IR_FORMAT_VERSION,
+            self.id,
+            self.title,
+            self.metadata.pack(),
+            [component.pack() for component in self.components],
+            self.quality_score,
+            self.feedback,
+            self.version,
+            self.created_at.isoformat(),
+            self.trace.model_dump() if self.trace is not None else None
+        ]
+
+    @classmethod
+    def unpack(cls, values: List[Any]) -> "LessonIR":
+        if values[0] != IR_FORMAT_VERSION:
+            raise ValueError(f"Unsupported lesson encoding version {values[0]}")
+        _, id, title, metadata, components, quality_score, feedback, version, created_at, trace = values
+        return cls(
+            id=id,
+            title=title,
+            metadata=MetadataIR.unpack(metadata),
+            components=[ComponentIR.unpack(component) for component in components],
+            quality_score=quality_score,
+            feedback=feedback,
+            version=version,
+            created_at=datetime.fromisoformat(created_at),
+            trace=GenerationTrace.model_validate(trace) if trace is not None else None
+        )
+
+
+def encode_lesson(lesson: LessonIR) -> bytes:
+    """Encode one lesson as msgpack."""
+    return msgpack.packb(lesson.pack(), use_bin_type=True)
+
+
+def decode_lesson(data: bytes) -> LessonIR:
+    """Decode a lesson encoded by encode_lesson."""
+    return LessonIR.unpack(msgpack.unpackb(data, raw=False))
+
+
+def write_lessons(lessons: Iterable[LessonIR], stream: BinaryIO) -> int:
+    """Encode lessons one at a time onto a binary stream and return how many were written."""
+    packer = msgpack.Packer(use_bin_type=True)
+    count = 0
+    for lesson in lessons:
+        stream.write(packer.pack(lesson.pack()))
+        count += 1
+    return count
+
+
+def read_lessons(stream: BinaryIO, chunk_size: int = 64 * 1024) -> Iterator[LessonIR]:
+    """Decode lessons from a binary stream as they are read, holding one chunk in memory at a time."""
+    unpacker = msgpack.Unpacker(raw=False)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        unpacker.feed(chunk)
+        for values in unpacker:
+            yield LessonIR.unpack(values)
@@ -0,0 +1,185 @@
+import bisect
+import contextvars
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from .models import GenerationTrace
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, str]) -> Tuple[str, ...]:
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonically increasing counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """Increase the counter for the given label values."""
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Current value for the given label values."""
+        return self._values.get(_label_key(self.labelnames, labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+    def snapshot(self) -> Dict[str, float]:
+        return {",".join(key) or "total": value for key, value in self._values.items()}
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        """Record one observation for the given label values."""
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            series = self._series.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            ",".join(key) or "total": {"count": series["count"], "sum": series["sum"]}
+            for key, series in self._series.items()
+        }
+
+
+class MetricsRegistry:
+    """Collection of counters and histograms that can be scraped in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        """Return the counter with this name, creating it on first use."""
+        return self._get_or_create(name, lambda: Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """Return the histogram with this name, creating it on first use."""
+        return self._get_or_create(name, lambda: Histogram(name, help_text, labelnames, buckets))
+
+    def _get_or_create(self, name: str, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all metric values as a JSON-serializable dict."""
+        return {name: metric.snapshot() for name, metric in sorted(self._metrics.items())}
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Return the process-wide metrics registry."""
+    return _registry
+
+
+class PipelineMetrics:
+    """The metrics recorded by the lesson generation pipeline."""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        registry = registry or get_metrics_registry()
+        self.agent_calls = registry.counter("lesson_agent_calls_total", "Agent API calls by outcome (success, error, cache_hit)", ("agent", "outcome"))
+        self.agent_call_seconds = registry.histogram("lesson_agent_call_seconds", "Wall time of agent calls including retries", ("agent",))
+        self.agent_queue_wait_seconds = registry.histogram("lesson_agent_queue_wait_seconds", "Time agent calls waited on the rate limiter", ("agent",))
+        self.agent_tokens = registry.counter("lesson_agent_tokens_total", "Prompt and completion tokens by agent", ("agent", "kind"))
+        self.agent_retries = registry.counter("lesson_agent_retries_total", "Retried agent call attempts", ("agent",))
+        self.prompt_overflow_risks = registry.counter("lesson_prompt_overflow_risks_total", "Prompts leaving too little of the context window for the completion", ("agent",))
+        self.model_tier_outcomes = registry.counter("lesson_model_tier_outcomes_total", "Stage outputs that passed the quality gate, were escalated or failed on the top tier, by model", ("agent", "model", "outcome"))
+        self.json_parse_failures = registry.counter("lesson_json_parse_failures_total", "Agent responses that were not valid JSON", ("agent",))
+        self.structured_outputs = registry.counter("lesson_structured_outputs_total", "Agent outputs by how they were obtained (clean, repaired, reasked, fallback)", ("agent", "outcome"))
+        self.coalesced_requests = registry.counter("lesson_coalesced_requests_total", "Requests and stages that started a shared call (leader) or joined one in flight (joined)", ("scope", "role"))
+        self.quality_reviews = registry.counter("lesson_quality_reviews_total", "Quality reviews by mode (inline, background) and outcome (reviewed, skipped, failed)", ("mode", "outcome"))
+        self.semantic_cache_lookups = registry.counter("lesson_semantic_cache_lookups_total", "Near-duplicate cache lookups by kind (curriculum, lesson) and outcome (hit, miss)", ("kind", "outcome"))
+        self.semantic_cache_seconds_saved = registry.counter("lesson_semantic_cache_seconds_saved_total", "Generation seconds avoided by near-duplicate cache hits", ("kind",))
+        self.speculations = registry.counter("lesson_speculations_total", "Stages started on streamed learning objectives, kept or restarted", ("stage", "outcome"))
+        self.stage_seconds = registry.histogram("lesson_stage_seconds", "Wall time of pipeline stages", ("stage",))
+        self.generation_seconds = registry.histogram("lesson_generation_seconds", "End-to-end lesson generation time", ("status",))
+
+    def salvage_rate(self, agent: str) -> float:
+        """Share of the agent's defective outputs that were repaired or re-asked instead of falling back to defaults."""
+        salvaged = self.structured_outputs.value(agent=agent, outcome="repaired") + self.structured_outputs.value(agent=agent, outcome="reasked")
+        defective = salvaged + self.structured_outputs.value(agent=agent, outcome="fallback")
+        return salvaged / defective if defective else 1.0
+
+
+_pipeline_metrics: Optional[PipelineMetrics] = None
+
+
+def get_pipeline_metrics() -> PipelineMetrics:
+    """Return the pipeline metrics registered in the process-wide registry."""
+    global _pipeline_metrics
+    if _pipeline_metrics is None:
+        _pipeline_metrics = PipelineMetrics()
+    return _pipeline_metrics
+
+
+# Trace of the generation session running in the current task (inherited by stage tasks)
+current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+def get_current_trace() -> Optional[GenerationTrace]:
+    """Return the trace of the session being generated in this context, if any."""
+    return current_trace.get()
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 from pydantic import BaseModel, Field
 from datetime import datetime
 
@@ -27,7 +27,38 @@ class LessonRequest(BaseModel):
     subtopics: List[str]
     difficulty_level: str = "intermediate"
     estimated_duration: str = "45 minutes"
-    curriculum_document_ids: List[int] = Field(default_factory=list)
+    learning_style: Optional[str] = None  # e.g. visual, auditory, kinesthetic
+    curriculum_document_ids: List[Union[int, str]] = Field(default_factory=list)  # storage ids or upload content hashes
+    bypass_cache: bool = False  # request a fresh variant instead of a cached response
+
+class AgentCallTrace(BaseModel):
+    agent: str
+    model: str
+    wall_seconds: float = 0.0
+    queue_wait_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    cache_hit: bool = False
+    streamed: bool = False
+    parse_failed: bool = False
+    max_tokens: int = 0  # completion allowance chosen by the prompt budgeter
+    overflow_risk: bool = False  # prompt left too little of the context window for the completion
+    error: Optional[str] = None
+
+class StageTrace(BaseModel):
+    name: str
+    agent: str
+    started_offset_seconds: float  # relative to the start of the session
+    wall_seconds: float
+
+class GenerationTrace(BaseModel):
+    session_id: int
+    total_seconds: float = 0.0
+    stages: List[StageTrace] = Field(default_factory=list)
+    calls: List[AgentCallTrace] = Field(default_factory=list)
+    escalated_stages: List[str] = Field(default_factory=list)  # stages re-run on a larger model, in order
+    semantic_cache_hit: bool = False  # the lesson of a similar earlier request was reused
 
 class LessonResponse(BaseModel):
     id: int
@@ -38,14 +69,42 @@ class LessonResponse(BaseModel):
     feedback: List[str] = Field(default_factory=list)
     version: str = "1.0"
     created_at: datetime
+    trace: Optional[GenerationTrace] = None
 
 class GenerationProgress(BaseModel):
     session_id: int
     progress: int = Field(ge=0, le=100)
     current_agent: str
-    status: str  # pending, in_progress, completed, failed
+    status: str  # pending, in_progress, completed, failed, cancelled, reviewed
     message: Optional[str] = None
     error: Optional[str] = None
+    partial_component: Optional[LessonComponent] = None  # component that finished streaming
+    quality_score: Optional[float] = None  # set on the "reviewed" event of a background review
+
+class VariantAxis(BaseModel):
+    field: str  # difficulty_level, estimated_duration or learning_style
+    values: List[str]
+
+class LessonVariant(BaseModel):
+    settings: Dict[str, str]  # axis field -> value for this variant
+    session_id: int
+    request: LessonRequest
+    lesson: Optional[LessonResponse] = None
+    error: Optional[str] = None
+
+class LessonVariantBundle(BaseModel):
+    base: LessonRequest
+    variants: List[LessonVariant]
+    stage_runs: Dict[str, int] = Field(default_factory=dict)  # agent -> calls made for the whole bundle
+    elapsed_seconds: float = 0.0
+
+class QualityReviewUpdate(BaseModel):
+    session_id: int
+    status: str  # reviewed, failed
+    quality_score: Optional[float] = None
+    feedback: List[str] = Field(default_factory=list)
+    review: Dict[str, Any] = Field(default_factory=dict)  # full QualityReviewAgent output
+    error: Optional[str] = None
 
 class FileUploadResponse(BaseModel):
     id: int
@@ -53,3 +112,35 @@ class FileUploadResponse(BaseModel):
     original_name: str
     size: int
     uploaded_at: datetime
+
+class StoredUpload(BaseModel):
+    document_id: str  # sha256 of the file content
+    file_path: str
+    original_name: str
+    size: int
+    duplicate: bool = False  # identical content was already stored
+
+class BatchLessonResult(BaseModel):
+    index: int  # position of the request in the submitted batch
+    session_id: int
+    request: LessonRequest
+    lesson: Optional[LessonResponse] = None
+    error: Optional[str] = None
+    elapsed_seconds: float = 0.0
+
+class BatchStats(BaseModel):
+    total: int
+    completed: int = 0
+    failed: int = 0
+    elapsed_seconds: float = 0.0
+    lessons_per_minute: float = 0.0
+
+class JobStatus(BaseModel):
+    job_id: int
+    status: str  # queued, running, completed, failed
+    priority: int = 0
+    attempts: int = 0
+    session_id: int
+    error: Optional[str] = None
+    completed_stages: List[str] = Field(default_factory=list)  # stages checkpointed so far
+    progress: Optional[GenerationProgress] = None  # last progress reported by the worker
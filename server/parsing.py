@@ -0,0 +1,125 @@
+import json
+import logging
+import re
+from typing import Dict, Any, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def extract_json_text(text: str) -> str:
+    """Return the JSON object in a response, without markdown fences or surrounding prose."""
+    fenced = FENCE_PATTERN.search(text)
+    if fenced and "{" in fenced.group(1):
+        text = fenced.group(1)
+    start = text.find("{")
+    if start == -1:
+        return text.strip()
+    end = text.rfind("}")
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def _close_truncated(text: str) -> Tuple[str, List[int]]:
+    """Close an unterminated string and any open brackets; also return the positions of commas outside strings."""
+    stack: List[str] = []
+    commas: List[int] = []
+    in_string = False
+    escape = False
+    for index, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in CLOSERS:
+            stack.append(CLOSERS[ch])
+        elif ch in "}]" and stack:
+            stack.pop()
+        elif ch == ",":
+            commas.append(index)
+    closed = text + ('"' if in_string else "")
+    closed = re.sub(r"[,:]\s*$", "", closed.rstrip())
+    return closed + "".join(reversed(stack)), commas
+
+
+def repair_json(text: str, max_cuts: int = 20) -> Optional[Any]:
+    """Parse JSON with common defects: trailing commas, truncation mid-value or mid-member.
+
+    Truncated output is closed; if that is still invalid, the incomplete last element
+    is cut off at the preceding comma, up to max_cuts times. Returns None if nothing works.
+    """
+    candidate = TRAILING_COMMA_PATTERN.sub(r"\1", text)
+    for _ in range(max_cuts + 1):
+        closed, commas = _close_truncated(candidate)
+        try:
+            return json.loads(TRAILING_COMMA_PATTERN.sub(r"\1", closed))
+        except json.JSONDecodeError:
+            if not commas:
+                return None
+            candidate = candidate[:commas[-1]]
+    return None
+
+
+class StructuredParse:
+    """Outcome of parsing a response: the data, how it was obtained and which fields are missing or invalid."""
+
+    def __init__(self, data: Dict[str, Any], status: str, invalid_fields: List[str]):
+        self.data = data
+        self.status = status  # "clean", "repaired" or "failed"
+        self.invalid_fields = invalid_fields
+
+
+def invalid_fields(data: Dict[str, Any], schema: Type[BaseModel]) -> List[str]:
+    """Top-level fields of data that are missing or fail validation against schema."""
+    try:
+        schema.model_validate(data)
+        return []
+    except ValidationError as e:
+        fields = []
+        for error in e.errors():
+            field = str(error["loc"][0]) if error["loc"] else ""
+            if field and field not in fields:
+                fields.append(field)
+        return fields
+
+
+def normalize(data: Dict[str, Any], schema: Type[BaseModel]) -> Dict[str, Any]:
+    """Coerce data to the schema's types (e.g. "8" to 8.0), keeping only the fields that were present."""
+    try:
+        return schema.model_validate(data).model_dump(exclude_unset=True)
+    except ValidationError:
+        return data
+
+
+def parse_structured(text: str, schema: Type[BaseModel]) -> StructuredParse:
+    """Parse an agent response against its schema, extracting and repairing the JSON when needed."""
+    status = "clean"
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        status = "repaired"
+        extracted = extract_json_text(text)
+        try:
+            data = json.loads(extracted)
+        except json.JSONDecodeError:
+            data = repair_json(extracted)
+
+    if not isinstance(data, dict):
+        return StructuredParse({}, "failed", list(schema.model_fields))
+    return StructuredParse(data, status, invalid_fields(data, schema))
+
+
+def describe_fields(schema: Type[BaseModel], fields: List[str]) -> str:
+    """JSON schema of just the given top-level fields, for a re-ask prompt."""
+    full = schema.model_json_schema()
+    properties = {name: full["properties"][name] for name in fields if name in full.get("properties", {})}
+    return json.dumps({"type": "object", "properties": properties, "required": list(properties), "$defs": full.get("$defs", {})})
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+
+logger = logging.getLogger(__name__)
+
+ProgressReporter = Callable[[int, str, str], Awaitable[None]]
+
+
+class Stage:
+    """A single step of the lesson generation workflow and the stages it depends on."""
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[Dict[str, Any]], Awaitable[Any]],
+        depends_on: Optional[List[str]] = None,
+        agent_name: Optional[str] = None,
+        weight: int = 0,
+        start_message: str = "",
+        end_message: str = ""
+    ):
+        """Declare a stage. `run` receives the results of all completed stages keyed by name."""
+        self.name = name
+        self.run = run
+        self.depends_on = list(depends_on or [])
+        self.agent_name = agent_name or name
+        self.weight = weight
+        self.start_message = start_message
+        self.end_message = end_message
+
+
+class StageGraph:
+    """Dependency graph of stages, executed as concurrently as the dependencies allow."""
+
+    def __init__(self, stages: List[Stage], base_progress: int = 0):
+        """Build the graph and validate that every dependency exists and there are no cycles."""
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage name: {stage.name}")
+            self.stages[stage.name] = stage
+        self.base_progress = base_progress
+        self.progress = base_progress
+        # Stage name -> (start offset from the beginning of run(), wall seconds)
+        self.timings: Dict[str, Tuple[float, float]] = {}
+
+        for stage in stages:
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dependency}'")
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        """Raise ValueError if the dependency graph contains a cycle."""
+        visiting, visited = set(), set()
+
+        def visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected in stage graph at '{name}'")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    async def run(self, reporter: Optional[ProgressReporter] = None) -> Dict[str, Any]:
+        """Run every stage once its dependencies have completed and return all stage results.
+
+        Progress is the base progress plus the weights of completed stages, so it only
+        ever increases no matter in which order concurrent stages finish. If any stage
+        fails, the stages still running are cancelled and the error is re-raised; a real
+        error takes precedence over a stage that finished cancelled at the same time.
+        """
+        results: Dict[str, Any] = {}
+        completed_weight = 0
+        run_started = time.monotonic()
+        pending = dict(self.stages)
+        running: Dict[asyncio.Task, Stage] = {}
+
+        async def report(message: str, agent_name: str):
+            if reporter and message:
+                await reporter(self.progress, agent_name, message)
+
+        try:
+            while pending or running:
+                ready = [
+                    stage for stage in pending.values()
+                    if all(dependency in results for dependency in stage.depends_on)
+                ]
+                for stage in ready:
+                    del pending[stage.name]
+                    await report(stage.start_message, stage.agent_name)
+                    running[asyncio.ensure_future(self._timed(stage, dict(results), run_started))] = stage
+
+                if not running:
+                    raise RuntimeError(f"Stages could not be scheduled: {', '.join(pending)}")
+
+                done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+                # A stage cancelled because another one failed must not hide that failure
+                failures = [task.exception() for task in running if task in done and not task.cancelled() and task.exception() is not None]
+                if failures:
+                    raise failures[0]
+                for task in done:
+                    stage = running.pop(task)
+                    results[stage.name] = task.result()
+                    completed_weight += stage.weight
+                    self.progress = self.base_progress + completed_weight
+                    await report(stage.end_message, stage.agent_name)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        return results
+
+    async def _timed(self, stage: Stage, results: Dict[str, Any], run_started: float) -> Any:
+        """Run a stage and record when it started and how long it took."""
+        started = time.monotonic()
+        try:
+            return await stage.run(results)
+        finally:
+            self.timings[stage.name] = (started - run_started, time.monotonic() - started)
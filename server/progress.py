@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .models import GenerationProgress
+from .sessions import ProgressCallback
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "reviewed"}
+
+
+class ProgressBus:
+    """Non-blocking delivery of progress events to their sinks.
+
+    publish() never waits: events are queued and a background dispatcher awaits the
+    sinks. While an event waits, a newer event for the same session replaces it, so a
+    slow sink only ever sees the latest state. Streamed partial components are coalesced
+    per component, and terminal events (completed, failed, cancelled, reviewed) are never dropped.
+    When more than max_pending intermediate events are waiting, the oldest are dropped.
+    """
+
+    def __init__(self, max_pending: int = 1000):
+        self.max_pending = max_pending
+        self._pending: "OrderedDict[Tuple, Tuple[GenerationProgress, ProgressCallback]]" = OrderedDict()
+        self._terminal_sequence = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.sink_errors = 0
+
+    def _key(self, event: GenerationProgress) -> Tuple:
+        if event.status in TERMINAL_STATUSES:
+            self._terminal_sequence += 1
+            return (event.session_id, "terminal", self._terminal_sequence)
+        if event.partial_component is not None:
+            return (event.session_id, "component", event.partial_component.component_type)
+        return (event.session_id, "progress")
+
+    def publish(self, event: GenerationProgress, sink: Optional[ProgressCallback]):
+        """Queue an event for delivery to sink without waiting for it."""
+        if sink is None:
+            return
+        self.published += 1
+        key = self._key(event)
+
+        if key[1] == "terminal":
+            # The final state supersedes any progress update still waiting for this session
+            if self._pending.pop((event.session_id, "progress"), None) is not None:
+                self.coalesced += 1
+        elif key in self._pending:
+            self.coalesced += 1
+
+        # Replacing keeps the entry's place in line, so a session's events stay in order
+        self._pending[key] = (event, sink)
+
+        intermediate = [k for k in self._pending if k[1] != "terminal"]
+        for stale in intermediate[:max(0, len(intermediate) - self.max_pending)]:
+            del self._pending[stale]
+            self.dropped += 1
+
+        self._ensure_dispatcher()
+        self._idle.clear()
+        self._wakeup.set()
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def _dispatch(self):
+        """Deliver queued events one at a time, in order; idle only once nothing is queued or being delivered."""
+        while True:
+            if not self._pending:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            _, (event, sink) = self._pending.popitem(last=False)
+            try:
+                await sink(event)
+                self.delivered += 1
+            except Exception as e:
+                self.sink_errors += 1
+                logger.error(f"Progress sink failed for session {event.session_id}: {str(e)}")
+
+    async def flush(self):
+        """Wait until every queued event has been delivered, including one a sink is still receiving."""
+        # Events published while waiting clear _idle again, so re-check after every wake-up
+        while self._dispatcher is not None and not self._dispatcher.done() and not self._idle.is_set():
+            await self._idle.wait()
+
+    async def aclose(self):
+        """Deliver what is queued, then stop the dispatcher once it is idle."""
+        await self.flush()
+        if self._dispatcher is not None:
+            # No await since flush returned, so the dispatcher is parked on _wakeup, not inside a sink
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return delivery counters and the number of queued events."""
+        return {
+            "published": self.published,
+            "delivered": self.delivered,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "sink_errors": self.sink_errors,
+            "pending": len(self._pending)
+        }
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse a rate-limit reset value such as "6m0s", "1.5s" or "20ms" into seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_SECONDS[unit] for amount, unit in parts)
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the tokens in a piece of text (about four characters per token)."""
+    return len(text) // 4
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    """Roughly estimate the prompt tokens of a chat request."""
+    return sum(estimate_tokens(message.get("content", "")) for message in messages) + 4 * len(messages)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Return True if the exception is an HTTP 429 from the API."""
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _header(headers: Optional[Dict[str, Any]], name: str) -> Optional[str]:
+    """Case-insensitive header lookup."""
+    if not headers:
+        return None
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `limit` units per minute."""
+
+    def __init__(self, limit_per_minute: float):
+        """Create a full bucket holding one minute of capacity."""
+        self.limit = float(limit_per_minute)
+        self.scale = 1.0
+        self.tokens = self.limit
+        self.updated_at = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        """Effective refill rate in units per second."""
+        return self.limit * self.scale / 60.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.limit, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def time_until(self, amount: float, now: Optional[float] = None) -> float:
+        """Seconds until `amount` units are available (requests larger than the bucket wait for a full bucket)."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        needed = min(amount, self.limit) - self.tokens
+        if needed <= 0:
+            return 0.0
+        return needed / self.rate if self.rate > 0 else float("inf")
+
+    def consume(self, amount: float):
+        """Take `amount` units; the balance may go negative for oversized requests."""
+        self._refill(time.monotonic())
+        self.tokens -= amount
+
+    def sync(self, limit: Optional[float] = None, remaining: Optional[float] = None):
+        """Align the bucket with the limit and remaining values reported by the server."""
+        self._refill(time.monotonic())
+        if limit is not None and limit > 0:
+            self.limit = float(limit)
+        if remaining is not None:
+            self.tokens = min(self.tokens, float(remaining))
+
+
+class RateLimiter:
+    """Request and token budget shared by every agent calling the API.
+
+    Callers wait in FIFO order for both a request slot and their estimated tokens. The
+    effective rate is cut in half on every 429 and recovers gradually on success, and
+    the buckets are re-synchronised from rate-limit response headers when available.
+    """
+
+    def __init__(self, requests_per_minute: float = 500, tokens_per_minute: float = 40000, min_scale: float = 0.1, recovery_step: float = 0.05):
+        """Initialize the limiter with the account's per-minute quotas."""
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.min_scale = min_scale
+        self.recovery_step = recovery_step
+        self.paused_until = 0.0
+        self.rate_limited_count = 0
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_environment(cls, share: float = 1.0) -> "RateLimiter":
+        """Limiter for `share` of the quotas in OPENAI_REQUESTS_PER_MINUTE and OPENAI_TOKENS_PER_MINUTE."""
+        return cls(
+            requests_per_minute=float(os.environ.get("OPENAI_REQUESTS_PER_MINUTE", 500)) * share,
+            tokens_per_minute=float(os.environ.get("OPENAI_TOKENS_PER_MINUTE", 40000)) * share
+        )
+
+    @property
+    def scale(self) -> float:
+        """Current fraction of the configured quota being used."""
+        return self.requests.scale
+
+    def _set_scale(self, scale: float):
+        scale = max(self.min_scale, min(1.0, scale))
+        self.requests.scale = scale
+        self.tokens.scale = scale
+
+    async def acquire(self, estimated_tokens: int):
+        """Wait until a request slot and `estimated_tokens` are available, then reserve them."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self.paused_until - now,
+                    self.requests.time_until(1, now),
+                    self.tokens.time_until(estimated_tokens, now)
+                )
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(estimated_tokens)
+                    return
+                await asyncio.sleep(wait)
+
+    def on_success(self, headers: Optional[Dict[str, Any]] = None):
+        """Record a successful call: recover the rate and sync with any rate-limit headers."""
+        self._set_scale(self.scale + self.recovery_step)
+        self.update_from_headers(headers)
+
+    def on_rate_limited(self, headers: Optional[Dict[str, Any]] = None):
+        """Record a 429: halve the rate and pause all callers until the server's reset time."""
+        self.rate_limited_count += 1
+        self._set_scale(self.scale / 2)
+        self.update_from_headers(headers)
+
+        retry_after = parse_reset_duration(_header(headers, "retry-after"))
+        if retry_after is None:
+            retry_after = max(
+                parse_reset_duration(_header(headers, "x-ratelimit-reset-requests")) or 0.0,
+                parse_reset_duration(_header(headers, "x-ratelimit-reset-tokens")) or 0.0
+            ) or 1.0
+        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        logger.warning(f"Rate limited by API; pausing {retry_after:.1f}s at {self.scale:.0%} of quota")
+
+    def update_from_headers(self, headers: Optional[Dict[str, Any]]):
+        """Sync the buckets with x-ratelimit-* headers."""
+        def number(name: str) -> Optional[float]:
+            value = _header(headers, name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        self.requests.sync(number("x-ratelimit-limit-requests"), number("x-ratelimit-remaining-requests"))
+        self.tokens.sync(number("x-ratelimit-limit-tokens"), number("x-ratelimit-remaining-tokens"))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the current budget state."""
+        return {
+            "requests_per_minute": self.requests.limit,
+            "tokens_per_minute": self.tokens.limit,
+            "scale": self.scale,
+            "rate_limited_count": self.rate_limited_count
+        }
+
+
+_shared_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_shared_rate_limiter() -> RateLimiter:
+    """Return the process-wide limiter, configured from OPENAI_REQUESTS_PER_MINUTE and OPENAI_TOKENS_PER_MINUTE."""
+    global _shared_rate_limiter
+    if _shared_rate_limiter is None:
+        _shared_rate_limiter = RateLimiter.from_environment()
+    return _shared_rate_limiter
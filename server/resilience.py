@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import random
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class StreamInterruptedError(Exception):
+    """A streamed completion failed after yielding output that a retry could not reproduce."""
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Return True for timeouts, connection failures and transient HTTP statuses."""
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    if status is None:
+        # No HTTP status means the request never got a response (connection reset, DNS, ...)
+        return hasattr(error, "status_code") or hasattr(error, "http_status")
+    return status in RETRYABLE_STATUS_CODES
+
+
+class RetryPolicy:
+    """Timeout, retry and hedging settings for an agent's API calls."""
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        attempt_timeout: float = 120.0,
+        deadline: Optional[float] = 300.0,
+        base_delay: float = 1.0,
+        max_delay: float = 20.0,
+        hedge: bool = False,
+        hedge_quantile: float = 0.9,
+        hedge_min_samples: int = 20
+    ):
+        """Configure the policy.
+
+        attempt_timeout bounds a single request; deadline bounds the whole call including
+        retries (None for no deadline). With hedge enabled, a duplicate request is sent once
+        the first has been outstanding longer than the observed hedge_quantile latency.
+        """
+        self.max_attempts = max_attempts
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (0-based): exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        """Add a latency sample."""
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the q-quantile of the window, or None if it is empty."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index]
+
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: float) -> T:
+    """Run `call`; if it has not finished after `delay` seconds, start a duplicate.
+
+    Returns the first successful result and cancels the other request. If both fail,
+    the last error is raised.
+    """
+    first = asyncio.ensure_future(call())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result()
+
+        logger.info(f"Hedging request after {delay:.1f}s")
+        tasks.add(asyncio.ensure_future(call()))
+        last_error: Optional[BaseException] = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
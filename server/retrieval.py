@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a about above after again all also an and any are as at be because been before being below between both but by can
+could did do does doing down during each few for from further had has have having he her here hers him his how i if
+in into is it its itself just me more most my no nor not now of off on once only or other our out over own same she
+should so some such than that the their them then there these they this those through to too under until up very was
+we were what when where which while who whom why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords and single characters."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+def format_passages(passages: List[Dict[str, Any]], char_budget: int = 4000) -> str:
+    """Render retrieved passages for a prompt, best first, within char_budget characters."""
+    lines = []
+    used = 0
+    for passage in passages:
+        line = f"[page {passage['page']}] {passage['text']}"
+        if used + len(line) > char_budget:
+            remaining = char_budget - used
+            if remaining > 200:
+                lines.append(line[:remaining - 3] + "...")
+            break
+        lines.append(line)
+        used += len(line) + 1
+    return "\n".join(lines)
+
+
+class RetrievalIndex:
+    """BM25 index over passages of curriculum documents, stored as NumPy arrays.
+
+    Postings are kept as (term, passage, term frequency) triples and arranged into a
+    term-major CSR layout with precomputed BM25 weights, so a query only touches the
+    postings of its own terms. The index is persisted as index.npz plus passages.json
+    in `path`.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        """Create an empty index, loading the one stored at path if it exists."""
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self.passages: List[Dict[str, Any]] = []
+        self.document_ids: List[str] = []
+        self._term_ids = np.zeros(0, dtype=np.int32)
+        self._passage_ids = np.zeros(0, dtype=np.int32)
+        self._frequencies = np.zeros(0, dtype=np.float32)
+        self._passage_documents = np.zeros(0, dtype=np.int32)
+        self._passage_lengths = np.zeros(0, dtype=np.float32)
+        self._lock = threading.Lock()
+        self._dirty = True
+        if path is not None and os.path.exists(os.path.join(path, "index.npz")):
+            self.load()
+
+    def __contains__(self, document_id: Any) -> bool:
+        return str(document_id) in self.document_ids
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def add_document(self, document_id: Any, chunks: Iterable[Dict[str, Any]]):
+        """Index a document's chunks ({"page", "text"}), replacing any previous version of it."""
+        document_id = str(document_id)
+        with self._lock:
+            if document_id in self.document_ids:
+                self._remove(document_id)
+            document_index = len(self.document_ids)
+            self.document_ids.append(document_id)
+
+            term_ids, passage_ids, frequencies, lengths = [], [], [], []
+            for chunk in chunks:
+                tokens = tokenize(chunk["text"])
+                if not tokens:
+                    continue
+                passage_id = len(self.passages)
+                self.passages.append({"document_id": document_id, "page": chunk.get("page"), "text": chunk["text"]})
+                counts: Dict[int, int] = {}
+                for token in tokens:
+                    term_id = self.vocabulary.setdefault(token, len(self.vocabulary))
+                    counts[term_id] = counts.get(term_id, 0) + 1
+                term_ids.extend(counts)
+                passage_ids.extend([passage_id] * len(counts))
+                frequencies.extend(counts.values())
+                lengths.append(len(tokens))
+
+            self._term_ids = np.concatenate([self._term_ids, np.asarray(term_ids, dtype=np.int32)])
+            self._passage_ids = np.concatenate([self._passage_ids, np.asarray(passage_ids, dtype=np.int32)])
+            self._frequencies = np.concatenate([self._frequencies, np.asarray(frequencies, dtype=np.float32)])
+            self._passage_documents = np.concatenate([self._passage_documents, np.full(len(lengths), document_index, dtype=np.int32)])
+            self._passage_lengths = np.concatenate([self._passage_lengths, np.asarray(lengths, dtype=np.float32)])
+            self._dirty = True
+
+    def _remove(self, document_id: str):
+        """Drop a document's passages and postings, renumbering the rest."""
+        document_index = self.document_ids.index(document_id)
+        keep = self._passage_documents != document_index
+        new_ids = np.cumsum(keep) - 1
+        postings = keep[self._passage_ids]
+        self._term_ids = self._term_ids[postings]
+        self._passage_ids = new_ids[self._passage_ids[postings]].astype(np.int32)
+        self._frequencies = self._frequencies[postings]
+        self._passage_lengths = self._passage_lengths[keep]
+        self.passages = [passage for passage, kept in zip(self.passages, keep) if kept]
+        documents = self._passage_documents[keep]
+        self._passage_documents = np.where(documents > document_index, documents - 1, documents).astype(np.int32)
+        self.document_ids.pop(document_index)
+        self._dirty = True
+
+    def _build(self):
+        """Arrange postings by term and precompute their BM25 weights."""
+        order = np.argsort(self._term_ids, kind="stable")
+        self._csr_passages = self._passage_ids[order]
+        counts = np.bincount(self._term_ids, minlength=len(self.vocabulary))
+        self._indptr = np.concatenate([[0], np.cumsum(counts)])
+
+        passage_count = max(1, len(self.passages))
+        average_length = float(self._passage_lengths.mean()) if len(self._passage_lengths) else 1.0
+        idf = np.log(1 + (passage_count - counts + 0.5) / (counts + 0.5))
+        frequencies = self._frequencies[order]
+        norm = self.k1 * (1 - self.b + self.b * self._passage_lengths[self._csr_passages] / average_length)
+        self._weights = (idf[self._term_ids[order]] * frequencies * (self.k1 + 1) / (frequencies + norm)).astype(np.float32)
+        self._dirty = False
+
+    def search(self, query: str, document_ids: Optional[Iterable[Any]] = None, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Return the top_k passages for the query, optionally restricted to some documents."""
+        with self._lock:
+            if self._dirty:
+                self._build()
+            term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+            if not term_ids or not self.passages:
+                return []
+
+            scores = np.zeros(len(self.passages), dtype=np.float32)
+            for term_id in term_ids:
+                start, end = self._indptr[term_id], self._indptr[term_id + 1]
+                scores[self._csr_passages[start:end]] += self._weights[start:end]
+
+            if document_ids is not None:
+                allowed = [self.document_ids.index(str(d)) for d in document_ids if str(d) in self.document_ids]
+                scores[~np.isin(self._passage_documents, allowed)] = 0.0
+
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k)[:top_k]]
+            ranked = candidates[np.argsort(-scores[candidates])]
+            return [{**self.passages[i], "score": float(scores[i])} for i in ranked]
+
+    def save(self, path: Optional[str] = None):
+        """Write the index to path (default: the path it was created with)."""
+        path = path or self.path
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            np.savez_compressed(
+                os.path.join(path, "index.npz"),
+                term_ids=self._term_ids,
+                passage_ids=self._passage_ids,
+                frequencies=self._frequencies,
+                passage_documents=self._passage_documents,
+                passage_lengths=self._passage_lengths
+            )
+            with open(os.path.join(path, "passages.json"), "w", encoding="utf-8") as f:
+                json.dump({"vocabulary": self.vocabulary, "document_ids": self.document_ids, "passages": self.passages}, f, ensure_ascii=False)
+
+    def load(self, path: Optional[str] = None):
+        """Replace the contents of the index with the one stored at path."""
+        path = path or self.path
+        with self._lock:
+            with np.load(os.path.join(path, "index.npz")) as arrays:
+                self._term_ids = arrays["term_ids"]
+                self._passage_ids = arrays["passage_ids"]
+                self._frequencies = arrays["frequencies"]
+                self._passage_documents = arrays["passage_documents"]
+                self._passage_lengths = arrays["passage_lengths"]
+            with open(os.path.join(path, "passages.json"), encoding="utf-8") as f:
+                stored = json.load(f)
+            self.vocabulary = stored["vocabulary"]
+            self.document_ids = stored["document_ids"]
+            self.passages = stored["passages"]
+            self._dirty = True
+        logger.info(f"Loaded retrieval index with {len(self.passages)} passages from {path}")
+
+
+_shared_index: Optional[RetrievalIndex] = None
+
+
+def get_shared_retrieval_index() -> RetrievalIndex:
+    """Return the process-wide index stored at RETRIEVAL_INDEX_PATH (default cache/retrieval_index)."""
+    global _shared_index
+    if _shared_index is None:
+        _shared_index = RetrievalIndex(os.getenv("RETRIEVAL_INDEX_PATH", "cache/retrieval_index"))
+    return _shared_index
@@ -0,0 +1,30 @@
+from typing import Any, Awaitable, Callable
+
+from .coalesce import request_key
+from .models import LessonRequest, QualityReviewUpdate
+
+ReviewCallback = Callable[[QualityReviewUpdate], Awaitable[Any]]
+
+# "inline" reviews before returning and escalates failing stages to larger models (ModelRouter);
+# "background" reviews after returning and never escalates. Sampled-out lessons are neither reviewed nor escalated.
+REVIEW_MODES = ("inline", "background")
+
+
+class ReviewSampler:
+    """Decides which lessons get a quality review.
+
+    A request is reviewed when the hash of its canonical form falls below `rate`, so a
+    bulk run reviews about that fraction of its lessons and a given request is always
+    sampled the same way. A lesson that is not reviewed is also never escalated, so it
+    stays on the cheapest model tier.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError("rate must be between 0 and 1")
+        self.rate = rate
+
+    def should_review(self, request: LessonRequest) -> bool:
+        if self.rate >= 1.0:
+            return True
+        return int(request_key(request)[:8], 16) / 0x100000000 < self.rate
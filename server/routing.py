@@ -0,0 +1,93 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from .metrics import PipelineMetrics, get_pipeline_metrics
+
+logger = logging.getLogger(__name__)
+
+# Models to try per agent, cheapest first
+DEFAULT_MODEL_TIERS: Dict[str, List[str]] = {
+    "CurriculumExpert": ["gpt-4o-mini", "gpt-4"],
+    "ContentCreator": ["gpt-4o-mini", "gpt-4"],
+    "AssessmentAgent": ["gpt-4o-mini", "gpt-4"],
+    "QualityReviewAgent": ["gpt-4"],
+}
+
+# Quality review dimensions that judge the output of each tiered stage
+STAGE_QUALITY_DIMENSIONS: Dict[str, tuple] = {
+    "curriculum": ("curriculum_alignment",),
+    "content": ("content_quality", "engagement_level"),
+    "assessment": ("assessment_effectiveness",),
+}
+
+
+def _score(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelRouter:
+    """Routes each agent to a model tier and decides, from the quality review, which stages to escalate.
+
+    A lesson passes the gate when the review's overall_score is at least `threshold`.
+    Otherwise the stages whose own review dimensions score below the threshold are
+    escalated (all tiered stages if no dimension is singled out). How often each
+    agent's output passes on each model is counted so thresholds can be tuned.
+    """
+
+    def __init__(self, tiers: Optional[Dict[str, List[str]]] = None, threshold: float = 7.0, metrics: Optional[PipelineMetrics] = None):
+        self.tiers = {**DEFAULT_MODEL_TIERS, **(tiers or {})}
+        self.threshold = threshold
+        self.metrics = metrics or get_pipeline_metrics()
+        self.outcomes: Dict[str, Dict[str, Dict[str, int]]] = {}
+
+    def models(self, agent_name: str) -> List[str]:
+        """Models for the agent, cheapest first."""
+        return self.tiers.get(agent_name) or ["gpt-4"]
+
+    def failing_stages(self, review: Dict[str, Any]) -> List[str]:
+        """Stages to re-run on a larger model, or [] if the lesson passes the gate."""
+        overall = _score(review.get("overall_score"))
+        if overall is None or overall >= self.threshold:
+            return []
+        scores = review.get("quality_scores") or {}
+        flagged = []
+        for stage, dimensions in STAGE_QUALITY_DIMENSIONS.items():
+            dimension_scores = [_score(scores.get(dimension)) for dimension in dimensions]
+            if any(score is not None and score < self.threshold for score in dimension_scores):
+                flagged.append(stage)
+        return flagged or list(STAGE_QUALITY_DIMENSIONS)
+
+    def record(self, agent_name: str, model: str, passed: bool, escalating: bool = True):
+        """Count whether an agent's output on this model passed the quality gate.
+
+        Output that did not pass counts as escalated when it is re-run on a larger model,
+        and as failed when the model is the agent's top tier or escalating is False.
+        """
+        if passed:
+            outcome = "passed"
+        elif escalating and self.next_model(agent_name, model) is not None:
+            outcome = "escalated"
+        else:
+            outcome = "failed"
+        counts = self.outcomes.setdefault(agent_name, {}).setdefault(model, {"passed": 0, "escalated": 0, "failed": 0})
+        counts[outcome] += 1
+        self.metrics.model_tier_outcomes.inc(agent=agent_name, model=model, outcome=outcome)
+
+    def next_model(self, agent_name: str, model: str) -> Optional[str]:
+        """The agent's next larger model after this one, or None at the top tier."""
+        models = self.models(agent_name)
+        position = models.index(model) if model in models else len(models) - 1
+        return models[position + 1] if position + 1 < len(models) else None
+
+    def stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Return per agent and model the gate outcomes and success rate."""
+        return {
+            agent_name: {
+                model: {**counts, "success_rate": counts["passed"] / max(1, sum(counts.values()))}
+                for model, counts in models.items()
+            }
+            for agent_name, models in self.outcomes.items()
+        }
@@ -0,0 +1,69 @@
+from typing import List, Dict, Any
+from pydantic import BaseModel, ConfigDict, Field
+
+# Expected JSON output of each agent. Required fields are the ones the pipeline relies on;
+# a response missing them is repaired or re-asked. Unknown extra fields are kept.
+
+class CurriculumAnalysisOutput(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    learning_objectives: List[str]
+    standards_alignment: List[str] = Field(default_factory=list)
+    prerequisites: List[str] = Field(default_factory=list)
+    target_skills: List[str] = Field(default_factory=list)
+    recommended_duration: str = "45 minutes"
+    curriculum_analysis: str = ""
+
+class ContentSection(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    content: str
+    duration: str = ""
+
+class LessonContentOutput(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    introduction: ContentSection
+    main_content: ContentSection
+    activities: ContentSection
+    wrap_up: ContentSection
+
+class FormativeAssessmentItem(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    type: str = "Assessment"
+    description: str = ""
+    questions: List[str] = Field(default_factory=list)
+
+class SummativeAssessment(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    type: str = "quiz"
+    questions: List[str] = Field(default_factory=list)
+
+class AssessmentOutput(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    formative_assessments: List[FormativeAssessmentItem]
+    summative_assessment: SummativeAssessment
+    self_assessment: Dict[str, Any] = Field(default_factory=dict)
+    evaluation_criteria: List[str] = Field(default_factory=list)
+
+class QualityScores(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    curriculum_alignment: float
+    content_quality: float
+    engagement_level: float
+    assessment_effectiveness: float
+    pedagogical_soundness: float
+
+class QualityReviewOutput(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    quality_scores: QualityScores
+    overall_score: float
+    strengths: List[str] = Field(default_factory=list)
+    areas_for_improvement: List[str] = Field(default_factory=list)
+    detailed_feedback: str = ""
+    recommendations: List[str] = Field(default_factory=list)
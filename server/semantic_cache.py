@@ -0,0 +1,165 @@
+import itertools
+import logging
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .coalesce import content_key
+from .metrics import PipelineMetrics, get_pipeline_metrics
+from .models import LessonRequest
+from .retrieval import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Request fields that must match exactly for a cached result to be reused, per cache kind;
+# similarity is only measured on the topic and subtopics
+EXACT_FIELDS = {
+    "curriculum": ("subject", "grade_level", "difficulty_level", "curriculum_document_ids"),
+    "lesson": ("subject", "grade_level", "difficulty_level", "estimated_duration", "learning_style", "curriculum_document_ids"),
+}
+
+
+def _stem(token: str) -> str:
+    """Strip a plural "s" so "roots" and "root" hash alike."""
+    return token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token
+
+
+def request_features(request: LessonRequest) -> List[str]:
+    """Terms describing what a request is about: topic words (counted twice), subtopic words and in-phrase bigrams."""
+    features = []
+    for phrase, weight in [(request.topic, 2)] + [(subtopic, 1) for subtopic in request.subtopics]:
+        tokens = [_stem(token) for token in tokenize(phrase)]
+        terms = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+        features.extend(terms * weight)
+    return features
+
+
+class HashingVectorizer:
+    """Maps term lists to L2-normalized vectors with the signed hashing trick; no vocabulary to fit or store."""
+
+    def __init__(self, n_features: int = 2048):
+        self.n_features = n_features
+
+    def transform(self, terms: List[str]) -> np.ndarray:
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        for term in terms:
+            # crc32 is stable across processes, unlike hash()
+            hashed = zlib.crc32(term.encode("utf-8"))
+            vector[hashed % self.n_features] += 1.0 if hashed & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+class SemanticHit:
+    """A cached result reused for a similar request."""
+
+    def __init__(self, value: Any, similarity: float, matched: LessonRequest):
+        self.value = value
+        self.similarity = similarity
+        self.matched = matched
+
+
+class SemanticCache:
+    """Near-duplicate cache of stage results keyed by the meaning of the request.
+
+    Entries live in a preallocated NumPy matrix of max_entries hashed request vectors.
+    A lookup compares the request to the entries that match it exactly on the kind's
+    EXACT_FIELDS (same subject, grade, difficulty, ...) by cosine similarity, and reuses
+    the best entry scoring at least `threshold`. When full, the least recently used entry
+    is evicted, along with its partition once that has no entries left. Hits add the time it took to produce the entry to the seconds saved.
+    """
+
+    def __init__(self, kind: str, threshold: float = 0.8, max_entries: int = 1000, n_features: int = 2048, metrics: Optional[PipelineMetrics] = None):
+        if kind not in EXACT_FIELDS:
+            raise ValueError(f"kind must be one of {', '.join(EXACT_FIELDS)}")
+        self.kind = kind
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.vectorizer = HashingVectorizer(n_features)
+        self.metrics = metrics or get_pipeline_metrics()
+        self._vectors = np.zeros((max_entries, n_features), dtype=np.float32)
+        self._partitions = np.full(max_entries, -1, dtype=np.int64)  # -1 marks a free row
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        # Exact-field partitions with at least one entry, keyed both ways
+        self._partition_ids: Dict[str, int] = {}
+        self._partition_keys: Dict[int, str] = {}
+        self._next_partition = itertools.count()
+        self._entries: List[Optional[Tuple[LessonRequest, Any, float]]] = [None] * max_entries
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.seconds_saved = 0.0
+
+    def _partition(self, request: LessonRequest) -> str:
+        fields = request.model_dump(include=set(EXACT_FIELDS[self.kind]))
+        normalized = {name: " ".join(str(value).split()).casefold() if isinstance(value, str) else value for name, value in fields.items()}
+        return content_key(normalized)
+
+    def lookup(self, request: LessonRequest) -> Optional[SemanticHit]:
+        """The cached result of the most similar earlier request, or None below the threshold."""
+        vector = self.vectorizer.transform(request_features(request))
+        with self._lock:
+            self.lookups += 1
+            partition = self._partition_ids.get(self._partition(request))
+            row = None
+            if partition is not None:
+                candidates = np.flatnonzero(self._partitions == partition)
+                if len(candidates):
+                    similarities = self._vectors[candidates] @ vector
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.threshold:
+                        row, similarity = int(candidates[best]), float(similarities[best])
+            if row is None:
+                self.metrics.semantic_cache_lookups.inc(kind=self.kind, outcome="miss")
+                return None
+            matched, value, cost_seconds = self._entries[row]
+            self._last_used[row] = time.monotonic()
+            self.hits += 1
+            self.seconds_saved += cost_seconds
+        self.metrics.semantic_cache_lookups.inc(kind=self.kind, outcome="hit")
+        self.metrics.semantic_cache_seconds_saved.inc(cost_seconds, kind=self.kind)
+        logger.info(f"Semantic {self.kind} cache hit for '{request.topic}' (matched '{matched.topic}', similarity {similarity:.2f})")
+        return SemanticHit(value, similarity, matched)
+
+    def store(self, request: LessonRequest, value: Any, cost_seconds: float = 0.0):
+        """Cache the result of a request, which took cost_seconds to produce."""
+        vector = self.vectorizer.transform(request_features(request))
+        with self._lock:
+            key = self._partition(request)
+            partition = self._partition_ids.get(key)
+            if partition is None:
+                partition = next(self._next_partition)
+                self._partition_ids[key] = partition
+                self._partition_keys[partition] = key
+            free = np.flatnonzero(self._partitions == -1)
+            if len(free):
+                row = int(free[0])
+            else:
+                row = int(np.argmin(self._last_used))
+                self.evictions += 1
+                evicted = int(self._partitions[row])
+                self._partitions[row] = -1
+                if evicted != partition and not np.any(self._partitions == evicted):
+                    del self._partition_ids[self._partition_keys.pop(evicted)]
+            self._vectors[row] = vector
+            self._partitions[row] = partition
+            self._last_used[row] = time.monotonic()
+            self._entries[row] = (request, value, cost_seconds)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._partitions != -1))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return lookups, hits, hit rate, API seconds saved, entries and evictions."""
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "seconds_saved": self.seconds_saved,
+            "entries": len(self),
+            "evictions": self.evictions
+        }
@@ -1,114 +1,345 @@
 import asyncio
+import copy
+import hashlib
+import itertools
 import json
 import logging
-from typing import Dict, Any, List, Optional
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, List, Optional, Set, Tuple
 from datetime import datetime
 import os
-from .agents import CurriculumExpertAgent, ContentCreatorAgent, AssessmentAgent, QualityReviewAgent
-from .models import LessonRequest, LessonResponse, LessonMetadata, LessonComponent, GenerationProgress
+import time
+import uuid
+from .agents import OpenAIAgent, CurriculumExpertAgent, ContentCreatorAgent, AssessmentAgent, QualityReviewAgent, PartialCallback
+from .batch import LessonBatch
+from .cache import MemoryCacheTier, ResponseCache, SQLiteCacheTier
+from .client import OpenAIClient
+from .coalesce import SingleFlight, content_key, current_stage_flights, request_key
+from .config import LessonServiceConfig
+from .documents import PDFExtractor, PageProgressCallback, chunk_pages, get_shared_pdf_extractor
+from .jobs import JobCheckpoints
+from .metrics import current_trace, get_current_trace, get_pipeline_metrics
+from .models import LessonRequest, LessonResponse, LessonVariant, LessonVariantBundle, GenerationProgress, GenerationTrace, QualityReviewUpdate, StageTrace, StoredUpload, VariantAxis
+from .lesson_ir import ComponentIR, LessonIR, MetadataIR
+from .pipeline import Stage, StageGraph
+from .progress import ProgressBus
+from .rate_limit import RateLimiter
+from .resilience import RetryPolicy
+from .retrieval import RetrievalIndex, format_passages, get_shared_retrieval_index
+from .review import ReviewCallback, ReviewSampler
+from .routing import ModelRouter
+from .semantic_cache import SemanticCache
+from .sessions import GenerationSession, GenerationCancelledError, ProgressCallback
+from .variants import expand_variants
 
 logger = logging.getLogger(__name__)
 
+# Bump when extraction output changes so cached results of older versions are ignored
+EXTRACTION_VERSION = 1
+
+# Provisional order of content sections emitted while streaming; the final order is set by _compile_lesson_components
+PARTIAL_COMPONENT_ORDER = {"introduction": 1, "main_content": 2, "activities": 3, "wrap_up": 5}
+
 class LessonGenerationService:
     """Service that orchestrates the multi-agent lesson generation workflow."""
     
-    def __init__(self, openai_api_key: str):
-        """Initialize the lesson generation service with OpenAI API key."""
+    def __init__(
+        self,
+        openai_api_key: str,
+        response_cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        client: Optional[OpenAIClient] = None,
+        retry_policies: Optional[Dict[str, RetryPolicy]] = None,
+        config: Optional[LessonServiceConfig] = None
+    ):
+        """Initialize the lesson generation service.
+        
+        The API client is created once here (unless one is injected) and shared by all
+        four agents, along with the optional response cache and rate limiter.
+        retry_policies maps agent names (e.g. "ContentCreator") to their RetryPolicy.
+        config sets up grounding, model routing, coalescing, review and the semantic caches.
+        """
+        config = config or LessonServiceConfig()
+        self.config = config
         self.openai_api_key = openai_api_key
-        self.curriculum_agent = CurriculumExpertAgent(openai_api_key)
-        self.content_agent = ContentCreatorAgent(openai_api_key)
-        self.assessment_agent = AssessmentAgent(openai_api_key)
-        self.quality_agent = QualityReviewAgent(openai_api_key)
+        self.response_cache = response_cache
+        self.client = client or OpenAIClient(openai_api_key)
+        self.metrics = get_pipeline_metrics()
+        retry_policies = retry_policies or {}
+        agent_options = {"cache": response_cache, "rate_limiter": rate_limiter, "client": self.client}
+        self.model_router = config.model_router or ModelRouter()
+        
+        # One agent per model tier for each tiered stage, cheapest first
+        self.stage_agents: Dict[str, List[OpenAIAgent]] = {}
+        for stage, agent_class, agent_name in (
+            ("curriculum", CurriculumExpertAgent, "CurriculumExpert"),
+            ("content", ContentCreatorAgent, "ContentCreator"),
+            ("assessment", AssessmentAgent, "AssessmentAgent")
+        ):
+            self.stage_agents[stage] = [
+                agent_class(openai_api_key, model=model, retry_policy=retry_policies.get(agent_name), **agent_options)
+                for model in self.model_router.models(agent_name)
+            ]
+        self.curriculum_agent = self.stage_agents["curriculum"][0]
+        self.content_agent = self.stage_agents["content"][0]
+        self.assessment_agent = self.stage_agents["assessment"][0]
+        self.quality_agent = QualityReviewAgent(
+            openai_api_key, model=self.model_router.models("QualityReviewAgent")[0],
+            retry_policy=retry_policies.get("QualityReviewAgent"), **agent_options
+        )
+        self.retrieval_index = config.retrieval_index
+        self.reference_top_k = config.reference_top_k
+        self.reference_char_budget = config.reference_char_budget
         
-        # Progress tracking
-        self.current_session_id = None
+        # Default progress sink for sessions started without their own, and the sessions in flight
         self.progress_callback = None
+        self.progress_bus = ProgressBus()
+        self.sessions: Dict[int, GenerationSession] = {}
+        # Ids for sessions the caller did not number; negative so they never collide with stored lesson ids
+        self._session_ids = itertools.count(-1, -1)
+        
+        # In-flight generations and agent stages shared by identical requests
+        self.coalesce = config.coalesce
+        self.lesson_flights = SingleFlight("lesson", self.metrics)
+        self.stage_flights = SingleFlight("stage", self.metrics)
+        self._shared_sessions: Dict[str, GenerationSession] = {}
+        
+        # Quality review policy and the background reviews still running
+        self.review_mode = config.review_mode
+        self.review_sampler = config.review_sampler or ReviewSampler()
+        self.review_callback = config.review_callback
+        self._review_tasks: Set[asyncio.Task] = set()
+        
+        # Near-duplicate caches of curriculum analyses and finished lessons (disabled when None)
+        self.curriculum_cache = config.curriculum_cache
+        self.lesson_cache = config.lesson_cache
+    
+    async def aclose(self):
+        """Finish background reviews, deliver queued progress events and release pooled API connections."""
+        if self._review_tasks:
+            await asyncio.gather(*self._review_tasks, return_exceptions=True)
+        await self.progress_bus.aclose()
+        await self.client.aclose()
+    
+    def semantic_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit rates and API seconds saved of the enabled near-duplicate caches."""
+        caches = {"curriculum": self.curriculum_cache, "lesson": self.lesson_cache}
+        return {kind: cache.stats() for kind, cache in caches.items() if cache is not None}
+    
+    def _semantic_lookup(self, cache: Optional[SemanticCache], request: LessonRequest) -> Optional[Any]:
+        """A copy of the cached result of a similar request, if the cache is enabled and the request allows it."""
+        if cache is None or request.bypass_cache:
+            return None
+        hit = cache.lookup(request)
+        return copy.deepcopy(hit.value) if hit is not None else None
+    
+    def _semantic_store(self, cache: Optional[SemanticCache], request: LessonRequest, value: Any, cost_seconds: float):
+        if cache is not None and not request.bypass_cache:
+            cache.store(request, copy.deepcopy(value), cost_seconds)
+    
+    def allocate_session_ids(self, count: int) -> List[int]:
+        """Reserve `count` session ids unique within this service."""
+        return [next(self._session_ids) for _ in range(count)]
+    
+    def set_review_callback(self, callback: Optional[ReviewCallback]):
+        """Set the hook that receives the quality score and feedback of background reviews."""
+        self.review_callback = callback
     
     def set_progress_callback(self, callback):
-        """Set callback function for progress updates."""
+        """Set the default callback for progress updates of sessions started without their own."""
         self.progress_callback = callback
     
-    async def _update_progress(self, session_id: int, progress: int, current_agent: str, message: str = "", status: str = "in_progress"):
-        """Update generation progress."""
-        if self.progress_callback:
-            progress_data = GenerationProgress(
-                session_id=session_id,
-                progress=progress,
-                current_agent=current_agent,
-                status=status,
-                message=message
-            )
-            await self.progress_callback(progress_data)
+    def cancel_session(self, session_id: int, reason: str = "cancelled by user") -> bool:
+        """Cancel an in-flight generation; returns False if no such session is running."""
+        session = self.sessions.get(session_id)
+        return session.cancel(reason) if session is not None else False
     
-    async def generate_lesson(self, request: LessonRequest, session_id: int) -> LessonResponse:
-        """Generate a complete lesson using the multi-agent workflow."""
+    def _update_progress(self, session: GenerationSession, progress: int, current_agent: str, message: str = "", status: str = "in_progress", partial_component: Optional[Dict[str, Any]] = None):
+        """Publish generation progress, optionally carrying a lesson component that has just finished streaming.
+
+        The event is handed to the progress bus, so the pipeline never waits on the callback.
+        A session shared by coalesced requests publishes to each of its followers instead.
+        """
+        session.progress = progress
+        if partial_component is not None:
+            session.partial_components[partial_component["component_type"]] = partial_component
+        for target in session.followers or [session]:
+            if target.progress_callback:
+                progress_data = GenerationProgress(
+                    session_id=target.session_id,
+                    progress=progress,
+                    current_agent=current_agent,
+                    status=status,
+                    message=message,
+                    partial_component=partial_component
+                )
+                self.progress_bus.publish(progress_data, target.progress_callback)
+    
+    async def generate_lesson(
+        self,
+        request: LessonRequest,
+        session_id: int,
+        progress_callback: Optional[ProgressCallback] = None,
+        timeout: Optional[float] = None,
+        checkpoints: Optional[JobCheckpoints] = None
+    ) -> LessonResponse:
+        """Generate a complete lesson using the multi-agent workflow.
+        
+        Each call runs in its own GenerationSession, so concurrent calls on one service
+        never share state. Progress goes to progress_callback (or the service default).
+        The session can be stopped with cancel_session(), and is stopped automatically
+        after `timeout` seconds; either raises GenerationCancelledError.
+        With checkpoints, every finished agent stage is saved and stages saved by an
+        earlier attempt are not run again. Otherwise, unless the request bypasses the cache, it joins an identical request
+        already generating (see _join_generation).
+        """
+        if session_id in self.sessions:
+            raise ValueError(f"Session {session_id} is already generating")
+        session = GenerationSession(session_id, progress_callback or self.progress_callback, timeout)
+        self.sessions[session_id] = session
         try:
-            self.current_session_id = session_id
-            
-            # Step 1: Curriculum Analysis (0-25%)
-            await self._update_progress(session_id, 5, "CurriculumExpert", "Starting curriculum analysis...")
-            
-            curriculum_input = {
-                "subject": request.subject,
-                "grade_level": request.grade_level,
-                "topic": request.topic,
-                "subtopics": request.subtopics,
-                "difficulty_level": request.difficulty_level
-            }
-            
-            curriculum_analysis = await self.curriculum_agent.process(curriculum_input)
-            await self._update_progress(session_id, 25, "CurriculumExpert", "Curriculum analysis completed")
-            
-            # Step 2: Content Generation (25-60%)
-            await self._update_progress(session_id, 30, "ContentCreator", "Generating lesson content...")
-            
-            content_input = {
-                **curriculum_input,
-                "curriculum_analysis": curriculum_analysis,
-                "learning_objectives": curriculum_analysis.get("learning_objectives", [])
-            }
-            
-            lesson_content = await self.content_agent.process(content_input)
-            await self._update_progress(session_id, 60, "ContentCreator", "Lesson content generated")
-            
-            # Step 3: Assessment Creation (60-80%)
-            await self._update_progress(session_id, 65, "AssessmentAgent", "Creating assessments...")
-            
-            assessment_input = {
-                **curriculum_input,
-                "learning_objectives": curriculum_analysis.get("learning_objectives", [])
-            }
-            
-            assessments = await self.assessment_agent.process(assessment_input)
-            await self._update_progress(session_id, 80, "AssessmentAgent", "Assessments created")
+            if self.coalesce and checkpoints is None and not request.bypass_cache:
+                return await session.start(self._join_generation(request, session))
+            return await session.start(self._run_session(request, session, checkpoints))
+        except asyncio.CancelledError:
+            if not session.cancelled:
+                raise
+            raise GenerationCancelledError(session_id, session.cancel_reason)
+        finally:
+            session.close()
+            self.sessions.pop(session_id, None)
+    
+    async def _join_generation(self, request: LessonRequest, session: GenerationSession) -> LessonResponse:
+        """Wait for the shared generation of this request, starting it if none is in flight.
+        
+        Requests are matched on their canonical form (case, whitespace and subtopic order
+        don't matter). The shared generation runs in a session of its own whose progress and
+        streamed components are published to every waiting session; a waiter joining late
+        first gets the progress and components so far. Cancelling one waiter leaves the
+        generation running for the others. Each waiter gets its own deep copy of the lesson,
+        with its session id on the trace.
+        """
+        key = request_key(request)
+        shared = self._shared_sessions.get(key)
+        if shared is None:
+            shared = GenerationSession(session.session_id)
+            self._shared_sessions[key] = shared
+        elif shared.progress:
+            self._update_progress(session, shared.progress, "RequestCoalescer", "Joined an identical generation already in progress")
+            for component in shared.partial_components.values():
+                self._update_progress(session, shared.progress, "RequestCoalescer", f"{component['component_type']} ready", partial_component=component)
+        shared.followers.append(session)
+        
+        async def run_shared() -> LessonResponse:
+            try:
+                return await self._run_session(request, shared)
+            finally:
+                if self._shared_sessions.get(key) is shared:
+                    del self._shared_sessions[key]
+        
+        try:
+            lesson = await self.lesson_flights.run(key, run_shared)
+        except asyncio.CancelledError:
+            if session.cancelled:
+                self._update_progress(session, shared.progress, "Cancelled", f"Generation cancelled: {session.cancel_reason}", "cancelled")
+            raise
+        finally:
+            shared.followers.remove(session)
+            # The shared run may have been cancelled before it started and cleaned up after itself
+            if not shared.followers and key not in self.lesson_flights and self._shared_sessions.get(key) is shared:
+                del self._shared_sessions[key]
+        # Each waiter gets its own copy so the storage layer can assign it an id and edit it independently
+        lesson = lesson.model_copy(deep=True)
+        if lesson.trace is not None:
+            lesson.trace.session_id = session.session_id
+        return lesson
+    
+    async def _coalesce_stage(
+        self,
+        agent: OpenAIAgent,
+        stage_input: Dict[str, Any],
+        on_partial: Optional[PartialCallback] = None
+    ) -> Dict[str, Any]:
+        """Run an agent stage, sharing the call with any in-flight stage of the same agent and model on identical input.
+        
+        Within a variant bundle, the stage is shared with every variant of the bundle
+        that has identical input, whether or not that stage is still running. The
+        streamed partial results of a shared call reach every caller's on_partial.
+        """
+        def call(partial_callback: Optional[PartialCallback]) -> Awaitable[Dict[str, Any]]:
+            return agent.process(stage_input, on_partial=partial_callback)
+        
+        bundle_flights = current_stage_flights.get()
+        if bundle_flights is not None:
+            flights = bundle_flights.setdefault(agent.name, SingleFlight("variant", self.metrics, remember=True))
+        elif not self.coalesce or stage_input.get("bypass_cache"):
+            return await call(on_partial)
+        else:
+            flights = self.stage_flights
+        return await flights.run_streaming(content_key(agent.name, agent.model, stage_input), call, on_partial)
+    
+    async def _run_session(
+        self,
+        request: LessonRequest,
+        session: GenerationSession,
+        checkpoints: Optional[JobCheckpoints] = None
+    ) -> LessonResponse:
+        """Run the workflow for one session.
+        
+        Stage and agent call timings are collected in a GenerationTrace attached to the
+        returned lesson and recorded in the pipeline metrics.
+        """
+        trace = GenerationTrace(session_id=session.session_id)
+        trace_token = current_trace.set(trace)
+        started = time.monotonic()
+        graph = None
+        try:
+            cached_lesson = self._semantic_lookup(self.lesson_cache, request)
+            if cached_lesson is not None:
+                trace.semantic_cache_hit = True
+                self._finish_trace(trace, None, started, "completed")
+                lesson_response = self._reuse_lesson(cached_lesson, request, trace)
+                self._update_progress(session, 100, "SemanticCache", "Reused the lesson of a similar request", "completed")
+                return lesson_response
             
-            # Step 4: Compile Lesson Components
-            await self._update_progress(session_id, 85, "LessonCompiler", "Compiling lesson components...")
+            curriculum_input = self._curriculum_input(request)
             
-            components = self._compile_lesson_components(lesson_content, assessments)
+            async def on_content_partial(key: str, value: Any):
+                component = self._build_partial_component(key, value)
+                if component is not None:
+                    self._update_progress(
+                        session, graph.progress, "ContentCreator",
+                        f"{component['component_type']} ready", partial_component=component
+                    )
             
-            # Step 5: Quality Review (80-95%)
-            await self._update_progress(session_id, 90, "QualityReviewAgent", "Reviewing lesson quality...")
+            restored = await asyncio.to_thread(checkpoints.load) if checkpoints is not None else {}
+            if restored:
+                logger.info(f"Session {session.session_id} resuming after stages {', '.join(sorted(restored))}")
+            generate_curriculum = "curriculum" not in restored
+            if generate_curriculum:
+                cached_curriculum = self._semantic_lookup(self.curriculum_cache, request)
+                if cached_curriculum is not None:
+                    restored["curriculum"] = cached_curriculum
+                    generate_curriculum = False
+            review_mode = self.review_mode if self.review_sampler.should_review(request) else None
+            graph = self._build_stage_graph(request, curriculum_input, on_content_partial, checkpoints, restored, include_review=review_mode == "inline")
             
-            lesson_data = {
-                "subject": request.subject,
-                "grade_level": request.grade_level,
-                "topic": request.topic,
-                "subtopics": request.subtopics,
-                "curriculum_analysis": curriculum_analysis,
-                "lesson_content": lesson_content,
-                "assessments": assessments,
-                "components": components
-            }
+            async def report(progress: int, current_agent: str, message: str):
+                self._update_progress(session, progress, current_agent, message)
             
-            quality_review = await self.quality_agent.process(lesson_data)
-            await self._update_progress(session_id, 95, "QualityReviewAgent", "Quality review completed")
+            # Steps 1-5: curriculum -> {content, assessment} -> compile -> review (5-95%)
+            results = await graph.run(report)
+            if "escalate" in results:
+                results = {**results, **results["escalate"]}
+            curriculum_analysis = results["curriculum"]
+            components = results["compile"]
+            quality_review = results.get("review", {})
             
             # Step 6: Final Assembly
-            await self._update_progress(session_id, 98, "LessonAssembler", "Finalizing lesson...")
+            self._update_progress(session, 98, "LessonAssembler", "Finalizing lesson...")
+            self._finish_trace(trace, graph, started, "completed")
             
             # Create lesson metadata
-            metadata = LessonMetadata(
+            metadata = MetadataIR(
                 subject=request.subject,
                 grade_level=request.grade_level,
                 topic=request.topic,
@@ -121,112 +352,469 @@ class LessonGenerationService:
                 target_skills=curriculum_analysis.get("target_skills", [])
             )
             
-            # Generate lesson title
-            title = f"{request.topic} - {request.subject} Lesson"
-            
-            # Create final lesson response
-            lesson_response = LessonResponse(
+            # Create final lesson response; converting the IR validates the agent-derived fields
+            lesson_response = LessonIR(
                 id=0,  # Will be set by storage layer
-                title=title,
+                title=self._lesson_title(request),
                 metadata=metadata,
                 components=components,
                 quality_score=quality_review.get("overall_score"),
                 feedback=quality_review.get("recommendations", []),
                 version="1.0",
-                created_at=datetime.now()
-            )
+                created_at=datetime.now(),
+                trace=trace
+            ).to_response()
             
-            await self._update_progress(session_id, 100, "Complete", "Lesson generation completed successfully", "completed")
+            self._update_progress(session, 100, "Complete", "Lesson generation completed successfully", "completed")
+            # Cache the curriculum analysis only now, after the quality gate may have replaced it
+            if generate_curriculum:
+                self._semantic_store(self.curriculum_cache, request, curriculum_analysis, graph.timings["curriculum"][1])
+            self._semantic_store(self.lesson_cache, request, lesson_response, trace.total_seconds)
+            
+            if review_mode == "background":
+                self._start_background_review(request, results, session)
+            else:
+                self.metrics.quality_reviews.inc(mode=self.review_mode, outcome="reviewed" if review_mode else "skipped")
             
             return lesson_response
             
+        except asyncio.CancelledError:
+            self._finish_trace(trace, graph, started, "cancelled")
+            reason = session.cancel_reason or "cancelled"
+            self._update_progress(session, graph.progress if graph else 0, "Cancelled", f"Generation cancelled: {reason}", "cancelled")
+            raise
         except Exception as e:
             logger.error(f"Lesson generation failed: {str(e)}")
-            if self.progress_callback:
-                await self._update_progress(session_id, 0, "Error", f"Generation failed: {str(e)}", "failed")
+            self._finish_trace(trace, graph, started, "failed")
+            self._update_progress(session, 0, "Error", f"Generation failed: {str(e)}", "failed")
             raise
+        finally:
+            current_trace.reset(trace_token)
+    
+    def _lesson_title(self, request: LessonRequest) -> str:
+        return f"{request.topic} - {request.subject} Lesson"
+    
+    def _reuse_lesson(self, lesson: LessonResponse, request: LessonRequest, trace: GenerationTrace) -> LessonResponse:
+        """A lesson cached for a similar request, retitled and relabelled for this request, with this session's trace."""
+        metadata = lesson.metadata.model_copy(update={
+            field: getattr(request, field)
+            for field in ("subject", "grade_level", "topic", "subtopics", "difficulty_level", "estimated_duration")
+        })
+        return lesson.model_copy(update={"id": 0, "title": self._lesson_title(request), "metadata": metadata, "created_at": datetime.now(), "trace": trace})
+    
+    def _curriculum_input(self, request: LessonRequest) -> Dict[str, Any]:
+        """Input of the curriculum analysis; the other agent stages extend it."""
+        return {
+            "subject": request.subject,
+            "grade_level": request.grade_level,
+            "topic": request.topic,
+            "subtopics": request.subtopics,
+            "difficulty_level": request.difficulty_level,
+            "reference_material": self._retrieve_reference_material(request),
+            "bypass_cache": request.bypass_cache
+        }
+    
+    def _retrieve_reference_material(self, request: LessonRequest) -> str:
+        """Passages of the request's curriculum documents most relevant to its topic and subtopics."""
+        if not request.curriculum_document_ids:
+            return ""
+        index = self.retrieval_index if self.retrieval_index is not None else get_shared_retrieval_index()
+        query = " ".join([request.subject, request.topic, *request.subtopics])
+        passages = index.search(query, document_ids=request.curriculum_document_ids, top_k=self.reference_top_k)
+        if not passages:
+            logger.warning(f"No indexed passages found for curriculum documents {request.curriculum_document_ids}")
+        return format_passages(passages, self.reference_char_budget)
+    
+    def _finish_trace(self, trace: GenerationTrace, graph: Optional[StageGraph], started: float, status: str):
+        """Complete the session trace with stage timings and record them in the pipeline metrics."""
+        trace.total_seconds = time.monotonic() - started
+        if graph is not None:
+            for name, (offset, seconds) in sorted(graph.timings.items(), key=lambda item: item[1][0]):
+                trace.stages.append(StageTrace(name=name, agent=graph.stages[name].agent_name, started_offset_seconds=offset, wall_seconds=seconds))
+                self.metrics.stage_seconds.observe(seconds, stage=name)
+        self.metrics.generation_seconds.observe(trace.total_seconds, status=status)
+    
+    def generate_batch(self, requests: List[LessonRequest], concurrency: int = 4, session_ids: Optional[List[int]] = None) -> LessonBatch:
+        """Generate many lessons with bounded concurrency.
+        
+        Iterate the returned batch with `async for` to receive each BatchLessonResult as it
+        finishes; `batch.stats()` reports aggregate throughput.
+        """
+        return LessonBatch(self, requests, concurrency=concurrency, session_ids=session_ids)
     
-    def _compile_lesson_components(self, lesson_content: Dict[str, Any], assessments: Dict[str, Any]) -> List[Dict[str, Any]]:
+    async def generate_variants(
+        self,
+        base: LessonRequest,
+        axes: List[VariantAxis],
+        progress_callback: Optional[ProgressCallback] = None,
+        session_ids: Optional[List[int]] = None
+    ) -> LessonVariantBundle:
+        """Generate the base request in every combination of the axis values (difficulty, duration, learning style).
+        
+        The variants run concurrently, each in its own session. Within the bundle, a stage
+        runs once per distinct input: the curriculum analysis and assessments are computed
+        once per difficulty level and shared by variants that only differ in duration or
+        learning style. The shared analysis streams its learning objectives to every such
+        variant, so all of them start content and assessment speculatively. Session ids
+        default to fresh ids from allocate_session_ids. A failed variant is returned with
+        its error.
+        """
+        variants = expand_variants(base, axes)
+        if session_ids is not None and len(session_ids) != len(variants):
+            raise ValueError("session_ids must match the number of variants")
+        session_ids = list(session_ids) if session_ids is not None else self.allocate_session_ids(len(variants))
+        started = time.monotonic()
+        
+        bundle_flights: Dict[str, SingleFlight] = {}
+        flights_token = current_stage_flights.set(bundle_flights)
+        try:
+            outcomes = await asyncio.gather(*(
+                self.generate_lesson(request, session_id, progress_callback)
+                for (_, request), session_id in zip(variants, session_ids)
+            ), return_exceptions=True)
+        finally:
+            current_stage_flights.reset(flights_token)
+        
+        results = []
+        for (settings, request), session_id, outcome in zip(variants, session_ids, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error(f"Variant {settings} of {base.topic} failed: {str(outcome)}")
+                results.append(LessonVariant(settings=settings, session_id=session_id, request=request, error=str(outcome) or type(outcome).__name__))
+            else:
+                results.append(LessonVariant(settings=settings, session_id=session_id, request=request, lesson=outcome))
+        return LessonVariantBundle(
+            base=base,
+            variants=results,
+            stage_runs={agent_name: flights.leaders for agent_name, flights in bundle_flights.items()},
+            elapsed_seconds=time.monotonic() - started
+        )
+    
+    def _build_stage_graph(
+        self,
+        request: LessonRequest,
+        curriculum_input: Dict[str, Any],
+        on_content_partial: Optional[PartialCallback] = None,
+        checkpoints: Optional[JobCheckpoints] = None,
+        restored: Optional[Dict[str, Any]] = None,
+        include_review: bool = True
+    ) -> StageGraph:
+        """Declare the agent workflow as a stage graph.
+        
+        Content creation and assessment both depend only on the learning objectives, so
+        they start speculatively as soon as the objectives have streamed out of the
+        curriculum analysis, concurrently with each other and with the rest of that
+        analysis. Lesson content is streamed to on_content_partial one top-level
+        section at a time. Agent stages found in `restored` return the saved result;
+        the others save theirs to checkpoints when they finish. Without include_review
+        the graph ends with the compiled components.
+        """
+        loop = asyncio.get_running_loop()
+        objectives_ready = loop.create_future()
+        curriculum_done = loop.create_future()
+        restored = restored or {}
+        
+        async def save(stage: str, value: Any):
+            if checkpoints is not None:
+                await asyncio.to_thread(checkpoints.save, stage, value)
+        
+        async def on_curriculum_partial(key: str, value: Any):
+            if key == "learning_objectives" and isinstance(value, list) and not objectives_ready.done():
+                objectives_ready.set_result(value)
+        
+        async def run_curriculum(results: Dict[str, Any]) -> Dict[str, Any]:
+            try:
+                curriculum_analysis = restored.get("curriculum")
+                if curriculum_analysis is None:
+                    curriculum_analysis = await self._coalesce_stage(self.curriculum_agent, curriculum_input, on_curriculum_partial)
+                    await save("curriculum", curriculum_analysis)
+            except BaseException as e:
+                # Fail the stages waiting on the analysis with the same error, so whichever
+                # stage the graph sees first reports the real cause
+                for future in (objectives_ready, curriculum_done):
+                    if future.done():
+                        continue
+                    if isinstance(e, Exception):
+                        future.set_exception(e)
+                        future.exception()  # retrieved here; no stage may be waiting any more
+                    else:
+                        future.cancel()
+                raise
+            if not objectives_ready.done():
+                objectives_ready.set_result(curriculum_analysis.get("learning_objectives", []))
+            curriculum_done.set_result(curriculum_analysis)
+            return curriculum_analysis
+        
+        def checkpointed(stage: str, run: Callable[[Dict[str, Any]], Awaitable[Any]]) -> Callable[[Dict[str, Any]], Awaitable[Any]]:
+            async def run_checkpointed(results: Dict[str, Any]) -> Any:
+                if stage in restored:
+                    return restored[stage]
+                value = await run(results)
+                await save(stage, value)
+                return value
+            return run_checkpointed
+        
+        async def run_objectives(results: Dict[str, Any]) -> List[str]:
+            return await asyncio.shield(objectives_ready)
+        
+        async def run_content(results: Dict[str, Any]) -> Dict[str, Any]:
+            return await self._speculate("content", results["objectives"], curriculum_done, lambda curriculum_analysis: self._run_content(
+                self.content_agent, request, curriculum_input, curriculum_analysis, on_content_partial
+            ))
+        
+        async def run_assessment(results: Dict[str, Any]) -> Dict[str, Any]:
+            return await self._speculate("assessment", results["objectives"], curriculum_done, lambda curriculum_analysis: self._run_assessment(
+                self.assessment_agent, curriculum_input, curriculum_analysis
+            ))
+        
+        async def run_compile(results: Dict[str, Any]) -> List[ComponentIR]:
+            return self._compile_lesson_components(results["content"], results["assessment"])
+        
+        async def run_review(results: Dict[str, Any]) -> Dict[str, Any]:
+            return await self._run_review(request, results)
+        
+        async def run_escalate(results: Dict[str, Any]) -> Dict[str, Any]:
+            final = restored.get("escalate")
+            if final is None:
+                final = await self._escalate(request, curriculum_input, results)
+                # Compiled components are cheap to rebuild, so only the agent results are saved
+                await save("escalate", {name: value for name, value in final.items() if name != "compile"})
+            else:
+                final = {**final, "compile": self._compile_lesson_components(final["content"], final["assessment"])}
+            return final
+        
+        stages = [
+            Stage("curriculum", run_curriculum, agent_name="CurriculumExpert", weight=10,
+                  start_message="Starting curriculum analysis...", end_message="Curriculum analysis completed"),
+            Stage("objectives", run_objectives, agent_name="CurriculumExpert", weight=10,
+                  end_message="Learning objectives defined"),
+            Stage("content", checkpointed("content", run_content), depends_on=["objectives"], agent_name="ContentCreator", weight=35,
+                  start_message="Generating lesson content...", end_message="Lesson content generated"),
+            Stage("assessment", checkpointed("assessment", run_assessment), depends_on=["objectives"], agent_name="AssessmentAgent", weight=20,
+                  start_message="Creating assessments...", end_message="Assessments created"),
+            Stage("compile", run_compile, depends_on=["content", "assessment"], agent_name="LessonCompiler", weight=5,
+                  start_message="Compiling lesson components..."),
+        ]
+        if include_review:
+            stages += [
+                Stage("review", checkpointed("review", run_review), depends_on=["curriculum", "compile"], agent_name="QualityReviewAgent", weight=10,
+                      start_message="Reviewing lesson quality...", end_message="Quality review completed"),
+                Stage("escalate", run_escalate, depends_on=["review"], agent_name="ModelRouter"),
+            ]
+        return StageGraph(stages, base_progress=5)
+    
+    async def _speculate(self, stage: str, objectives: List[str], curriculum_done: asyncio.Future, run: Callable[[Dict[str, Any]], Awaitable[Any]]) -> Any:
+        """Run a stage on the streamed learning objectives before the curriculum analysis is final.
+        
+        Once the analysis completes, its learning objectives are compared with the ones the
+        stage started from; on a mismatch the speculative run is cancelled (or discarded)
+        and the stage is restarted from the final analysis.
+        """
+        task = asyncio.ensure_future(run({"learning_objectives": objectives}))
+        try:
+            await asyncio.wait([task, curriculum_done], return_when=asyncio.FIRST_COMPLETED)
+            curriculum_analysis = await asyncio.shield(curriculum_done)
+            if curriculum_analysis.get("learning_objectives", []) == objectives:
+                self.metrics.speculations.inc(stage=stage, outcome="kept")
+                return await task
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        
+        logger.info(f"Learning objectives changed after {stage} started; restarting it")
+        self.metrics.speculations.inc(stage=stage, outcome="restarted")
+        return await run(curriculum_analysis)
+    
+    async def _run_content(
+        self,
+        agent: OpenAIAgent,
+        request: LessonRequest,
+        curriculum_input: Dict[str, Any],
+        curriculum_analysis: Dict[str, Any],
+        on_partial: Optional[PartialCallback] = None
+    ) -> Dict[str, Any]:
+        content_input = {
+            **curriculum_input,
+            "estimated_duration": request.estimated_duration,
+            "learning_style": request.learning_style,
+            "curriculum_analysis": curriculum_analysis,
+            "learning_objectives": curriculum_analysis.get("learning_objectives", [])
+        }
+        return await self._coalesce_stage(agent, content_input, on_partial)
+    
+    async def _run_assessment(self, agent: OpenAIAgent, curriculum_input: Dict[str, Any], curriculum_analysis: Dict[str, Any]) -> Dict[str, Any]:
+        assessment_input = {
+            **curriculum_input,
+            "learning_objectives": curriculum_analysis.get("learning_objectives", [])
+        }
+        return await self._coalesce_stage(agent, assessment_input)
+    
+    async def _run_review(self, request: LessonRequest, results: Dict[str, Any]) -> Dict[str, Any]:
+        lesson_data = {
+            "subject": request.subject,
+            "grade_level": request.grade_level,
+            "topic": request.topic,
+            "subtopics": request.subtopics,
+            "curriculum_analysis": results["curriculum"],
+            "lesson_content": results["content"],
+            "assessments": results["assessment"],
+            "components": [component.to_dict() for component in results["compile"]],
+            "bypass_cache": request.bypass_cache
+        }
+        return await self._coalesce_stage(self.quality_agent, lesson_data)
+    
+    def _start_background_review(self, request: LessonRequest, results: Dict[str, Any], session: GenerationSession):
+        """Review a returned lesson in a background task that outlives the session."""
+        # Followers of a shared session are detached once the lesson is returned, so capture them now
+        targets = list(session.followers) or [session]
+        task = asyncio.ensure_future(self._review_in_background(request, results, targets))
+        self._review_tasks.add(task)
+        task.add_done_callback(self._review_tasks.discard)
+    
+    async def _review_in_background(self, request: LessonRequest, results: Dict[str, Any], targets: List[GenerationSession]):
+        """Run the quality review of an already returned lesson and report its score.
+        
+        The score and feedback go to the review callback as a QualityReviewUpdate and to
+        each session's progress stream as a "reviewed" event. The quality gate's verdict is
+        recorded for the model router, but stages are never escalated: the lesson is out, so
+        failing stages count as failed on their cheap tier.
+        """
+        # The task inherited the session's context; its calls belong to no lesson's trace or bundle
+        current_trace.set(None)
+        current_stage_flights.set(None)
+        started = time.monotonic()
+        try:
+            review = await self._run_review(request, results)
+            failing = self.model_router.failing_stages(review)
+            for stage, agents in self.stage_agents.items():
+                self.model_router.record(agents[0].name, agents[0].model, stage not in failing, escalating=False)
+            score = review.get("overall_score")
+            update = {"status": "reviewed", "quality_score": score, "feedback": review.get("recommendations", []), "review": review}
+            message = f"Quality review completed: score {score}"
+            self.metrics.quality_reviews.inc(mode="background", outcome="reviewed")
+        except Exception as e:
+            logger.error(f"Background quality review failed: {str(e)}")
+            update = {"status": "failed", "error": str(e)}
+            message = f"Quality review failed: {str(e)}"
+            self.metrics.quality_reviews.inc(mode="background", outcome="failed")
+        self.metrics.stage_seconds.observe(time.monotonic() - started, stage="review")
+        
+        for session in targets:
+            if session.progress_callback:
+                self.progress_bus.publish(GenerationProgress(
+                    session_id=session.session_id,
+                    progress=100,
+                    current_agent="QualityReviewAgent",
+                    status="reviewed",
+                    message=message,
+                    error=update.get("error"),
+                    quality_score=update.get("quality_score")
+                ), session.progress_callback)
+            if self.review_callback:
+                try:
+                    await self.review_callback(QualityReviewUpdate(session_id=session.session_id, **update))
+                except Exception as e:
+                    logger.error(f"Review callback failed for session {session.session_id}: {str(e)}")
+    
+    async def _escalate(self, request: LessonRequest, curriculum_input: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+        """Quality gate: re-run stages reviewed below the router's threshold on their next model tier.
+        
+        Stages that depend on a re-run stage are re-run on their current tier, and the
+        lesson is reviewed again until it passes or no failing stage has a larger model.
+        Returns the final curriculum, content, assessment, compile and review results.
+        """
+        tiers = {stage: 0 for stage in self.stage_agents}
+        fresh = set(self.stage_agents)
+        trace = get_current_trace()
+        results = {name: results[name] for name in ("curriculum", "content", "assessment", "compile", "review")}
+        while True:
+            failing = self.model_router.failing_stages(results["review"])
+            for stage in fresh:
+                agent = self.stage_agents[stage][tiers[stage]]
+                self.model_router.record(agent.name, agent.model, stage not in failing)
+            escalate = [stage for stage in failing if tiers[stage] + 1 < len(self.stage_agents[stage])]
+            if not escalate:
+                return results
+            
+            for stage in escalate:
+                tiers[stage] += 1
+            if trace is not None:
+                trace.escalated_stages.extend(escalate)
+            logger.info(f"Quality score {results['review'].get('overall_score')} below {self.model_router.threshold}; escalating {', '.join(escalate)}")
+            
+            fresh = set(escalate)
+            if "curriculum" in fresh:
+                results["curriculum"] = await self.stage_agents["curriculum"][tiers["curriculum"]].process(curriculum_input)
+                fresh.update(("content", "assessment"))
+            reruns = {}
+            if "content" in fresh:
+                reruns["content"] = self._run_content(self.stage_agents["content"][tiers["content"]], request, curriculum_input, results["curriculum"])
+            if "assessment" in fresh:
+                reruns["assessment"] = self._run_assessment(self.stage_agents["assessment"][tiers["assessment"]], curriculum_input, results["curriculum"])
+            results.update(zip(reruns, await asyncio.gather(*reruns.values())))
+            results["compile"] = self._compile_lesson_components(results["content"], results["assessment"])
+            results["review"] = await self._run_review(request, results)
+    
+    def _build_partial_component(self, key: str, value: Any) -> Optional[Dict[str, Any]]:
+        """Compile a single streamed lesson content section into its component, if it maps to one."""
+        if key not in PARTIAL_COMPONENT_ORDER or not isinstance(value, dict):
+            return None
+        components = self._compile_lesson_components({key: value}, {})
+        if not components:
+            return None
+        component = components[0]
+        component.order = PARTIAL_COMPONENT_ORDER[key]
+        return component.to_dict()
+    
+    def _compile_lesson_components(self, lesson_content: Dict[str, Any], assessments: Dict[str, Any]) -> List[ComponentIR]:
         """Compile lesson content and assessments into structured components."""
         components = []
-        order = 1
         
         # Introduction component
         if "introduction" in lesson_content:
             intro = lesson_content["introduction"]
-            components.append({
-                "component_type": "Introduction",
-                "content": intro.get("content", ""),
-                "order": order,
-                "metadata": {
-                    "duration": intro.get("duration", "10 minutes"),
-                    "teaching_strategies": intro.get("teaching_strategies", [])
-                }
-            })
-            order += 1
+            components.append(ComponentIR("Introduction", intro.get("content", ""), len(components) + 1, {
+                "duration": intro.get("duration", "10 minutes"),
+                "teaching_strategies": intro.get("teaching_strategies", [])
+            }))
         
         # Main content component
         if "main_content" in lesson_content:
             main = lesson_content["main_content"]
-            components.append({
-                "component_type": "Main Content",
-                "content": main.get("content", ""),
-                "order": order,
-                "metadata": {
-                    "duration": main.get("duration", "25 minutes"),
-                    "examples": main.get("examples", []),
-                    "key_concepts": main.get("key_concepts", [])
-                }
-            })
-            order += 1
+            components.append(ComponentIR("Main Content", main.get("content", ""), len(components) + 1, {
+                "duration": main.get("duration", "25 minutes"),
+                "examples": main.get("examples", []),
+                "key_concepts": main.get("key_concepts", [])
+            }))
         
         # Activities component
         if "activities" in lesson_content:
             activities = lesson_content["activities"]
-            components.append({
-                "component_type": "Interactive Activities",
-                "content": activities.get("content", ""),
-                "order": order,
-                "metadata": {
-                    "duration": activities.get("duration", "15 minutes"),
-                    "materials_needed": activities.get("materials_needed", []),
-                    "instructions": activities.get("instructions", [])
-                }
-            })
-            order += 1
+            components.append(ComponentIR("Interactive Activities", activities.get("content", ""), len(components) + 1, {
+                "duration": activities.get("duration", "15 minutes"),
+                "materials_needed": activities.get("materials_needed", []),
+                "instructions": activities.get("instructions", [])
+            }))
         
         # Assessment component
         if "formative_assessments" in assessments and assessments["formative_assessments"]:
-            assessment_content = "Formative Assessments:\n"
+            lines = ["Formative Assessments:"]
             for assessment in assessments["formative_assessments"]:
-                assessment_content += f"\n{assessment.get('type', 'Assessment')}: {assessment.get('description', '')}\n"
-                for question in assessment.get('questions', []):
-                    assessment_content += f"- {question}\n"
+                lines.append(f"\n{assessment.get('type', 'Assessment')}: {assessment.get('description', '')}")
+                lines.extend(f"- {question}" for question in assessment.get('questions', []))
             
-            components.append({
-                "component_type": "Formative Assessment",
-                "content": assessment_content,
-                "order": order,
-                "metadata": {
-                    "assessment_type": "formative",
-                    "assessments": assessments["formative_assessments"]
-                }
-            })
-            order += 1
+            components.append(ComponentIR("Formative Assessment", "\n".join(lines) + "\n", len(components) + 1, {
+                "assessment_type": "formative",
+                "assessments": assessments["formative_assessments"]
+            }))
         
         # Wrap-up component
         if "wrap_up" in lesson_content:
             wrap_up = lesson_content["wrap_up"]
-            components.append({
-                "component_type": "Conclusion",
-                "content": wrap_up.get("content", ""),
-                "order": order,
-                "metadata": {
-                    "duration": wrap_up.get("duration", "5 minutes"),
-                    "key_takeaways": wrap_up.get("key_takeaways", [])
-                }
-            })
-            order += 1
+            components.append(ComponentIR("Conclusion", wrap_up.get("content", ""), len(components) + 1, {
+                "duration": wrap_up.get("duration", "5 minutes"),
+                "key_takeaways": wrap_up.get("key_takeaways", [])
+            }))
         
         return components
 
@@ -234,30 +822,153 @@ class LessonGenerationService:
 class FileProcessingService:
     """Service for processing uploaded curriculum documents."""
     
-    def __init__(self, upload_directory: str = "uploads"):
-        """Initialize the file processing service."""
+    def __init__(
+        self,
+        upload_directory: str = "uploads",
+        extractor: Optional[PDFExtractor] = None,
+        extraction_cache: Optional[ResponseCache] = None,
+        retrieval_index: Optional[RetrievalIndex] = None,
+        max_text_chars: int = 2_000_000,
+        write_chunk_size: int = 1024 * 1024
+    ):
+        """Initialize the file processing service.
+        
+        Uploads are stored under the sha256 of their content, and extraction results are
+        cached under that hash (by default in cache/extractions.sqlite3), so a re-uploaded
+        textbook is neither stored nor parsed twice. Text extraction runs in the shared
+        PDFExtractor process pool unless one is injected. Processed documents are added
+        to retrieval_index (default: the shared index) under their content hash.
+        max_text_chars caps the text kept per document (a 300-page textbook is ~1M characters).
+        """
         self.upload_directory = upload_directory
+        self.extractor = extractor or get_shared_pdf_extractor()
+        if extraction_cache is None:
+            extraction_cache = ResponseCache(
+                memory_tier=MemoryCacheTier(max_entries=16, ttl_seconds=None),
+                disk_tier=SQLiteCacheTier("cache/extractions.sqlite3", ttl_seconds=None)
+            )
+        self.extraction_cache = extraction_cache
+        self.retrieval_index = retrieval_index if retrieval_index is not None else get_shared_retrieval_index()
+        self.max_text_chars = max_text_chars
+        self.write_chunk_size = write_chunk_size
         os.makedirs(upload_directory, exist_ok=True)
     
     async def save_uploaded_file(self, file_content: bytes, filename: str) -> str:
         """Save uploaded file and return the file path."""
-        file_path = os.path.join(self.upload_directory, filename)
+        async def chunks():
+            for offset in range(0, len(file_content), self.write_chunk_size):
+                yield file_content[offset:offset + self.write_chunk_size]
+        stored = await self.save_upload_stream(chunks(), filename)
+        return stored.file_path
+    
+    async def save_upload_stream(self, chunks: AsyncIterator[bytes], filename: str) -> StoredUpload:
+        """Write an upload chunk by chunk without blocking the event loop, hashing it as it streams in.
         
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        The file is written under a temporary name and then stored as <sha256><extension>;
+        if that content is already stored, the new copy is discarded.
+        """
+        temp_path = os.path.join(self.upload_directory, f"{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
         
-        return file_path
+        f = await asyncio.to_thread(open, temp_path, "wb")
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(f.close)
+            os.remove(temp_path)
+            raise
+        await asyncio.to_thread(f.close)
+        
+        document_id = digest.hexdigest()
+        extension = os.path.splitext(filename)[1].lower()
+        file_path = os.path.join(self.upload_directory, f"{document_id}{extension}")
+        duplicate = os.path.exists(file_path)
+        if duplicate:
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, file_path)
+        
+        return StoredUpload(document_id=document_id, file_path=file_path, original_name=filename, size=size, duplicate=duplicate)
     
-    async def process_pdf_document(self, file_path: str) -> Dict[str, Any]:
-        """Process PDF document and extract text content."""
+    async def _hash_file(self, file_path: str) -> str:
+        """sha256 of a file, read in chunks off the event loop."""
+        def read_digest() -> str:
+            digest = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(self.write_chunk_size), b""):
+                    digest.update(chunk)
+            return digest.hexdigest()
+        return await asyncio.to_thread(read_digest)
+    
+    def _extraction_key(self, document_id: str) -> str:
+        return f"extraction:{EXTRACTION_VERSION}:{self.max_text_chars}:{document_id}"
+    
+    async def index_document(self, document_id: Any, extraction: Dict[str, Any]):
+        """Add an extraction result's chunks to the retrieval index under document_id and persist it.
+        
+        Documents are indexed under their content hash automatically; call this to also make
+        one retrievable under another id, such as its curriculum_document_ids entry.
+        """
+        def add_and_save():
+            self.retrieval_index.add_document(document_id, extraction.get("chunks", []))
+            if self.retrieval_index.path is not None:
+                self.retrieval_index.save()
+        await asyncio.to_thread(add_and_save)
+    
+    async def iter_pdf_pages(self, file_path: str, on_progress: Optional[PageProgressCallback] = None) -> AsyncIterator[Tuple[int, str]]:
+        """Stream (page_number, text) pairs as pages are extracted."""
+        async for page in self.extractor.iter_pages(file_path, on_progress):
+            yield page
+    
+    async def process_pdf_document(self, file_path: str, on_progress: Optional[PageProgressCallback] = None, document_id: Optional[str] = None) -> Dict[str, Any]:
+        """Process PDF document and extract text content and retrieval chunks.
+        
+        on_progress(pages_done, page_count) is awaited after every extracted page.
+        Results are cached under the content hash (document_id, computed if not given).
+        """
         try:
-            # This would use PyPDF2 or similar library to extract text
-            # For now, return a placeholder
-            return {
-                "extracted_text": "PDF content would be extracted here",
-                "page_count": 1,
+            document_id = document_id or await self._hash_file(file_path)
+            cache_key = self._extraction_key(document_id)
+            cached = await asyncio.to_thread(self.extraction_cache.get, cache_key)
+            if cached is not None:
+                result = json.loads(cached)
+                if on_progress is not None:
+                    await on_progress(result["page_count"], result["page_count"])
+                if document_id not in self.retrieval_index:
+                    await self.index_document(document_id, result)
+                return result
+            
+            pages: List[Tuple[int, str]] = []
+            length = 0
+            page_count = 0
+            truncated = False
+            async for page_number, text in self.iter_pdf_pages(file_path, on_progress):
+                page_count = page_number
+                remaining = self.max_text_chars - length
+                if len(text) > remaining:
+                    truncated = True
+                    text = text[:max(0, remaining)]
+                if not text:
+                    continue
+                pages.append((page_number, text))
+                length += len(text) + 2
+            
+            result = {
+                "document_id": document_id,
+                "extracted_text": "\n\n".join(text for _, text in pages),
+                "page_count": page_count,
+                "chunks": chunk_pages(pages),
                 "processing_status": "success"
             }
+            if truncated:
+                result["truncated"] = True
+            await asyncio.to_thread(self.extraction_cache.set, cache_key, json.dumps(result, ensure_ascii=False))
+            await self.index_document(document_id, result)
+            return result
         except Exception as e:
             logger.error(f"PDF processing failed: {str(e)}")
             return {
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .models import GenerationProgress
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[GenerationProgress], Awaitable[Any]]
+
+
+class GenerationCancelledError(Exception):
+    """Raised when a generation session is cancelled or runs past its deadline."""
+
+    def __init__(self, session_id: int, reason: str):
+        super().__init__(f"Session {session_id} cancelled: {reason}")
+        self.session_id = session_id
+        self.reason = reason
+
+
+class GenerationSession:
+    """Execution context of one lesson generation: its progress sink, deadline and cancellation."""
+
+    def __init__(self, session_id: int, progress_callback: Optional[ProgressCallback] = None, timeout: Optional[float] = None):
+        """Create the context. timeout is the number of seconds the session may run, or None."""
+        self.session_id = session_id
+        self.progress_callback = progress_callback
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + timeout if timeout is not None else None
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_reason: Optional[str] = None
+        self.progress = 0  # last progress published for the session
+        # Sessions waiting on this one's generation; they receive its progress instead of it
+        self.followers: List["GenerationSession"] = []
+        # Streamed lesson components published so far, by component type, replayed to late followers
+        self.partial_components: Dict[str, Dict[str, Any]] = {}
+        self._deadline_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None without a deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_reason is not None
+
+    def start(self, coroutine: Awaitable[Any]) -> asyncio.Task:
+        """Run the session's pipeline in its own task and arm the deadline."""
+        self.task = asyncio.ensure_future(coroutine)
+        if self.deadline is not None:
+            self._deadline_handle = asyncio.get_running_loop().call_later(self.remaining, self.cancel, "deadline exceeded")
+        return self.task
+
+    def cancel(self, reason: str = "cancelled by user") -> bool:
+        """Stop the session's pipeline, including in-flight agent calls. Returns False if it already finished."""
+        if self.task is None or self.task.done():
+            return False
+        if self.cancel_reason is None:
+            self.cancel_reason = reason
+            logger.info(f"Cancelling session {self.session_id}: {reason}")
+        self.task.cancel()
+        return True
+
+    def close(self):
+        """Disarm the deadline timer."""
+        if self._deadline_handle is not None:
+            self._deadline_handle.cancel()
+            self._deadline_handle = None
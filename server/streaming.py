@@ -0,0 +1,95 @@
+import json
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalJSONParser:
+    """Incremental parser that reports top-level object members as soon as they are complete.
+
+    Feed it the streamed text of a JSON object; anything before the first "{" (such as a
+    markdown fence) is skipped. Each completed member is parsed on its own, so a value
+    is emitted the moment the "," or closing "}" that ends it arrives.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._key: Optional[str] = None
+        self._segment_start: Optional[int] = None
+        self.completed: Dict[str, Any] = {}
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk of text and return the (key, value) members it completed."""
+        if self.done:
+            return []
+        self._text += chunk
+        emitted: List[Tuple[str, Any]] = []
+        text = self._text
+
+        while self._pos < len(text) and not self.done:
+            ch = text[self._pos]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+                self._mark_segment_start()
+            elif ch in "{[":
+                self._mark_segment_start()
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_member(emitted)
+                    self.done = True
+            elif self._depth == 1 and ch == ":":
+                self._key = self._parse_segment()
+            elif self._depth == 1 and ch == ",":
+                self._finish_member(emitted)
+            elif not ch.isspace():
+                self._mark_segment_start()
+            self._pos += 1
+
+        return emitted
+
+    def _mark_segment_start(self):
+        """Remember where the current top-level key or value begins."""
+        if self._depth == 1 and self._segment_start is None:
+            self._segment_start = self._pos
+
+    def _parse_segment(self) -> Any:
+        """Parse the text of the current top-level segment, up to the current position."""
+        segment = self._text[self._segment_start:self._pos] if self._segment_start is not None else ""
+        self._segment_start = None
+        try:
+            return json.loads(segment)
+        except json.JSONDecodeError:
+            logger.debug(f"Could not parse streamed JSON segment: {segment[:80]}")
+            return None
+
+    def _finish_member(self, emitted: List[Tuple[str, Any]]):
+        """Emit the member that just ended, if it has both a key and a value."""
+        key = self._key
+        self._key = None
+        if key is None or self._segment_start is None:
+            self._segment_start = None
+            return
+        value = self._parse_segment()
+        if isinstance(key, str):
+            self.completed[key] = value
+            emitted.append((key, value))
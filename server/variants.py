@@ -0,0 +1,25 @@
+import itertools
+from typing import Dict, List, Tuple
+
+from .models import LessonRequest, VariantAxis
+
+# Request fields a variant bundle can vary; stages whose input a field doesn't change stay shared
+VARIANT_FIELDS = ("difficulty_level", "estimated_duration", "learning_style")
+
+
+def expand_variants(base: LessonRequest, axes: List[VariantAxis]) -> List[Tuple[Dict[str, str], LessonRequest]]:
+    """Every combination of the axis values applied to the base request, as (settings, request) pairs."""
+    for axis in axes:
+        if axis.field not in VARIANT_FIELDS:
+            raise ValueError(f"Cannot vary '{axis.field}'; variant axes must be one of {', '.join(VARIANT_FIELDS)}")
+        if not axis.values:
+            raise ValueError(f"Variant axis '{axis.field}' has no values")
+    fields = [axis.field for axis in axes]
+    if len(set(fields)) != len(fields):
+        raise ValueError("Each field can only be varied by one axis")
+
+    variants = []
+    for values in itertools.product(*(axis.values for axis in axes)):
+        settings = dict(zip(fields, values))
+        variants.append((settings, base.model_copy(update=settings)))
+    return variants
@@ -0,0 +1,41 @@
+import asyncio
+
+from server.batch import LessonBatch
+from server.fake_llm import CANNED_RESPONSES, FakeOpenAIClient, LatencyModel
+from server.models import LessonRequest
+from server.rate_limit import RateLimiter
+from server.services import LessonGenerationService
+
+
+class InterruptingService(LessonGenerationService):
+    """Fails the lessons whose topic names an outcome and generates the others."""
+
+    async def generate_lesson(self, request, session_id):
+        if request.topic == "cancelled":
+            await asyncio.sleep(0.01)
+            raise asyncio.CancelledError()
+        if request.topic == "failed":
+            raise ValueError("agent failed")
+        return await super().generate_lesson(request, session_id)
+
+
+def request(topic):
+    return LessonRequest(subject="Mathematics", grade_level="Class 10", topic=topic, subtopics=["Roots"])
+
+
+def test_every_lesson_yields_a_result_even_when_one_is_cancelled():
+    client = FakeOpenAIClient(latencies={name: LatencyModel(0.02) for name in CANNED_RESPONSES})
+    service = InterruptingService("test", rate_limiter=RateLimiter(10 ** 6, 10 ** 9), client=client)
+    batch = LessonBatch(service, [request("Quadratics"), request("cancelled"), request("failed"), request("Polynomials")], concurrency=2)
+
+    async def collect():
+        return [result async for result in batch]
+
+    results = asyncio.run(asyncio.wait_for(collect(), timeout=5))
+    by_index = {result.index: result for result in results}
+    assert sorted(by_index) == [0, 1, 2, 3]
+    assert by_index[0].lesson is not None and by_index[3].lesson is not None
+    assert by_index[1].error == "CancelledError"
+    assert by_index[2].error == "agent failed"
+    stats = batch.stats()
+    assert (stats.completed, stats.failed) == (2, 2)
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from server.agents import CurriculumExpertAgent
+from server.budget import PromptBudgeter, PromptBudgetError, count_message_tokens
+from server.fake_llm import FakeOpenAIClient
+from server.rate_limit import RateLimiter
+
+
+class RecordingClient(FakeOpenAIClient):
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+
+    async def chat_completion(self, model, messages, temperature, max_tokens, **extra):
+        self.prompts.append((messages, max_tokens))
+        return await super().chat_completion(model, messages, temperature, max_tokens, **extra)
+
+
+def user_message(tokens):
+    return [{"role": "user", "content": "word " * tokens}]
+
+
+def agent(client):
+    return CurriculumExpertAgent("test", client=client, rate_limiter=RateLimiter(10 ** 6, 10 ** 9))
+
+
+def test_plan_flags_tight_prompts_and_rejects_overflowing_ones():
+    budgeter = PromptBudgeter("gpt-4", min_max_tokens=256, safety_margin=64)
+    messages = user_message(1000)
+    prompt_tokens = count_message_tokens(messages, "gpt-4")
+    assert not budgeter.plan(messages).overflow_risk
+    budgeter.context_window = prompt_tokens + 64 + 100
+    tight = budgeter.plan(messages)
+    assert (tight.overflow_risk, tight.max_tokens) == (True, 100)
+    assert budgeter.shortfall(messages) == 156
+    budgeter.context_window = prompt_tokens + 64
+    with pytest.raises(PromptBudgetError, match="no room for a completion"):
+        budgeter.plan(messages)
+
+
+def test_overflowing_prompt_fails_before_it_is_sent():
+    client = RecordingClient()
+    with pytest.raises(PromptBudgetError):
+        asyncio.run(agent(client)._call_openai(user_message(20000)))
+    assert client.prompts == []
+
+
+def test_reference_material_is_cut_until_the_completion_allowance_fits():
+    client = RecordingClient()
+    curriculum = agent(client)
+    reference = " ".join(f"Passage {number} about chlorophyll and light." for number in range(3000))
+    result = asyncio.run(curriculum.process({"subject": "Biology", "topic": "Photosynthesis", "reference_material": reference}))
+    assert result["learning_objectives"]
+    (messages, max_tokens), = client.prompts
+    assert max_tokens >= curriculum.budget.min_max_tokens
+    assert curriculum.budget.shortfall(messages) == 0
+    assert "Passage 0 about chlorophyll" in messages[1]["content"]
+    assert "Passage 2999" not in messages[1]["content"]
@@ -0,0 +1,203 @@
+import asyncio
+import time
+
+import pytest
+
+from server.coalesce import SingleFlight, request_key
+from server.fake_llm import CANNED_RESPONSES, FakeOpenAIClient, LatencyModel, detect_agent
+from server.models import LessonRequest, VariantAxis
+from server.rate_limit import RateLimiter
+from server.services import LessonGenerationService
+
+
+def request(**overrides):
+    fields = {"subject": "Mathematics", "grade_level": "Class 10", "topic": "Quadratics", "subtopics": ["Roots", "Graphs"]}
+    return LessonRequest(**{**fields, **overrides})
+
+
+class Counter:
+    def __init__(self, delay=0.05, error=None):
+        self.calls = 0
+        self.cancelled = False
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return {"calls": self.calls}
+
+
+def test_request_key_ignores_case_whitespace_and_subtopic_order():
+    assert request_key(request()) == request_key(request(topic="  quadratics ", subtopics=["graphs", "roots"]))
+    assert request_key(request()) != request_key(request(difficulty_level="advanced"))
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight("test")
+    call = Counter()
+
+    async def run():
+        return await asyncio.gather(*(flights.run("key", call) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert call.calls == 1
+    assert results == [{"calls": 1}] * 3
+    assert flights.stats() == {"leaders": 1, "joined": 2, "in_flight": 0}
+    assert len(flights) == 0
+
+
+def test_errors_reach_every_waiter():
+    flights = SingleFlight("test")
+    call = Counter(error=RuntimeError("boom"))
+
+    async def run():
+        return await asyncio.gather(flights.run("key", call), flights.run("key", call), return_exceptions=True)
+
+    assert [str(result) for result in asyncio.run(run())] == ["boom", "boom"]
+    assert call.calls == 1
+
+
+def test_cancelled_waiter_leaves_the_call_running_for_the_others():
+    flights = SingleFlight("test")
+    call = Counter()
+
+    async def run():
+        first = asyncio.ensure_future(flights.run("key", call))
+        second = asyncio.ensure_future(flights.run("key", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert isinstance(first, asyncio.CancelledError)
+    assert second == {"calls": 1}
+    assert not call.cancelled
+
+
+def test_call_is_cancelled_when_its_last_waiter_leaves():
+    flights = SingleFlight("test")
+    call = Counter()
+
+    async def run():
+        waiter = asyncio.ensure_future(flights.run("key", call))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert call.cancelled
+    assert "key" not in flights
+
+
+def test_remember_returns_finished_results_to_later_callers():
+    flights = SingleFlight("test", remember=True)
+    call = Counter(delay=0)
+
+    async def run():
+        first = await flights.run("key", call)
+        return first, await flights.run("key", call)
+
+    assert asyncio.run(run()) == ({"calls": 1}, {"calls": 1})
+    assert call.calls == 1
+
+
+def test_coalesced_lessons_are_independent_copies():
+    client = FakeOpenAIClient(latencies={name: LatencyModel(0.05) for name in CANNED_RESPONSES})
+    service = LessonGenerationService("test", rate_limiter=RateLimiter(10 ** 6, 10 ** 9), client=client)
+
+    async def run():
+        lessons = await asyncio.gather(service.generate_lesson(request(), 1), service.generate_lesson(request(topic="QUADRATICS"), 2))
+        await service.aclose()
+        return lessons
+
+    first, second = asyncio.run(run())
+    assert client.calls["ContentCreator"] == 1
+    assert (first.trace.session_id, second.trace.session_id) == (1, 2)
+    first.components[0].metadata["edited"] = True
+    assert "edited" not in second.components[0].metadata
+
+
+def test_partials_of_a_shared_call_reach_every_caller():
+    flights = SingleFlight("test")
+    received = {"leader": [], "joined": []}
+
+    async def call(on_partial):
+        await on_partial("title", "Cells")
+        await asyncio.sleep(0.02)
+        await on_partial("minutes", 30)
+        return {"done": True}
+
+    def collect(name):
+        async def on_partial(key, value):
+            received[name].append(key)
+        return on_partial
+
+    async def run():
+        leader = asyncio.ensure_future(flights.run_streaming("key", call, collect("leader")))
+        await asyncio.sleep(0.01)
+        return await asyncio.gather(leader, flights.run_streaming("key", call, collect("joined")))
+
+    assert asyncio.run(run()) == [{"done": True}, {"done": True}]
+    assert received == {"leader": ["title", "minutes"], "joined": ["title", "minutes"]}
+
+
+class StartRecordingClient(FakeOpenAIClient):
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.started = []
+
+    async def chat_completion(self, model, messages, temperature, max_tokens, **extra):
+        self.started.append((detect_agent(messages), time.monotonic()))
+        return await super().chat_completion(model, messages, temperature, max_tokens, **extra)
+
+    async def stream_chat_completion(self, model, messages, temperature, max_tokens, **extra):
+        self.started.append((detect_agent(messages), time.monotonic()))
+        return await super().stream_chat_completion(model, messages, temperature, max_tokens, **extra)
+
+
+def test_sessions_sharing_a_curriculum_stage_all_start_speculatively():
+    client = StartRecordingClient(latencies={**{name: LatencyModel(0.05, 0.05) for name in CANNED_RESPONSES}, "CurriculumExpert": LatencyModel(0.6, 0.6)})
+    service = LessonGenerationService("test", rate_limiter=RateLimiter(10 ** 6, 10 ** 9), client=client)
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(service.generate_lesson(request(), 1), service.generate_lesson(request(estimated_duration="90 minutes"), 2))
+        await service.aclose()
+        return started
+
+    started = asyncio.run(run())
+    assert (client.calls["CurriculumExpert"], client.calls["ContentCreator"], client.calls["AssessmentAgent"]) == (1, 2, 1)
+    content_starts = [at - started for agent, at in client.started if agent == "ContentCreator"]
+    assert len(content_starts) == 2 and max(content_starts) < 0.5
+
+
+def test_every_variant_starts_speculatively_from_its_shared_curriculum():
+    client = StartRecordingClient(latencies={**{name: LatencyModel(0.05, 0.05) for name in CANNED_RESPONSES}, "CurriculumExpert": LatencyModel(0.6, 0.6)})
+    service = LessonGenerationService("test", rate_limiter=RateLimiter(10 ** 6, 10 ** 9), client=client)
+    axes = [
+        VariantAxis(field="difficulty_level", values=["basic", "intermediate", "advanced"]),
+        VariantAxis(field="estimated_duration", values=["45 minutes", "90 minutes"])
+    ]
+
+    async def run():
+        started = time.monotonic()
+        bundle = await service.generate_variants(request(), axes)
+        await service.aclose()
+        return started, bundle
+
+    started, bundle = asyncio.run(run())
+    assert all(variant.error is None for variant in bundle.variants) and len(bundle.variants) == 6
+    assert (client.calls["CurriculumExpert"], client.calls["ContentCreator"], client.calls["AssessmentAgent"]) == (3, 6, 3)
+    order = [agent for agent, _ in client.started]
+    assert order[:3] == ["CurriculumExpert"] * 3
+    assert sorted(order[3:12]) == ["AssessmentAgent"] * 3 + ["ContentCreator"] * 6
+    assert all(at - started < 0.5 for agent, at in client.started[:12])
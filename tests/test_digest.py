@@ -0,0 +1,55 @@
+import json
+
+from server.digest import DUPLICATE_MARKER, build_review_digest
+from server.rate_limit import estimate_tokens
+
+
+def lesson(paragraph_length=2000):
+    return {
+        "title": "Photosynthesis",
+        "lesson_content": {"explanation": "light " * (paragraph_length // 6), "summary": "Plants  make\n sugar."},
+        "assessments": {"questions": ["What do plants make?"]},
+        "components": [{"type": "explanation", "content": "recompiled copy"}]
+    }
+
+
+def test_small_lesson_is_only_compacted():
+    digest, stats = build_review_digest(lesson(100), token_budget=3000)
+    data = json.loads(digest)
+    assert "components" not in data
+    assert data["lesson_content"]["summary"] == "Plants make sugar."
+    assert "truncated" not in digest
+    assert stats["chars_after"] < stats["chars_before"]
+
+
+def test_derived_fields_are_kept_without_their_sources():
+    data = {"components": [{"type": "quiz"}], "lesson_content": {}}
+    assert "components" in json.loads(build_review_digest(data)[0])
+
+
+def test_repeated_text_becomes_a_back_reference():
+    repeated = "Chlorophyll absorbs red and blue light to drive the reaction."
+    digest, _ = build_review_digest({"a": repeated, "b": [repeated]})
+    assert json.loads(digest) == {"a": repeated, "b": [DUPLICATE_MARKER]}
+
+
+def test_longest_fields_are_truncated_to_fit_the_budget():
+    data = lesson(20000)
+    data["lesson_content"]["examples"] = "leaf " * 300
+    digest, stats = build_review_digest(data, token_budget=500)
+    content = json.loads(digest)["lesson_content"]
+    assert stats["tokens_after"] <= 500
+    assert estimate_tokens(digest) == stats["tokens_after"]
+    assert content["explanation"].startswith("light light")
+    assert "chars truncated]" in content["explanation"]
+    assert content["summary"] == "Plants make sugar."
+
+
+def test_truncation_stops_at_min_field_length():
+    data = {"a": "x" * 5000, "b": "y" * 5000}
+    digest, stats = build_review_digest(data, token_budget=10, min_field_length=200)
+    result = json.loads(digest)
+    assert stats["tokens_after"] > 10
+    for value in result.values():
+        assert value.startswith("x" * 200) or value.startswith("y" * 200)
+        assert "chars truncated]" in value
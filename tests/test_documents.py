@@ -0,0 +1,57 @@
+import asyncio
+
+from server.documents import PDFExtractor, chunk_pages, extract_pdf_pages
+
+
+def write_pdf(path, page_texts):
+    """Write a minimal PDF with one line of Helvetica text per page."""
+    page_ids = [4 + 2 * index for index in range(len(page_texts))]
+    objects = {
+        1: "<< /Type /Catalog /Pages 2 0 R >>",
+        2: f"<< /Type /Pages /Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] /Count {len(page_ids)} >>",
+        3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    for page_id, text in zip(page_ids, page_texts):
+        content = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects[page_id] = f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        objects[page_id + 1] = f"<< /Length {len(content)} >>\nstream\n{content}\nendstream"
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for number in sorted(objects):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n{objects[number]}\nendobj\n".encode("latin-1")
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    body += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    path.write_bytes(body)
+    return str(path)
+
+
+PAGES = [f"Photosynthesis page {number}" for number in range(1, 6)]
+
+
+def test_extracts_a_window_of_pages(tmp_path):
+    path = write_pdf(tmp_path / "book.pdf", PAGES)
+    assert [text.strip() for text in extract_pdf_pages(path, 1, 3, 20000)] == PAGES[1:3]
+    assert [text.strip() for text in extract_pdf_pages(path, 4, 10, 11)] == ["Photosynthe"]
+
+
+def test_extractor_yields_every_page_in_order_with_progress(tmp_path):
+    path = write_pdf(tmp_path / "book.pdf", PAGES)
+    extractor = PDFExtractor(max_workers=2, pages_per_task=2)
+    progress = []
+
+    async def on_progress(done, total):
+        progress.append((done, total))
+
+    async def run():
+        return [(number, text.strip()) async for number, text in extractor.iter_pages(path, on_progress)]
+
+    try:
+        pages = asyncio.run(run())
+    finally:
+        extractor.close()
+    assert pages == list(enumerate(PAGES, start=1))
+    assert progress == [(number, 5) for number in range(1, 6)]
+    assert [chunk["page"] for chunk in chunk_pages(pages, chunk_chars=20, overlap_chars=5)] == [1, 1, 2, 2, 3, 3, 4, 4, 5, 5]
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import pytest
+
+from server.fake_llm import CANNED_RESPONSES, FakeOpenAIClient, LatencyModel
+from server.jobs import JobQueue, _run_job
+from server.models import LessonRequest
+from server.rate_limit import RateLimiter
+from server.services import LessonGenerationService
+
+
+def request(topic="Quadratics"):
+    return LessonRequest(subject="Mathematics", grade_level="Class 10", topic=topic, subtopics=["Roots"])
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0.2, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def service(latency=0.05):
+    client = FakeOpenAIClient(latencies={name: LatencyModel(latency) for name in CANNED_RESPONSES})
+    return LessonGenerationService("test", rate_limiter=RateLimiter(10 ** 6, 10 ** 9), client=client)
+
+
+def test_claims_by_priority_then_age(queue):
+    first = queue.enqueue(request("a"))
+    urgent = queue.enqueue(request("b"), priority=5)
+    assert queue.claim("w1").job_id == urgent
+    assert queue.claim("w1").job_id == first
+    assert queue.claim("w1") is None
+
+
+def test_expired_lease_is_reclaimed_and_old_worker_is_fenced_off(queue):
+    job_id = queue.enqueue(request())
+    stale = queue.claim("w1")
+    assert queue.claim("w2") is None
+
+    time.sleep(0.25)
+    fresh = queue.claim("w2")
+    assert (fresh.job_id, fresh.attempts) == (job_id, 2)
+
+    assert not queue.renew(stale)
+    assert not queue.fail(stale, "boom")
+    lesson = asyncio.run(service().generate_lesson(fresh.request, 1))
+    assert not queue.complete(stale, lesson)
+    assert queue.status(job_id).status == "running"
+
+    assert queue.complete(fresh, lesson)
+    assert queue.status(job_id).status == "completed"
+    assert queue.result(job_id).title == lesson.title
+
+
+def test_job_fails_after_max_attempts(queue):
+    job_id = queue.enqueue(request())
+    assert queue.fail(queue.claim("w1"), "first")
+    assert queue.status(job_id).status == "queued"
+    queue.claim("w1")
+    time.sleep(0.25)
+    # The lease ran out on the last attempt, so the job is failed instead of redelivered
+    assert queue.claim("w2") is None
+    assert queue.status(job_id).status == "failed"
+
+
+def test_checkpoints_survive_redelivery_and_are_dropped_on_completion(queue):
+    job_id = queue.enqueue(request())
+    job = queue.claim("w1")
+    queue.save_checkpoint(job_id, "curriculum", {"learning_objectives": ["x"]})
+    assert queue.load_checkpoints(job_id) == {"curriculum": {"learning_objectives": ["x"]}}
+    assert queue.status(job_id).completed_stages == ["curriculum"]
+    lesson = asyncio.run(service().generate_lesson(job.request, 1))
+    queue.complete(job, lesson)
+    assert queue.load_checkpoints(job_id) == {}
+
+
+def test_lost_lease_cancels_the_generation(queue):
+    job_id = queue.enqueue(request())
+    job = queue.claim("w1")
+
+    async def run():
+        generating = service(latency=0.5)
+        running = asyncio.ensure_future(_run_job(queue, generating, job))
+        await asyncio.sleep(0.05)
+        # Another worker takes the job over
+        queue._execute("UPDATE jobs SET worker = 'w2' WHERE id = ?", (job_id,))
+        await asyncio.wait_for(running, 2.0)
+        await generating.aclose()
+        return generating
+
+    generating = asyncio.run(run())
+    assert not generating.sessions
+    status = queue.status(job_id)
+    assert (status.status, status.error) == ("running", None)
+    assert queue.result(job_id) is None
@@ -0,0 +1,35 @@
+import io
+
+import pytest
+from pydantic import ValidationError
+
+from server.lesson_ir import ComponentIR, LessonIR, MetadataIR, decode_lesson, encode_lesson, read_lessons, write_lessons
+
+
+def lesson(index=1, quality_score=8.5):
+    return LessonIR(
+        index,
+        f"Lesson {index}",
+        MetadataIR("Mathematics", "Class 10", "Quadratics", ["Roots"], learning_objectives=["Solve by factoring"]),
+        [ComponentIR("Introduction", "Welcome", 1, {"duration": "10 minutes"}), ComponentIR("Quiz", "Q1", 2)],
+        quality_score=quality_score,
+        feedback=["Add an example"]
+    )
+
+
+def test_binary_round_trip_is_lossless():
+    original = lesson().to_response()
+    assert decode_lesson(encode_lesson(LessonIR.from_response(original))).to_response() == original
+
+
+def test_lesson_stream_round_trip():
+    stream = io.BytesIO()
+    assert write_lessons((lesson(index) for index in range(3)), stream) == 3
+    stream.seek(0)
+    assert [decoded.id for decoded in read_lessons(stream, chunk_size=7)] == [0, 1, 2]
+
+
+def test_agent_derived_fields_are_validated():
+    assert lesson(quality_score="7.5").to_response().quality_score == 7.5
+    with pytest.raises(ValidationError):
+        lesson(quality_score="N/A").to_response()
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from server.agents import QualityReviewAgent
+from server.client import ChatCompletion
+from server.parsing import extract_json_text, parse_structured, repair_json
+from server.rate_limit import RateLimiter
+from server.schemas import CurriculumAnalysisOutput, QualityReviewOutput
+
+SCORES = {
+    "curriculum_alignment": 8,
+    "content_quality": 8,
+    "engagement_level": 7,
+    "assessment_effectiveness": 9,
+    "pedagogical_soundness": 8
+}
+
+
+class ScriptedClient:
+    """Returns the given responses in order and records the messages it was sent."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def chat_completion(self, model, messages, temperature, max_tokens, **extra):
+        self.requests.append(messages)
+        return ChatCompletion(self.responses.pop(0), usage={"prompt_tokens": 10, "completion_tokens": 10})
+
+    async def aclose(self):
+        pass
+
+
+def review_agent(client):
+    return QualityReviewAgent("test", client=client, rate_limiter=RateLimiter(10 ** 6, 10 ** 9))
+
+
+def test_extracts_json_from_fences_and_prose():
+    assert extract_json_text('Here you go:\n```json\n{"a": 1}\n```\nThanks') == '{"a": 1}'
+    assert extract_json_text('Sure! {"a": {"b": 2}} Hope it helps.') == '{"a": {"b": 2}}'
+
+
+def test_repairs_trailing_commas_and_truncation():
+    assert repair_json('{"a": [1, 2,], "b": 3,}') == {"a": [1, 2], "b": 3}
+    assert repair_json('{"a": "complete", "b": "cut off mid-str') == {"a": "complete", "b": "cut off mid-str"}
+    assert repair_json('{"a": [1, 2], "b": {"c": tr') == {"a": [1, 2]}
+    assert repair_json("not json at all") is None
+
+
+def test_parse_status_and_invalid_fields():
+    clean = parse_structured(json.dumps({"learning_objectives": ["x"]}), CurriculumAnalysisOutput)
+    assert (clean.status, clean.invalid_fields) == ("clean", [])
+
+    repaired = parse_structured('```json\n{"learning_objectives": ["x"], "prerequisites": ["y",\n```', CurriculumAnalysisOutput)
+    assert repaired.status == "repaired"
+    assert repaired.data == {"learning_objectives": ["x"], "prerequisites": ["y"]}
+
+    missing = parse_structured('{"overall_score": "high"}', QualityReviewOutput)
+    assert missing.invalid_fields == ["quality_scores", "overall_score"]
+
+    failed = parse_structured("I cannot help with that.", CurriculumAnalysisOutput)
+    assert failed.status == "failed"
+    assert "learning_objectives" in failed.invalid_fields
+
+
+def test_reask_fills_only_the_invalid_fields():
+    client = ScriptedClient(json.dumps({"quality_scores": SCORES}))
+    agent = review_agent(client)
+    messages = [{"role": "user", "content": "Review this lesson"}]
+    response = '{"overall_score": "8", "strengths": ["clear"], "quality_scores": {"content_quality": 9}}'
+
+    result = asyncio.run(agent._parse_response(response, QualityReviewOutput, messages, False, fallback={}))
+
+    assert result["overall_score"] == 8.0
+    assert result["strengths"] == ["clear"]
+    assert result["quality_scores"] == {key: float(value) for key, value in SCORES.items()}
+    reask = client.requests[0][-1]["content"]
+    assert "quality_scores" in reask and "overall_score" not in reask.split("JSON schema")[0]
+
+
+def test_fields_still_invalid_after_reask_use_fallback():
+    client = ScriptedClient('{"quality_scores": "n/a"}')
+    agent = review_agent(client)
+    fallback = {"quality_scores": {key: 7 for key in SCORES}, "overall_score": 7.0}
+
+    result = asyncio.run(agent._parse_response('{"overall_score": 6}', QualityReviewOutput, [], False, fallback=fallback))
+
+    assert result["overall_score"] == 6.0
+    assert result["quality_scores"] == {key: 7.0 for key in SCORES}
+    assert len(client.requests) == 1
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from server.client import APIError
+from server.fake_llm import CANNED_RESPONSES, FakeOpenAIClient, LatencyModel, detect_agent
+from server.models import LessonRequest
+from server.pipeline import Stage, StageGraph
+from server.rate_limit import RateLimiter
+from server.services import LessonGenerationService
+
+
+def run(graph, reporter=None):
+    return asyncio.run(graph.run(reporter))
+
+
+def recorder(log, name, delay=0.0, result=None):
+    async def stage(results):
+        log.append(("start", name, sorted(results)))
+        await asyncio.sleep(delay)
+        log.append(("end", name))
+        return result if result is not None else name
+    return stage
+
+
+def test_stages_start_after_their_dependencies_with_their_results():
+    log = []
+    graph = StageGraph([
+        Stage("compile", recorder(log, "compile"), depends_on=["content", "assessment"]),
+        Stage("content", recorder(log, "content"), depends_on=["curriculum"]),
+        Stage("assessment", recorder(log, "assessment"), depends_on=["curriculum"]),
+        Stage("curriculum", recorder(log, "curriculum")),
+    ])
+    results = run(graph)
+    assert results == {name: name for name in ("curriculum", "content", "assessment", "compile")}
+    starts = {entry[1]: entry[2] for entry in log if entry[0] == "start"}
+    assert starts["curriculum"] == []
+    assert starts["content"] == starts["assessment"] == ["curriculum"]
+    assert starts["compile"] == ["assessment", "content", "curriculum"]
+
+
+def test_independent_stages_run_concurrently():
+    log = []
+    graph = StageGraph([
+        Stage("curriculum", recorder(log, "curriculum")),
+        Stage("content", recorder(log, "content", delay=0.05), depends_on=["curriculum"]),
+        Stage("assessment", recorder(log, "assessment", delay=0.05), depends_on=["curriculum"]),
+    ])
+    run(graph)
+    order = [(kind, name) for kind, name, *_ in log]
+    assert order.index(("start", "assessment")) < order.index(("end", "content"))
+    assert order.index(("start", "content")) < order.index(("end", "assessment"))
+    (content_start, content_seconds), (assessment_start, _) = graph.timings["content"], graph.timings["assessment"]
+    assert abs(content_start - assessment_start) < content_seconds
+
+
+def test_progress_only_increases_by_completed_weights():
+    reports = []
+
+    async def reporter(progress, agent_name, message):
+        reports.append((progress, message))
+
+    graph = StageGraph([
+        Stage("a", recorder([], "a"), weight=10, start_message="a started", end_message="a done"),
+        Stage("b", recorder([], "b", delay=0.02), depends_on=["a"], weight=30, end_message="b done"),
+        Stage("c", recorder([], "c"), depends_on=["a"], weight=20, end_message="c done"),
+    ], base_progress=5)
+    run(graph, reporter)
+    assert reports == [(5, "a started"), (15, "a done"), (35, "c done"), (65, "b done")]
+    assert graph.progress == 65
+
+
+def test_failure_cancels_running_stages_and_reraises():
+    cancelled = []
+
+    async def slow(results):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    async def failing(results):
+        await asyncio.sleep(0.01)
+        raise ValueError("agent failed")
+
+    graph = StageGraph([
+        Stage("slow", slow),
+        Stage("failing", failing),
+        Stage("after", recorder([], "after"), depends_on=["failing"]),
+    ])
+    with pytest.raises(ValueError, match="agent failed"):
+        run(graph)
+    assert cancelled == ["slow"]
+    assert "after" not in graph.timings
+
+
+def test_invalid_graphs_are_rejected():
+    noop = recorder([], "noop")
+    with pytest.raises(ValueError, match="unknown stage"):
+        StageGraph([Stage("a", noop, depends_on=["missing"])])
+    with pytest.raises(ValueError, match="Cycle"):
+        StageGraph([Stage("a", noop, depends_on=["b"]), Stage("b", noop, depends_on=["a"])])
+    with pytest.raises(ValueError, match="Duplicate"):
+        StageGraph([Stage("a", noop), Stage("a", noop)])
+
+
+class FailingCurriculumClient(FakeOpenAIClient):
+    async def stream_chat_completion(self, model, messages, temperature, max_tokens, **extra):
+        if detect_agent(messages) == "CurriculumExpert":
+            self.calls["CurriculumExpert"] = self.calls.get("CurriculumExpert", 0) + 1
+            await asyncio.sleep(0.001)
+            raise APIError("HTTP 400: invalid request", 400)
+        return await super().stream_chat_completion(model, messages, temperature, max_tokens, **extra)
+
+
+def test_failed_curriculum_surfaces_its_error_not_a_cancellation():
+    client = FailingCurriculumClient(latencies={name: LatencyModel(0.01) for name in CANNED_RESPONSES})
+    service = LessonGenerationService("test", rate_limiter=RateLimiter(10 ** 6, 10 ** 9), client=client)
+    lesson_request = LessonRequest(subject="Mathematics", grade_level="Class 10", topic="Quadratics", subtopics=["Roots"])
+
+    async def generate(session_id):
+        with pytest.raises(Exception, match="HTTP 400") as failure:
+            await service.generate_lesson(lesson_request.model_copy(update={"topic": f"Quadratics {session_id}"}), session_id)
+        return failure.value
+
+    async def run_all():
+        return [await generate(session_id) for session_id in range(1, 41)]
+
+    errors = asyncio.run(run_all())
+    assert not any(isinstance(error, asyncio.CancelledError) for error in errors)
+    assert client.calls["CurriculumExpert"] == 40
@@ -0,0 +1,51 @@
+import asyncio
+
+from server.models import GenerationProgress
+from server.progress import ProgressBus
+
+
+def event(status="in_progress", progress=50, session_id=1):
+    return GenerationProgress(session_id=session_id, progress=progress, current_agent="ContentCreator", status=status)
+
+
+def test_aclose_waits_for_event_being_delivered():
+    delivered = []
+
+    async def slow_sink(progress):
+        await asyncio.sleep(0.05)
+        delivered.append(progress.status)
+
+    async def run():
+        bus = ProgressBus()
+        bus.publish(event("completed", 100), slow_sink)
+        # Let the dispatcher take the event, so nothing is queued while the sink is still running
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await bus.aclose()
+        return bus.stats()
+
+    stats = asyncio.run(run())
+    assert delivered == ["completed"]
+    assert stats["delivered"] == 1
+
+
+def test_slow_sink_sees_latest_progress_and_every_terminal_event():
+    delivered = []
+
+    async def slow_sink(progress):
+        await asyncio.sleep(0.01)
+        delivered.append((progress.progress, progress.status))
+
+    async def run():
+        bus = ProgressBus()
+        for value in range(10, 90, 10):
+            bus.publish(event(progress=value), slow_sink)
+        bus.publish(event("completed", 100), slow_sink)
+        bus.publish(event("reviewed", 100), slow_sink)
+        await bus.flush()
+        await bus.aclose()
+        return bus.stats()
+
+    stats = asyncio.run(run())
+    assert delivered == [(100, "completed"), (100, "reviewed")]
+    assert stats["coalesced"] == 8
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import pytest
+
+from server.rate_limit import RateLimiter, TokenBucket, parse_reset_duration
+
+
+def test_parse_reset_duration():
+    assert parse_reset_duration("6m0s") == 360.0
+    assert parse_reset_duration("1.5s") == 1.5
+    assert parse_reset_duration("20ms") == pytest.approx(0.02)
+    assert parse_reset_duration("2") == 2.0
+    assert parse_reset_duration("soon") is None
+    assert parse_reset_duration(None) is None
+
+
+def test_bucket_refills_at_limit_per_minute():
+    bucket = TokenBucket(60)
+    start = bucket.updated_at
+    bucket.tokens = 0
+    assert bucket.time_until(1, now=start) == pytest.approx(1.0)
+    assert bucket.time_until(1, now=start + 0.5) == pytest.approx(0.5)
+    assert bucket.time_until(1, now=start + 1.0) == 0.0
+
+
+def test_bucket_refill_is_capped_at_limit():
+    bucket = TokenBucket(60)
+    bucket.time_until(1, now=bucket.updated_at + 3600)
+    assert bucket.tokens == 60
+
+
+def test_oversized_request_waits_for_full_bucket_then_goes_negative():
+    bucket = TokenBucket(60)
+    assert bucket.time_until(100, now=bucket.updated_at) == 0.0
+    bucket.consume(100)
+    assert bucket.tokens < 0
+
+
+def test_rate_limit_halves_scale_and_pauses():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000)
+    limiter.on_rate_limited({"Retry-After": "2"})
+    assert limiter.scale == 0.5
+    assert limiter.requests.rate == pytest.approx(0.5)
+    assert limiter.paused_until - time.monotonic() == pytest.approx(2.0, abs=0.1)
+    limiter.on_success()
+    assert limiter.scale == pytest.approx(0.55)
+
+
+def test_headers_sync_buckets():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000)
+    limiter.update_from_headers({"x-ratelimit-limit-tokens": "9000", "x-ratelimit-remaining-tokens": "10"})
+    assert limiter.tokens.limit == 9000
+    assert limiter.tokens.tokens == 10
+
+
+def test_acquire_waits_for_refill():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60000)
+    limiter.requests.tokens = 0
+
+    async def acquire():
+        started = time.monotonic()
+        await limiter.acquire(10)
+        return time.monotonic() - started
+
+    # 600 requests per minute refill one slot every 0.1s
+    waited = asyncio.run(acquire())
+    assert 0.05 <= waited < 0.5
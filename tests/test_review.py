@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from server.config import LessonServiceConfig
+from server.fake_llm import CANNED_RESPONSES, FakeOpenAIClient, LatencyModel
+from server.models import LessonRequest
+from server.rate_limit import RateLimiter
+from server.review import ReviewSampler
+from server.services import LessonGenerationService
+
+
+def request(topic="Quadratics"):
+    return LessonRequest(subject="Mathematics", grade_level="Class 10", topic=topic, subtopics=["Roots"])
+
+
+def background_service(sampler=None):
+    latencies = {name: LatencyModel(0.02, 0.02) for name in CANNED_RESPONSES}
+    latencies["QualityReviewAgent"] = LatencyModel(0.3, 0.3)
+    client = FakeOpenAIClient(latencies=latencies)
+    updates = []
+
+    async def on_review(update):
+        updates.append(update)
+
+    config = LessonServiceConfig(review_mode="background", review_sampler=sampler, review_callback=on_review)
+    return LessonGenerationService("test", rate_limiter=RateLimiter(10 ** 6, 10 ** 9), client=client, config=config), client, updates
+
+
+def test_background_review_arrives_after_the_lesson_is_returned():
+    lessons, client, updates = background_service()
+    events = []
+
+    async def on_progress(progress):
+        events.append(progress)
+
+    async def run():
+        lesson = await lessons.generate_lesson(request(), 4, on_progress)
+        updates_at_return = list(updates)
+        await lessons.aclose()
+        return lesson, updates_at_return
+
+    lesson, updates_at_return = asyncio.run(run())
+    assert lesson.quality_score is None and lesson.components
+    assert updates_at_return == []
+    assert client.calls["QualityReviewAgent"] == 1
+    assert [(update.session_id, update.status, update.quality_score) for update in updates] == [(4, "reviewed", 8.4)]
+    assert updates[0].feedback == CANNED_RESPONSES["QualityReviewAgent"]["recommendations"]
+    reviewed = [event for event in events if event.status == "reviewed"]
+    assert [(event.session_id, event.quality_score) for event in reviewed] == [(4, 8.4)]
+
+
+def test_sampled_out_lessons_are_never_reviewed():
+    lessons, client, updates = background_service(ReviewSampler(rate=0.0))
+
+    async def run():
+        lesson = await lessons.generate_lesson(request(), 1)
+        await lessons.aclose()
+        return lesson
+
+    assert asyncio.run(run()).components
+    assert "QualityReviewAgent" not in client.calls
+    assert updates == []
+
+
+def test_sampler_reviews_a_stable_fraction_of_requests():
+    sampler = ReviewSampler(rate=0.5)
+    topics = [f"Topic {number}" for number in range(400)]
+    decisions = [sampler.should_review(request(topic)) for topic in topics]
+    assert decisions == [sampler.should_review(request(topic)) for topic in topics]
+    assert 0.4 < sum(decisions) / len(decisions) < 0.6
+    assert sampler.should_review(request("Topic 1")) == sampler.should_review(request(" topic 1 "))
+    assert all(ReviewSampler(rate=1.0).should_review(request(topic)) for topic in topics[:20])
+    with pytest.raises(ValueError):
+        ReviewSampler(rate=1.5)
@@ -0,0 +1,56 @@
+import asyncio
+import copy
+
+from server.config import LessonServiceConfig
+from server.fake_llm import CANNED_RESPONSES, FakeOpenAIClient, LatencyModel
+from server.models import LessonRequest
+from server.rate_limit import RateLimiter
+from server.routing import ModelRouter
+from server.services import LessonGenerationService
+
+
+def review(overall, **scores):
+    return {"overall_score": overall, "quality_scores": {"curriculum_alignment": 9, "content_quality": 9, "engagement_level": 9, "assessment_effectiveness": 9, "pedagogical_soundness": 9, **scores}}
+
+
+def test_only_stages_reviewed_below_the_threshold_fail_the_gate():
+    router = ModelRouter(threshold=7.0)
+    assert router.failing_stages(review(8.0, content_quality=5)) == []
+    assert router.failing_stages(review(6.0, engagement_level=4)) == ["content"]
+    assert router.failing_stages(review(6.0, curriculum_alignment=6, assessment_effectiveness=2)) == ["curriculum", "assessment"]
+    assert router.failing_stages(review(6.0)) == ["curriculum", "content", "assessment"]
+
+
+def test_outcomes_are_counted_per_agent_and_model():
+    router = ModelRouter(tiers={"ContentCreator": ["small", "large"]})
+    router.record("ContentCreator", "small", passed=True)
+    router.record("ContentCreator", "small", passed=False)
+    router.record("ContentCreator", "small", passed=False, escalating=False)
+    router.record("ContentCreator", "large", passed=False)
+    assert router.next_model("ContentCreator", "small") == "large"
+    assert router.next_model("ContentCreator", "large") is None
+    stats = router.stats()["ContentCreator"]
+    assert stats["small"] == {"passed": 1, "escalated": 1, "failed": 1, "success_rate": 1 / 3}
+    assert stats["large"]["failed"] == 1
+
+
+def test_failing_content_is_rerun_on_the_larger_model_only():
+    responses = copy.deepcopy(CANNED_RESPONSES)
+    responses["QualityReviewAgent"].update(review(5.0, content_quality=4))
+    client = FakeOpenAIClient(latencies={name: LatencyModel(0.02) for name in CANNED_RESPONSES}, responses=responses)
+    router = ModelRouter(threshold=7.0)
+    lessons = LessonGenerationService("test", rate_limiter=RateLimiter(10 ** 6, 10 ** 9), client=client,
+                                      config=LessonServiceConfig(model_router=router))
+
+    async def run():
+        lesson = await lessons.generate_lesson(LessonRequest(subject="Mathematics", grade_level="Class 10", topic="Quadratics", subtopics=["Roots"]), 1)
+        await lessons.aclose()
+        return lesson
+
+    lesson = asyncio.run(run())
+    assert (client.calls["CurriculumExpert"], client.calls["ContentCreator"], client.calls["AssessmentAgent"], client.calls["QualityReviewAgent"]) == (1, 2, 1, 2)
+    assert lesson.trace.escalated_stages == ["content"]
+    assert [call.model for call in lesson.trace.calls if call.agent == "ContentCreator"] == ["gpt-4o-mini", "gpt-4"]
+    stats = router.stats()["ContentCreator"]
+    assert (stats["gpt-4o-mini"]["escalated"], stats["gpt-4"]["failed"]) == (1, 1)
+    assert router.stats()["AssessmentAgent"]["gpt-4o-mini"]["passed"] == 1
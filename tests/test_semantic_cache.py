@@ -0,0 +1,55 @@
+import asyncio
+
+from server.config import LessonServiceConfig
+from server.fake_llm import CANNED_RESPONSES, FakeOpenAIClient, LatencyModel
+from server.models import LessonRequest
+from server.rate_limit import RateLimiter
+from server.semantic_cache import SemanticCache
+from server.services import LessonGenerationService
+
+
+def request(**overrides):
+    fields = {"subject": "Mathematics", "grade_level": "Class 10", "topic": "Quadratic Equations", "subtopics": ["Roots", "Discriminant"]}
+    return LessonRequest(**{**fields, **overrides})
+
+
+def test_similar_request_hits_and_exact_fields_must_match():
+    cache = SemanticCache("lesson")
+    cache.store(request(), "stored", cost_seconds=2.0)
+    assert cache.lookup(request(topic="quadratic equations", subtopics=["roots", "the discriminant"])).value == "stored"
+    assert cache.lookup(request(topic="Trigonometry", subtopics=["Heights"])) is None
+    assert cache.lookup(request(difficulty_level="advanced")) is None
+    assert cache.stats()["seconds_saved"] == 2.0
+
+
+def test_evicting_the_last_entry_of_a_partition_drops_the_partition():
+    cache = SemanticCache("lesson", max_entries=3)
+    for index in range(50):
+        cache.store(request(subject=f"Subject {index}"), index)
+    assert len(cache) == 3
+    assert len(cache._partition_ids) == 3
+    assert cache.stats()["evictions"] == 47
+    assert cache.lookup(request(subject="Subject 49")).value == 49
+    assert cache.lookup(request(subject="Subject 0")) is None
+
+
+def test_reused_lesson_is_relabelled_for_the_new_request():
+    client = FakeOpenAIClient(latencies={name: LatencyModel(0.01) for name in CANNED_RESPONSES})
+    service = LessonGenerationService(
+        "test", rate_limiter=RateLimiter(10 ** 6, 10 ** 9), client=client,
+        config=LessonServiceConfig(lesson_cache=SemanticCache("lesson"))
+    )
+
+    async def run():
+        first = await service.generate_lesson(request(), 1)
+        second = await service.generate_lesson(request(topic="quadratic equations: roots"), 2)
+        await service.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert client.calls["ContentCreator"] == 1
+    assert second.title == "quadratic equations: roots - Mathematics Lesson"
+    assert second.metadata.topic == "quadratic equations: roots"
+    assert second.metadata.learning_objectives == first.metadata.learning_objectives
+    assert (second.trace.session_id, second.trace.semantic_cache_hit, first.trace.semantic_cache_hit) == (2, True, False)
+    assert second.created_at > first.created_at
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from server.fake_llm import CANNED_RESPONSES, FakeOpenAIClient, LatencyModel
+from server.models import LessonRequest
+from server.rate_limit import RateLimiter
+from server.services import LessonGenerationService
+from server.sessions import GenerationCancelledError
+
+
+def request(topic="Quadratics"):
+    return LessonRequest(subject="Mathematics", grade_level="Class 10", topic=topic, subtopics=["Roots"])
+
+
+def service(latencies):
+    client = FakeOpenAIClient(latencies={name: LatencyModel(latencies.get(name, 0.02), latencies.get(name, 0.02)) for name in CANNED_RESPONSES})
+    return LessonGenerationService("test", rate_limiter=RateLimiter(10 ** 6, 10 ** 9), client=client), client
+
+
+def test_concurrent_sessions_have_their_own_progress_streams():
+    lessons, _ = service({})
+    events = {1: [], 2: []}
+
+    def sink(session_id):
+        async def on_progress(progress):
+            events[session_id].append((progress.session_id, progress.status))
+        return on_progress
+
+    async def run():
+        result = await asyncio.gather(
+            lessons.generate_lesson(request("Quadratics"), 1, sink(1)),
+            lessons.generate_lesson(request("Polynomials"), 2, sink(2))
+        )
+        await lessons.aclose()
+        return result
+
+    first, second = asyncio.run(run())
+    assert (first.trace.session_id, second.trace.session_id) == (1, 2)
+    assert "Quadratics" in first.title and "Polynomials" in second.title
+    for session_id, session_events in events.items():
+        assert {event_session for event_session, _ in session_events} == {session_id}
+        assert session_events[-1][1] == "completed"
+    assert lessons.sessions == {}
+
+
+def test_cancelled_session_stops_before_the_remaining_agents():
+    lessons, client = service({"ContentCreator": 2.0})
+
+    async def run():
+        generation = asyncio.ensure_future(lessons.generate_lesson(request(), 7))
+        await asyncio.sleep(0.1)
+        assert lessons.cancel_session(7, "teacher left")
+        try:
+            return await generation
+        finally:
+            await lessons.aclose()
+
+    with pytest.raises(GenerationCancelledError, match="teacher left"):
+        asyncio.run(run())
+    assert "QualityReviewAgent" not in client.calls
+    assert not lessons.cancel_session(7)
+
+
+def test_session_past_its_timeout_is_cancelled():
+    lessons, _ = service({"AssessmentAgent": 2.0})
+
+    async def run():
+        try:
+            return await lessons.generate_lesson(request(), 3, timeout=0.2)
+        finally:
+            await lessons.aclose()
+
+    with pytest.raises(GenerationCancelledError) as cancelled:
+        asyncio.run(run())
+    assert (cancelled.value.session_id, cancelled.value.reason) == (3, "deadline exceeded")
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from server.agents import CurriculumExpertAgent
+from server.client import APIError, ChatCompletionStream
+from server.fake_llm import FakeOpenAIClient, LatencyModel
+from server.rate_limit import RateLimiter
+from server.resilience import RetryPolicy, StreamInterruptedError
+from server.streaming import IncrementalJSONParser
+
+DOCUMENT = '```json\n{"title": "Fractions, \\"parts\\" {of} a whole", "objectives": ["a", {"b": [1, 2]}], "minutes": 45, "done": true}\n```'
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalJSONParser()
+    emitted = []
+    for start in range(0, len(text), size):
+        emitted.extend(parser.feed(text[start:start + size]))
+    return parser, emitted
+
+
+def test_members_are_emitted_when_complete():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"title": "Fractions", "minutes": 4') == [("title", "Fractions")]
+    assert parser.feed('5, "tags": ["a"') == [("minutes", 45)]
+    assert parser.feed(']}') == [("tags", ["a"])]
+    assert parser.done
+
+
+def test_any_chunking_yields_the_same_members():
+    expected = json.loads(DOCUMENT.split("\n")[1])
+    for size in (1, 2, 7, len(DOCUMENT)):
+        parser, emitted = feed_in_chunks(DOCUMENT, size)
+        assert dict(emitted) == expected
+        assert [key for key, _ in emitted] == list(expected)
+        assert parser.completed == expected
+
+
+def test_text_after_the_object_is_ignored():
+    parser = IncrementalJSONParser()
+    parser.feed('{"a": 1}')
+    assert parser.feed(', "b": 2}') == []
+    assert parser.completed == {"a": 1}
+
+
+def test_invalid_member_is_reported_as_none():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"a": tru, "b": 2}') == [("a", None), ("b", 2)]
+
+
+def sse_response(events):
+    body = "".join(f"data: {event}\n\n" for event in events).encode("utf-8")
+    return httpx.Response(200, content=body, headers={"x-ratelimit-remaining-tokens": "100"})
+
+
+def collect(stream):
+    async def run():
+        return [delta async for delta in stream]
+    return asyncio.run(run())
+
+
+def test_sse_stream_yields_content_deltas_until_done():
+    chunks = [
+        json.dumps({"choices": [{"delta": {"role": "assistant"}}]}),
+        json.dumps({"choices": [{"delta": {"content": "{\"a\": "}}]}),
+        json.dumps({"choices": [{"delta": {"content": "1}"}}]}),
+        "[DONE]",
+        json.dumps({"choices": [{"delta": {"content": "ignored"}}]})
+    ]
+    stream = ChatCompletionStream(sse_response(chunks))
+    assert collect(stream) == ['{"a": ', "1}"]
+    assert stream.headers["x-ratelimit-remaining-tokens"] == "100"
+
+
+def test_sse_stream_feeds_the_incremental_parser():
+    text = '{"title": "Cells", "minutes": 30}'
+    chunks = [json.dumps({"choices": [{"delta": {"content": text[i:i + 5]}}]}) for i in range(0, len(text), 5)] + ["[DONE]"]
+    parser = IncrementalJSONParser()
+    emitted = [member for delta in collect(ChatCompletionStream(sse_response(chunks))) for member in parser.feed(delta)]
+    assert emitted == [("title", "Cells"), ("minutes", 30)]
+
+
+class ScriptedStream:
+    def __init__(self, tokens, error=None):
+        self.headers = {}
+        self._tokens = tokens
+        self._error = error
+
+    async def __aiter__(self):
+        for token in self._tokens:
+            await asyncio.sleep(0)
+            yield token
+        if self._error is not None:
+            raise self._error
+
+    async def aclose(self):
+        pass
+
+
+class ScriptedStreamClient:
+    def __init__(self, *streams):
+        self.streams = list(streams)
+
+    async def stream_chat_completion(self, **kwargs):
+        return self.streams.pop(0)
+
+
+def streaming_agent(client, policy=None):
+    return CurriculumExpertAgent("test", client=client, rate_limiter=RateLimiter(10 ** 6, 10 ** 9),
+                                 retry_policy=policy or RetryPolicy(base_delay=0.01))
+
+
+def stream_members(agent):
+    members = []
+
+    async def on_partial(key, value):
+        members.append((key, value))
+
+    async def run():
+        return await agent._call_openai([{"role": "user", "content": "Analyze"}], on_partial=on_partial)
+    return asyncio.run(run()), members
+
+
+def test_stream_interrupted_mid_body_restarts_without_repeating_partials():
+    text = '{"title": "Cells", "minutes": 30}'
+    interrupted = ScriptedStream([text[:12], text[12:20]], error=APIError("Stream interrupted: reset"))
+    agent = streaming_agent(ScriptedStreamClient(interrupted, ScriptedStream([text[:5], text[5:]])))
+    response, members = stream_members(agent)
+    assert response == text
+    assert members == [("title", "Cells"), ("minutes", 30)]
+
+
+def test_restarted_stream_that_diverges_fails_with_a_typed_error():
+    interrupted = ScriptedStream(['{"title": "Cells", '], error=APIError("Stream interrupted: reset"))
+    agent = streaming_agent(ScriptedStreamClient(interrupted, ScriptedStream(['{"title": "Atoms", "minutes": 30}'])))
+    with pytest.raises(StreamInterruptedError):
+        stream_members(agent)
+
+
+def test_slow_stream_gives_up_at_the_deadline():
+    client = FakeOpenAIClient(latencies={"CurriculumExpert": LatencyModel(3.0)})
+    agent = streaming_agent(client, RetryPolicy(attempt_timeout=0.3, deadline=0.5, base_delay=0.05))
+    started = time.monotonic()
+    with pytest.raises(Exception, match="AI service error"):
+        stream_members(agent)
+    assert time.monotonic() - started < 0.8